@@ -1,14 +1,27 @@
-import openpyxl
-from openpyxl.drawing.image import Image as XLImage
-import customtkinter as ctk
-from tkinter import filedialog, messagebox
+import time
+STARTED = time.perf_counter()
+
 import os
-import winsound
-from copy import deepcopy
-import shutil
 import sys
-import webbrowser
-import winreg
+import multiprocessing
+import queue
+import threading
+from functools import lru_cache
+from cube_cache import ParseCache
+from cube_core import output_path_for, process_combined
+from cube_log import LEVELS, CallbackSink, EventLog, JsonLinesSink, RotatingTextSink, default_log_dir
+from cube_profile import RunProfiler
+from cube_settings import open_settings
+
+# Startup: openpyxl, PIL, webbrowser, winsound and the plan module are
+# imported where first used (openpyxl is preloaded in the background once
+# the window is up). customtkinter/tkinter are imported by the GUI code
+# that uses them, and the settings and parse cache are opened in main():
+# worker processes spawned for grade parsing re-import this module and
+# must not repeat any of it. The time to a usable window is logged on
+# every start; `python cube_bench.py startup` reports import times against
+# a budget.
+STARTUP_BUDGET_MS = 1500
 
 """
 ╔══════════════════════════════════════════════════════════════════╗
@@ -21,10 +34,6 @@ import winreg
 ╚══════════════════════════════════════════════════════════════════╝
 """
 
-# Set appearance
-ctk.set_appearance_mode("dark")
-ctk.set_default_color_theme("blue")
-
 # Resource path for PyInstaller
 def resource_path(relative_path):
     try:
@@ -33,258 +42,33 @@ def resource_path(relative_path):
         base_path = os.path.abspath(".")
     return os.path.join(base_path, relative_path)
 
-# Registry Settings
-class RegistrySettings:
-    def __init__(self):
-        self.SOFTWARE_KEY = r"SOFTWARE\CubeDataProcessor"
-        self.app_key = None
-        
-    def _open_key(self, write=False):
-        try:
-            if write:
-                self.app_key = winreg.CreateKey(winreg.HKEY_CURRENT_USER, self.SOFTWARE_KEY)
-            else:
-                self.app_key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.SOFTWARE_KEY, 0, winreg.KEY_READ)
-            return True
-        except WindowsError:
-            try:
-                self.app_key = winreg.CreateKey(winreg.HKEY_CURRENT_USER, self.SOFTWARE_KEY)
-                return True
-            except:
-                return False
-    
-    def _close_key(self):
-        if self.app_key:
-            winreg.CloseKey(self.app_key)
-            self.app_key = None
-    
-    def save_setting(self, name, value):
-        if self._open_key(write=True):
-            try:
-                if isinstance(value, list):
-                    value = "|".join(value)
-                winreg.SetValueEx(self.app_key, name, 0, winreg.REG_SZ, str(value))
-            except:
-                pass
-            finally:
-                self._close_key()
-    
-    def load_setting(self, name, default=""):
-        if self._open_key():
-            try:
-                value, _ = winreg.QueryValueEx(self.app_key, name)
-                if "|" in str(value) and name == "grade_files":
-                    return str(value).split("|") if value else []
-                return value
-            except WindowsError:
-                return default
-            finally:
-                self._close_key()
-        return default
-    
-    def save_all_settings(self, grade_files, output_path, calendar_path):
-        self.save_setting("grade_files", grade_files)
-        self.save_setting("output_path", output_path)
-        self.save_setting("calendar_path", calendar_path)
-    
-    def load_all_settings(self):
-        grade_files = self.load_setting("grade_files", [])
-        output_path = self.load_setting("output_path", "")
-        calendar_path = self.load_setting("calendar_path", "")
-        return {"output_path": output_path, "calendar_path": calendar_path}, grade_files
-
-registry_settings = RegistrySettings()
-
-# Smart grade extraction
-def extract_grade(filename):
-    name = os.path.basename(filename).split('.')[0].upper()
-    
-    if "MORTAR" in name and "_" in name:
-        parts = name.split("_")
-        if len(parts) >= 3:
-            ratio = f"{parts[-2]}:{parts[-1]}"
-            return ratio
-    
-    name = name.replace("_", "").replace("-", "")
-    return name.strip()
+# Sidebar logo, decoded and resized once per process
+@lru_cache(maxsize=None)
+def load_logo(size=70):
+    import customtkinter as ctk
+    from PIL import Image
+    logo_img = Image.open(resource_path("logo.png"))
+    logo_img = logo_img.resize((size, size), Image.Resampling.LANCZOS)
+    return ctk.CTkImage(light_image=logo_img, dark_image=logo_img, size=(size, size))
 
-def get_last_row(ws):
-    row = 2
-    while True:
-        if ws.cell(row=row, column=2).value in (None, ""):
-            return row - 1
-        row += 1
+def open_link(url):
+    import webbrowser
+    webbrowser.open(url)
 
-def load_workbook_safe(filepath):
+# Warm the import cache off the Tk thread so the first run does not pay for it
+def preload_core():
     try:
-        wb = openpyxl.load_workbook(filepath, keep_vba=False, data_only=False, keep_links=False)
-        return wb
-    except:
-        wb = openpyxl.load_workbook(filepath)
-        return wb
+        import openpyxl
+    except ImportError:
+        pass
 
-def load_calendar_data(calendar_file, log_callback):
-    try:
-        if not calendar_file or not os.path.exists(calendar_file):
-            log_callback("⚠ No calendar file selected")
-            return None
-        
-        wb = load_workbook_safe(calendar_file)
-        ws = wb.active
-        
-        calendar_dict = {}
-        row = 2
-        
-        while True:
-            casting_date = ws.cell(row=row, column=1).value
-            if not casting_date:
-                break
-            
-            date_7 = ws.cell(row=row, column=2).value
-            date_28 = ws.cell(row=row, column=3).value
-            
-            if casting_date:
-                date_str = str(casting_date).strip()
-                calendar_dict[date_str] = {
-                    "7_days": str(date_7).strip() if date_7 else "",
-                    "28_days": str(date_28).strip() if date_28 else ""
-                }
-            
-            row += 1
-        
-        wb.close()
-        log_callback(f"✓ Calendar loaded: {len(calendar_dict)} dates")
-        return calendar_dict
-        
-    except Exception as e:
-        log_callback(f"✖ Calendar load error: {e}")
-        return None
-
-def process_combined(grade_files, office_file, output_folder, calendar_file, mode, log_callback):
-    try:
-        log_callback(f"\n{'='*60}")
-        log_callback(f"PROCESSING MODE: {mode.upper().replace('_', ' ')}")
-        log_callback(f"{'='*60}")
-        
-        calendar_data = None
-        if mode in ["date_only", "both"]:
-            calendar_data = load_calendar_data(calendar_file, log_callback)
-            if not calendar_data:
-                log_callback("✖ Cannot proceed without calendar file")
-                return 0
-        
-        base = os.path.basename(office_file).split(".")[0]
-        outname = f"{base}_Processed.xlsx"
-        outpath = os.path.join(output_folder, outname)
-        
-        shutil.copy2(office_file, outpath)
-        office_wb = load_workbook_safe(outpath)
-        
-        total_copy_count = 0
-        
-        if mode in ["grade_only", "both"] and grade_files:
-            log_callback(f"\n--- GRADE PROCESSING ---")
-            
-            for grade_file in grade_files:
-                grade_wb = load_workbook_safe(grade_file)
-                grade_ws = grade_wb.active
-                grade_name = extract_grade(grade_file)
-                
-                log_callback(f"\nProcessing: {os.path.basename(grade_file)}")
-                log_callback(f"Looking for grade: {grade_name}")
-                
-                last_row = get_last_row(grade_ws)
-                log_callback(f"Data rows: {last_row - 1}")
-                
-                matching_sheets = []
-                for sheet_name in office_wb.sheetnames:
-                    ws = office_wb[sheet_name]
-                    b12_value = ws["B12"].value
-                    if b12_value:
-                        b12 = str(b12_value).replace(" ", "").upper()
-                        grade_normalized = grade_name.replace(" ", "").upper()
-                        if b12 == grade_normalized:
-                            matching_sheets.append(sheet_name)
-                            log_callback(f"  ✓ Matched sheet: {sheet_name} (B12={b12})")
-                
-                log_callback(f"Total matching sheets: {len(matching_sheets)}")
-                
-                if len(matching_sheets) == 0:
-                    log_callback(f"⚠ No sheets found with B12='{grade_name}'")
-                    grade_wb.close()
-                    continue
-                
-                sheet_index = 0
-                
-                for r in range(2, last_row + 1):
-                    if sheet_index >= len(matching_sheets):
-                        log_callback(f"⚠ More data rows than available sheets")
-                        break
-                    
-                    current_sheet_name = matching_sheets[sheet_index]
-                    ws = office_wb[current_sheet_name]
-                    
-                    weight_values = [grade_ws.cell(row=r, column=c).value for c in range(2, 8)]
-                    strength_values = [grade_ws.cell(row=r, column=c).value for c in range(9, 15)]
-                    
-                    for i, v in enumerate(weight_values):
-                        ws.cell(row=25, column=3 + i, value=v)
-                    for i, v in enumerate(strength_values):
-                        ws.cell(row=27, column=3 + i, value=v)
-                    
-                    total_copy_count += 1
-                    log_callback(f"  ✓ Row {r} → {current_sheet_name}")
-                    sheet_index += 1
-                
-                grade_wb.close()
-        
-        if mode in ["date_only", "both"] and calendar_data:
-            log_callback(f"\n--- DATE PROCESSING ---")
-            
-            updated_count = 0
-            
-            for sheet_name in office_wb.sheetnames:
-                ws = office_wb[sheet_name]
-                
-                casting_date_cell = ws["C17"].value
-                if not casting_date_cell:
-                    continue
-                
-                casting_date = str(casting_date_cell).strip()
-                
-                if casting_date in calendar_data:
-                    date_7 = calendar_data[casting_date]["7_days"]
-                    date_28 = calendar_data[casting_date]["28_days"]
-                    
-                    if date_7:
-                        ws["C18"] = date_7
-                    if date_28:
-                        ws["F18"] = date_28
-                    
-                    updated_count += 1
-                    log_callback(f"✓ {sheet_name}: {casting_date} → 7d:{date_7}, 28d:{date_28}")
-                else:
-                    log_callback(f"⚠ Date not in calendar: {casting_date} ({sheet_name})")
-            
-            log_callback(f"\nSheets updated: {updated_count}")
-        
-        office_wb.save(outpath)
-        office_wb.close()
-        
-        log_callback(f"\n{'='*60}")
-        log_callback(f"✓✓✓ SAVED: {outpath}")
-        log_callback(f"{'='*60}")
-        
-        return total_copy_count
-        
-    except Exception as e:
-        log_callback(f"✖ ERROR: {e}")
-        import traceback
-        log_callback(traceback.format_exc())
-        return 0
+LOG_DETAIL_LEVELS = {"Summary": LEVELS["summary"], "Per Sheet": LEVELS["sheet"], "Per Row": LEVELS["row"]}
 
 class CubeDataProcessor:
-    def __init__(self):
+    def __init__(self, settings, parse_cache):
+        import customtkinter as ctk
+        self.settings = settings
+        self.parse_cache = parse_cache
         self.root = ctk.CTk()
         self.root.title("Cube Data Processor")
         self.root.geometry("1100x750")
@@ -295,18 +79,40 @@ class CubeDataProcessor:
         except:
             pass
         
-        settings, saved_grade_files = registry_settings.load_all_settings()
-        
         self.grade_files = []
         self.office_path = ctk.StringVar()
-        self.output_path = ctk.StringVar(value=settings.get("output_path", ""))
-        self.calendar_path = ctk.StringVar(value=settings.get("calendar_path", ""))
+        self.output_path = ctk.StringVar(value=self.settings.get("output_path", ""))
+        self.calendar_path = ctk.StringVar(value=self.settings.get("calendar_path", ""))
         self.mode_var = ctk.StringVar(value="both")
-        
-        for gf in saved_grade_files:
+        self.log_level_var = ctk.StringVar(value="Summary")
+        self.profile_var = ctk.BooleanVar(value=False)
+        self.incremental_var = ctk.BooleanVar(value=False)
+        self.plan_only_var = ctk.BooleanVar(value=False)
+        self.stats_var = ctk.BooleanVar(value=False)
+        self.low_memory_var = ctk.BooleanVar(value=self.settings.get("low_memory"))
+        
+        for gf in self.settings.get("grade_files"):
             if os.path.exists(gf):
                 self.grade_files.append(gf)
         
+        # Worker thread state: log lines and progress are handed to the Tk
+        # thread through a queue and flushed in batches by poll_worker()
+        self.log_queue = queue.Queue()
+        self.worker = None
+        self.worker_result = 0
+        self.worker_cancelled = False
+        self.cancel_event = threading.Event()
+        self.progress_value = 0.0
+        
+        # Every run is also written to a rotating text log and a JSON-lines audit
+        self.file_sinks = []
+        try:
+            log_dir = default_log_dir()
+            self.file_sinks = [RotatingTextSink(os.path.join(log_dir, "cube.log")),
+                               JsonLinesSink(os.path.join(log_dir, "audit.jsonl"))]
+        except OSError:
+            pass
+        
         self.setup_ui()
         
     def setup_ui(self):
@@ -317,6 +123,7 @@ class CubeDataProcessor:
         self.create_main_content()
         
     def create_sidebar(self):
+        import customtkinter as ctk
         self.sidebar = ctk.CTkFrame(self.root, width=260, corner_radius=0)
         self.sidebar.grid(row=0, column=0, rowspan=2, sticky="nsew")
         self.sidebar.grid_rowconfigure(10, weight=1)
@@ -326,11 +133,7 @@ class CubeDataProcessor:
         logo_frame.grid(row=0, column=0, padx=20, pady=(30, 10))
         
         try:
-            from PIL import Image
-            logo_img = Image.open(resource_path("logo.png"))
-            logo_img = logo_img.resize((70, 70), Image.Resampling.LANCZOS)
-            logo_photo = ctk.CTkImage(light_image=logo_img, dark_image=logo_img, size=(70, 70))
-            logo_label = ctk.CTkLabel(logo_frame, image=logo_photo, text="")
+            logo_label = ctk.CTkLabel(logo_frame, image=load_logo(), text="")
             logo_label.pack()
         except:
             logo_label = ctk.CTkLabel(logo_frame, text="🔷", font=ctk.CTkFont(size=50))
@@ -387,23 +190,29 @@ class CubeDataProcessor:
                                         fg_color="#dc2626", hover_color="#b91c1c")
         clear_grade_btn.pack(side="left")
         
+        clear_cache_btn = ctk.CTkButton(self.sidebar, text="♻️ Clear Cache", 
+                                        command=self.clear_cache, width=220, height=30,
+                                        font=ctk.CTkFont(size=12), fg_color="gray30", hover_color="gray25")
+        clear_cache_btn.grid(row=9, column=0, padx=20, pady=(0, 10))
+        
         # Social links
         social_label = ctk.CTkLabel(self.sidebar, text="🔗 Connect", 
                                     font=ctk.CTkFont(size=13, weight="bold"), anchor="w")
         social_label.grid(row=11, column=0, padx=20, pady=(20, 10), sticky="ew")
         
         github_btn = ctk.CTkButton(self.sidebar, text="🐙 GitHub", 
-                                   command=lambda: webbrowser.open("https://github.com/Sandeep2062/Cube-Data-Processor"),
+                                   command=lambda: open_link("https://github.com/Sandeep2062/Cube-Data-Processor"),
                                    width=220, height=35, font=ctk.CTkFont(size=12, weight="bold"))
         github_btn.grid(row=12, column=0, padx=20, pady=5)
         
         insta_btn = ctk.CTkButton(self.sidebar, text="📷 Instagram", 
-                                  command=lambda: webbrowser.open("https://www.instagram.com/sandeep._.2062/"),
+                                  command=lambda: open_link("https://www.instagram.com/sandeep._.2062/"),
                                   width=220, height=35, font=ctk.CTkFont(size=12, weight="bold"),
                                   fg_color="#E1306C", hover_color="#C13584")
         insta_btn.grid(row=13, column=0, padx=20, pady=(5, 30))
         
     def create_main_content(self):
+        import customtkinter as ctk
         self.main_frame = ctk.CTkFrame(self.root)
         self.main_frame.grid(row=0, column=1, sticky="nsew", padx=20, pady=20)
         self.main_frame.grid_columnconfigure(0, weight=1)
@@ -479,9 +288,37 @@ class CubeDataProcessor:
         self.progress.set(0)
         
         # Log section
-        log_label = ctk.CTkLabel(self.main_frame, text="📋 Processing Log", 
+        log_header = ctk.CTkFrame(self.main_frame, fg_color="transparent")
+        log_header.grid(row=5, column=0, padx=15, pady=(10, 5), sticky="ew")
+        
+        log_label = ctk.CTkLabel(log_header, text="📋 Processing Log", 
                                 font=ctk.CTkFont(size=15, weight="bold"), anchor="w")
-        log_label.grid(row=5, column=0, padx=15, pady=(10, 5), sticky="w")
+        log_label.pack(side="left")
+        
+        log_level_menu = ctk.CTkOptionMenu(log_header, variable=self.log_level_var,
+                                           values=list(LOG_DETAIL_LEVELS), width=130,
+                                           font=ctk.CTkFont(size=12))
+        log_level_menu.pack(side="right")
+        
+        profile_check = ctk.CTkCheckBox(log_header, text="⏱️ Profile", variable=self.profile_var,
+                                        font=ctk.CTkFont(size=12))
+        profile_check.pack(side="right", padx=(0, 15))
+        
+        incremental_check = ctk.CTkCheckBox(log_header, text="⚡ Incremental", variable=self.incremental_var,
+                                            font=ctk.CTkFont(size=12))
+        incremental_check.pack(side="right", padx=(0, 15))
+        
+        plan_check = ctk.CTkCheckBox(log_header, text="🔍 Plan only", variable=self.plan_only_var,
+                                     font=ctk.CTkFont(size=12))
+        plan_check.pack(side="right", padx=(0, 15))
+        
+        stats_check = ctk.CTkCheckBox(log_header, text="📊 Stats", variable=self.stats_var,
+                                      font=ctk.CTkFont(size=12))
+        stats_check.pack(side="right", padx=(0, 15))
+        
+        low_memory_check = ctk.CTkCheckBox(log_header, text="🪶 Low memory", variable=self.low_memory_var,
+                                           font=ctk.CTkFont(size=12))
+        low_memory_check.pack(side="right", padx=(0, 15))
         
         self.log_textbox = ctk.CTkTextbox(self.main_frame, font=ctk.CTkFont(size=11))
         self.log_textbox.grid(row=6, column=0, sticky="nsew", padx=15, pady=(0, 15))
@@ -510,6 +347,7 @@ class CubeDataProcessor:
                 self.grade_listbox.insert("end", f"📄 {os.path.basename(file)}\n")
             
     def add_grades(self):
+        from tkinter import filedialog
         files = filedialog.askopenfilenames(filetypes=[("Excel Files", "*.xlsx")])
         for f in files:
             if f not in self.grade_files:
@@ -520,27 +358,63 @@ class CubeDataProcessor:
         self.grade_files.clear()
         self.update_grade_listbox()
         
+    def clear_cache(self):
+        from tkinter import messagebox
+        removed = self.parse_cache.clear()
+        messagebox.showinfo("Cache", f"Cleared {removed} cached file(s).")
+        
     def pick_office(self):
+        from tkinter import filedialog
         path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx")])
         if path:
             self.office_path.set(path)
             
     def pick_calendar(self):
+        from tkinter import filedialog
         path = filedialog.askopenfilename(filetypes=[("Excel Files", "*.xlsx")])
         if path:
             self.calendar_path.set(path)
             
     def pick_output_folder(self):
+        from tkinter import filedialog
         folder = filedialog.askdirectory()
         if folder:
             self.output_path.set(folder)
             
     def log(self, message):
-        self.log_textbox.insert("end", message + "\n")
-        self.log_textbox.see("end")
-        self.root.update_idletasks()
+        # Called from the worker thread; only the queue is touched here
+        self.log_queue.put(message)
+        
+    def set_progress(self, fraction):
+        self.progress_value = fraction
+        
+    def flush_log(self):
+        lines = []
+        while True:
+            try:
+                lines.append(self.log_queue.get_nowait())
+            except queue.Empty:
+                break
+        if lines:
+            self.log_textbox.insert("end", "\n".join(lines) + "\n")
+            self.log_textbox.see("end")
+        
+    def poll_worker(self):
+        self.flush_log()
+        self.progress.set(self.progress_value)
+        
+        if self.worker is not None and self.worker.is_alive():
+            self.root.after(100, self.poll_worker)
+        else:
+            self.finish_processing()
         
     def run_processing(self):
+        from tkinter import messagebox
+        if self.worker is not None and self.worker.is_alive():
+            self.cancel_event.set()
+            self.start_btn.configure(text="⏳  CANCELLING...", state="disabled")
+            return
+        
         mode = self.mode_var.get()
         
         if mode in ["grade_only", "both"]:
@@ -561,29 +435,142 @@ class CubeDataProcessor:
             messagebox.showerror("Error", "Select output folder.")
             return
 
-        registry_settings.save_all_settings(self.grade_files, self.output_path.get(), self.calendar_path.get())
+        self.settings.update(grade_files=list(self.grade_files), output_path=self.output_path.get(),
+                             calendar_path=self.calendar_path.get(), low_memory=self.low_memory_var.get())
+        self.settings.remember_inputs(self.input_paths())
+        self.settings.save()
 
         self.log_textbox.delete("0.0", "end")
-        self.progress.set(0.3)
-        self.root.update_idletasks()
-        
-        total = process_combined(
-            self.grade_files,
-            self.office_path.get(),
-            self.output_path.get(),
-            self.calendar_path.get(),
+        self.parse_cache.reset_stats()
+        self.cancel_event.clear()
+        self.worker_cancelled = False
+        self.progress_value = 0.0
+        self.progress.set(0)
+        self.start_btn.configure(text="⏹  CANCEL", fg_color="#dc2626", hover_color="#b91c1c")
+        
+        args = (list(self.grade_files), self.office_path.get(), self.output_path.get(),
+                self.calendar_path.get(), mode, LOG_DETAIL_LEVELS[self.log_level_var.get()],
+                self.profile_var.get(), self.incremental_var.get(), self.plan_only_var.get(), self.stats_var.get(),
+                self.low_memory_var.get())
+        self.worker = threading.Thread(target=self.process_in_background, args=args, daemon=True)
+        self.worker.start()
+        self.root.after(100, self.poll_worker)
+        
+    def process_in_background(self, grade_files, office_file, output_folder, calendar_file, mode, log_level, profile,
+                              incremental, plan_only, stats, low_memory):
+        events = EventLog(log_level, [CallbackSink(self.log), self.note_cancelled] + self.file_sinks)
+        if plan_only:
+            self.plan_in_background(grade_files, office_file, output_folder, calendar_file, mode, events)
+            events.flush()
+            return
+        profiler = RunProfiler() if profile else None
+        self.worker_result = process_combined(
+            grade_files,
+            office_file,
+            output_folder,
+            calendar_file,
             mode,
-            log_callback=self.log
+            log_callback=events,
+            cache=self.parse_cache,
+            progress_callback=self.set_progress,
+            cancel_event=self.cancel_event,
+            stages=profiler,
+            incremental=incremental,
+            grade_workers=self.settings.get("grade_workers"),
+            stats="csv" if stats else None,
+            low_memory=low_memory,
+            memory_budget=self.settings.get("memory_budget_mb")
         )
+        if profiler is not None:
+            profile_path = output_path_for(office_file, output_folder, "_profile.json")
+            try:
+                profiler.write(profile_path)
+                self.log(f"Profile written: {profile_path}")
+            except OSError as e:
+                self.log(f"⚠ Could not write profile: {e}")
+        events.flush()
+        
+    # The run reports a cancel it acted on with a "cancelled" event; a
+    # cancel pressed after the output was saved is not one
+    def note_cancelled(self, record):
+        if record["event"] == "cancelled":
+            self.worker_cancelled = True
+        
+    # Dry run: read only B12/C17, show which row and dates each sheet gets
+    # and save the plan so cube_plan.py apply can write it later
+    def plan_in_background(self, grade_files, office_file, output_folder, calendar_file, mode, events):
+        from cube_core import ProcessingCancelled
+        from cube_plan import format_plan_table, make_plan, save_plan
+        self.worker_result = 0
+        
+        def check_cancel():
+            if self.cancel_event.is_set():
+                raise ProcessingCancelled()
         
-        self.progress.set(1.0)
-        winsound.MessageBeep()
-        messagebox.showinfo("✓ Completed", f"Processing Complete!\n\nTotal Operations: {total}")
+        try:
+            plan_doc = make_plan(grade_files, office_file, calendar_file, mode, events, cache=self.parse_cache,
+                                 grade_workers=self.settings.get("grade_workers"), check_cancel=check_cancel)
+            if plan_doc is None:
+                return
+            self.log(f"\n{'='*60}")
+            for line in format_plan_table(plan_doc):
+                self.log(line)
+            plan_path = output_path_for(office_file, output_folder, "_plan.json")
+            save_plan(plan_path, plan_doc)
+            self.log(f"{'='*60}\n✓ Plan saved (nothing else written): {plan_path}")
+            self.worker_result = plan_doc["rows_copied"]
+        except ProcessingCancelled:
+            events.emit(LEVELS["summary"], "cancelled", "\n⚠ Planning cancelled - no plan was saved")
+        except Exception as e:
+            self.log(f"✖ Plan error: {e}")
+        self.set_progress(1.0)
+        
+    def finish_processing(self):
+        from tkinter import messagebox
+        self.worker = None
+        self.start_btn.configure(text="▶️  START PROCESSING", state="normal",
+                                 fg_color="#16a34a", hover_color="#15803d")
+        
+        if self.worker_cancelled:
+            messagebox.showwarning("Cancelled", "Processing was cancelled. No output was saved.")
+        else:
+            if sys.platform == "win32":
+                import winsound
+                winsound.MessageBeep()
+            else:
+                self.root.bell()
+            messagebox.showinfo("✓ Completed", f"Processing Complete!\n\nTotal Operations: {self.worker_result}")
         self.progress.set(0)
         
+    def input_paths(self):
+        return self.grade_files + ([self.calendar_path.get()] if self.calendar_path.get() else [])
+        
+    def report_startup(self):
+        elapsed_ms = (time.perf_counter() - STARTED) * 1000
+        message = f"Ready in {elapsed_ms:.0f} ms"
+        if elapsed_ms > STARTUP_BUDGET_MS:
+            message = f"⚠ Slow start: {elapsed_ms:.0f} ms (budget {STARTUP_BUDGET_MS} ms)"
+        events = EventLog(LEVELS["summary"], [CallbackSink(self.log)] + self.file_sinks)
+        events.emit(LEVELS["summary"], "startup", message, ms=round(elapsed_ms, 1))
+        for path in self.settings.changed_inputs(self.input_paths()):
+            events.emit(LEVELS["summary"], "warning", f"⚠ Changed since the last run: {os.path.basename(path)}",
+                        file=path)
+        events.flush()
+        self.flush_log()
+        threading.Thread(target=preload_core, daemon=True).start()
+        
     def run(self):
+        self.root.after(0, self.report_startup)
         self.root.mainloop()
 
+def main():
+    import customtkinter as ctk
+    ctk.set_appearance_mode("dark")
+    ctk.set_default_color_theme("blue")
+    app = CubeDataProcessor(open_settings(), ParseCache())
+    app.run()
+
 if __name__ == "__main__":
-    app = CubeDataProcessor()
-    app.run()
\ No newline at end of file
+    # Grade files are parsed in worker processes; needed for frozen builds
+    multiprocessing.freeze_support()
+    main()
\ No newline at end of file
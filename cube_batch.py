@@ -0,0 +1,328 @@
+import argparse
+import glob
+import os
+import sys
+import time
+
+from cube_cache import ParseCache
+from cube_core import (WRITERS, load_calendar_data, load_all_grade_data, output_path_for, process_combined,
+                       split_source)
+from cube_layout import LayoutError, load_layout
+from cube_log import LEVELS, SUMMARY, CallbackSink, EventLog, JsonLinesSink, RotatingTextSink, as_event_log
+from cube_lookup import absolute_source, load_or_rebuild
+from cube_profile import RunProfiler
+from cube_settings import open_settings
+from cube_stats import STATS_FORMATS
+
+# Headless batch engine: apply the same grade + calendar inputs to many office
+# workbooks in parallel. Calendar and grade workbooks are parsed once in the
+# parent and handed to every worker through the pool initializer.
+
+MODES = ["grade_only", "date_only", "both"]
+
+def collect_xlsx_files(inputs):
+    files = []
+    for item in inputs:
+        # Sheet selections ("book.xlsx#Sheet") pass through unchanged
+        path, sheet = split_source(item)
+        if sheet is not None:
+            if os.path.exists(path) and item not in files:
+                files.append(item)
+            continue
+        if os.path.isdir(item):
+            matches = sorted(glob.glob(os.path.join(item, "*.xlsx")))
+        else:
+            matches = sorted(glob.glob(item)) or ([item] if os.path.exists(item) else [])
+        for path in matches:
+            name = os.path.basename(path)
+            # Skip Excel lock files and our own outputs
+            if name.startswith("~$") or name.endswith("_Processed.xlsx"):
+                continue
+            if path not in files:
+                files.append(path)
+    return files
+
+# Outputs are named after the office file alone, so files with the same
+# name in different folders (or two sheet selections of one workbook)
+# would write, and race on, the same output and manifest. Returns
+# {output path: [office files]} for every output claimed more than once.
+def output_key(office_file, output_folder, suffix="_Processed.xlsx"):
+    return os.path.normcase(os.path.abspath(output_path_for(office_file, output_folder, suffix)))
+
+def output_collisions(office_files, output_folder, suffix="_Processed.xlsx"):
+    owners = {}
+    for office_file in office_files:
+        owners.setdefault(output_key(office_file, output_folder, suffix), []).append(office_file)
+    return {outpath: files for outpath, files in owners.items() if len(files) > 1}
+
+def describe_collisions(collisions):
+    return "; ".join(f"{os.path.basename(outpath)} <- {', '.join(files)}" for outpath, files in collisions.items())
+
+# Process one office file with already-parsed inputs (grade_data None:
+# grade_files are streamed by the run itself, in low-memory mode). Event
+# records are collected and returned so that the parent process owns the
+# log sinks.
+def process_file(office_file, output_folder, mode, calendar_data, grade_data, log_level=SUMMARY,
+                 profile=False, cprofile=False, incremental=False, writer="openpyxl", layout=None, stats=None,
+                 grade_files=(), cache=None, low_memory=False, memory_budget=None):
+    records = []
+    profiler = None
+    if profile or cprofile:
+        cprofile_path = output_path_for(office_file, output_folder, "_profile.prof") if cprofile else None
+        profiler = RunProfiler(memory=profile, cprofile_path=cprofile_path)
+
+    start = time.perf_counter()
+    total = process_combined(
+        list(grade_files), office_file, output_folder, None, mode,
+        EventLog(log_level, [records.append]),
+        calendar_data=calendar_data,
+        grade_data=grade_data,
+        cache=cache,
+        stages=profiler,
+        incremental=incremental,
+        writer=writer,
+        layout=layout,
+        stats=stats,
+        low_memory=low_memory,
+        memory_budget=memory_budget,
+    )
+    elapsed = time.perf_counter() - start
+    if profiler is not None and profile:
+        profiler.write(output_path_for(office_file, output_folder, "_profile.json"))
+    ok = not any(record["event"] == "error" for record in records)
+    peak_mb = next((record["peak_mb"] for record in records if record["event"] == "memory"), None)
+    return {"file": office_file, "ok": ok, "rows": total, "seconds": elapsed, "peak_mb": peak_mb, "log": records}
+
+# Parsed inputs and options are sent once per worker process, not per file
+_shared = {}
+
+def _init_worker(calendar_data, grade_data, log_level, profile=False, cprofile=False, incremental=False,
+                 writer="openpyxl", layout=None, stats=None, grade_files=(), cache=None, low_memory=False,
+                 memory_budget=None):
+    _shared.update(calendar_data=calendar_data, grade_data=grade_data, log_level=log_level,
+                   profile=profile, cprofile=cprofile, incremental=incremental, writer=writer, layout=layout,
+                   stats=stats, grade_files=grade_files, cache=cache, low_memory=low_memory,
+                   memory_budget=memory_budget)
+
+def _process_one(office_file, output_folder, mode):
+    return process_file(office_file, output_folder, mode, **_shared)
+
+def run_batch(office_files, grade_files, calendar_file, output_folder, mode,
+              workers=None, log_callback=print, verbose=False, cache=None, log_level=SUMMARY,
+              profile=False, cprofile=False, incremental=False, calendar_data=None, grade_data=None,
+              grade_workers=None, writer="openpyxl", layout=None, stats=None, low_memory=False,
+              memory_budget=None):
+    # calendar_data / grade_data may come pre-merged from a lookup table
+    # (cube_lookup); otherwise they are loaded from calendar_file / grade_files.
+    # layout is a compiled cube_layout.Layout, sent to workers once. stats
+    # exports per-file specimen tables and grade aggregates (see cube_stats).
+    # low_memory runs one file at a time unless workers is given, and each
+    # file streams the grade files through the parse cache instead of all
+    # of them being held for the whole batch; memory_budget (MB) applies to
+    # every worker process (see process_combined).
+    events = as_event_log(log_callback)
+    collisions = output_collisions(office_files, output_folder)
+    if collisions:
+        events.emit(SUMMARY, "error", f"✖ Office files would share an output: {describe_collisions(collisions)}",
+                    collisions=collisions)
+        return []
+    if low_memory and workers is None:
+        workers = 1
+    if mode in ["date_only", "both"]:
+        if calendar_data is None:
+            calendar_data = load_calendar_data(calendar_file, events, cache)
+        if not calendar_data:
+            events("✖ Cannot proceed without calendar file")
+            return []
+    else:
+        calendar_data = None
+
+    if mode in ["grade_only", "both"]:
+        if grade_data is None and low_memory:
+            events(f"Low-memory mode: {len(grade_files)} grade file(s) streamed per office file")
+        elif grade_data is None:
+            grade_data = load_all_grade_data(grade_files, cache, events, grade_workers)
+            for grade in grade_data:
+                events(f"✓ Grade loaded: {grade['grade']} ({len(grade['rows'])} rows)")
+    else:
+        grade_data = []
+
+    if cache is not None:
+        events(cache.stats())
+
+    os.makedirs(output_folder, exist_ok=True)
+    events(f"\nProcessing {len(office_files)} office file(s)...")
+
+    def report(result):
+        name = os.path.basename(result["file"])
+        rate = result["rows"] / result["seconds"] if result["seconds"] else 0.0
+        # Log files always get the worker's records; the console only with
+        # verbose or when the file failed
+        dispatch = events.dispatch if verbose or not result["ok"] else events.dispatch_to_logs
+        for record in result["log"]:
+            dispatch(record)
+        mark = "✓" if result["ok"] else "✖"
+        peak = f", peak {result['peak_mb']} MB" if result["peak_mb"] is not None else ""
+        events.emit(SUMMARY, "file_done", f"{mark} {name}: {result['rows']} rows in {result['seconds']:.2f}s ({rate:.1f} rows/s{peak})",
+                    file=result["file"], ok=result["ok"], rows=result["rows"], seconds=result["seconds"],
+                    peak_mb=result["peak_mb"])
+
+    results = []
+    start = time.perf_counter()
+
+    if workers == 1:
+        _init_worker(calendar_data, grade_data, log_level, profile, cprofile, incremental, writer, layout, stats,
+                     grade_files, cache, low_memory, memory_budget)
+        for office_file in office_files:
+            result = _process_one(office_file, output_folder, mode)
+            report(result)
+            results.append(result)
+    else:
+        from concurrent.futures import ProcessPoolExecutor, as_completed
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(calendar_data, grade_data, log_level, profile, cprofile, incremental,
+                                           writer, layout, stats, grade_files, cache, low_memory,
+                                           memory_budget)) as pool:
+            futures = [pool.submit(_process_one, f, output_folder, mode) for f in office_files]
+            for future in as_completed(futures):
+                result = future.result()
+                report(result)
+                results.append(result)
+
+    elapsed = time.perf_counter() - start
+    failed = sum(1 for r in results if not r["ok"])
+    total_rows = sum(r["rows"] for r in results)
+    rate = len(results) / elapsed if elapsed else 0.0
+
+    events(f"\n{'='*60}")
+    events(f"Files: {len(results)} ({failed} failed) | Rows: {total_rows} | "
+                 f"Time: {elapsed:.2f}s ({rate:.2f} files/s)")
+    events(f"{'='*60}")
+
+    order = {f: i for i, f in enumerate(office_files)}
+    results.sort(key=lambda r: order[r["file"]])
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cube Data Processor - headless batch mode")
+    parser.add_argument("inputs", nargs="+", help="office files, directories or glob patterns")
+    parser.add_argument("-g", "--grades", nargs="*", default=[],
+                        help="grade files, directories or glob patterns (first wins for a repeated grade)")
+    parser.add_argument("-c", "--calendar", action="append", default=[],
+                        help="calendar workbook, book.xlsx#Sheet or book.xlsx#* (repeatable, first wins)")
+    parser.add_argument("--lookup", default=None,
+                        help="prebuilt lookup table (cube_lookup.py) used instead of -g/-c")
+    parser.add_argument("-o", "--output", default=None, help="output folder")
+    parser.add_argument("-m", "--mode", choices=MODES, default=None, help="default: both")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (1 = serial)")
+    parser.add_argument("--grade-workers", type=int, default=None,
+                        help="processes parsing grade files (1 = serial, default: one per CPU)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="patch only sheets whose inputs changed since the last run of each file")
+    parser.add_argument("--writer", choices=WRITERS, default="openpyxl",
+                        help="patch = edit only the target cells inside the xlsx (falls back to openpyxl)")
+    parser.add_argument("--layout", default=None,
+                        help="layout profile JSON mapping inputs to template cells (default: standard template)")
+    parser.add_argument("--stats", choices=STATS_FORMATS, default=None,
+                        help="also export written specimens and per-grade mean/min/std per file")
+    parser.add_argument("--low-memory", action="store_true",
+                        help="bound memory for very large workbooks: fast writer only, grade files one at a time, "
+                             "one office file at a time unless -j is given")
+    parser.add_argument("--memory-budget", type=float, default=None, metavar="MB",
+                        help="stop a file, saving nothing, once its process uses more than MB of memory")
+    parser.add_argument("--no-cache", action="store_true", help="parse every input, bypassing the parse cache")
+    parser.add_argument("--clear-cache", action="store_true", help="empty the parse cache before running")
+    parser.add_argument("--cache-dir", default=None, help="parse cache folder")
+    parser.add_argument("-v", "--verbose", action="store_true", help="print the full log of every file")
+    parser.add_argument("--log-level", choices=list(LEVELS), default="summary", help="detail of per-file logs")
+    parser.add_argument("--log-file", default=None, help="rotating plain-text log file")
+    parser.add_argument("--audit-file", default=None, help="JSON-lines audit file")
+    parser.add_argument("--profile", action="store_true",
+                        help="record per-stage time/CPU/memory and write <name>_profile.json per file")
+    parser.add_argument("--cprofile", action="store_true", help="also dump cProfile stats to <name>_profile.prof")
+    parser.add_argument("--input-set", default=None,
+                        help="saved input set supplying -g/-c/-o/-m/--layout where they are not given")
+    parser.add_argument("--save-input-set", default=None,
+                        help="save this run's -g/-c/-o/-m/--layout under a name")
+    parser.add_argument("--settings", default=None, help="settings file (default: per-user settings.json)")
+    args = parser.parse_args(argv)
+
+    if args.input_set or args.save_input_set:
+        settings = open_settings(path=args.settings)
+    if args.input_set:
+        saved = settings.input_set(args.input_set)
+        if saved is None:
+            parser.error(f"no saved input set named {args.input_set!r}")
+        args.grades = args.grades or saved["grades"]
+        args.calendar = args.calendar or saved["calendar"]
+        args.output = args.output or saved["output"]
+        args.mode = args.mode or saved["mode"]
+        args.layout = args.layout or saved.get("layout")
+    args.mode = args.mode or "both"
+    if not args.output:
+        parser.error("an output folder is required (-o or --input-set)")
+
+    try:
+        layout = load_layout(args.layout) if args.layout else None
+    except LayoutError as e:
+        parser.error(str(e))
+
+    office_files = collect_xlsx_files(args.inputs)
+    grade_files = collect_xlsx_files(args.grades)
+
+    if not office_files:
+        parser.error("no office files found")
+    if not args.lookup:
+        if args.mode in ["grade_only", "both"] and not grade_files:
+            parser.error("grade files are required for grade processing")
+        if args.mode in ["date_only", "both"] and not args.calendar:
+            parser.error("a calendar file is required for date processing")
+
+    cache = ParseCache(args.cache_dir, enabled=not args.no_cache)
+    if args.clear_cache:
+        print(f"Cache cleared: {cache.clear()} entries")
+
+    calendar_data = grade_data = None
+    if args.lookup:
+        table = load_or_rebuild(args.lookup, print, cache, args.grade_workers)
+        if table is None:
+            return 1
+        calendar_data, grade_data = table["calendar"], table["grades"]
+        print(f"✓ Lookup table: {len(calendar_data or {})} dates, {len(grade_data)} grade(s)")
+
+    if args.save_input_set:
+        # Absolute paths, so the set works from any folder
+        settings.save_input_set(args.save_input_set, {
+            "grades": [os.path.abspath(pattern) for pattern in args.grades],
+            "calendar": [absolute_source(source) for source in args.calendar],
+            "output": os.path.abspath(args.output),
+            "mode": args.mode,
+            "layout": os.path.abspath(args.layout) if args.layout else None,
+        })
+        settings.remember_inputs(grade_files + [split_source(source)[0] for source in args.calendar])
+        if settings.save():
+            print(f"✓ Input set saved: {args.save_input_set}")
+
+    sinks = [CallbackSink(print)]
+    if args.log_file:
+        sinks.append(RotatingTextSink(args.log_file))
+    if args.audit_file:
+        sinks.append(JsonLinesSink(args.audit_file))
+    events = EventLog(LEVELS[args.log_level], sinks)
+
+    try:
+        results = run_batch(office_files, grade_files, args.calendar, args.output, args.mode,
+                            workers=args.workers, log_callback=events, verbose=args.verbose,
+                            cache=cache, log_level=LEVELS[args.log_level],
+                            profile=args.profile, cprofile=args.cprofile, incremental=args.incremental,
+                            calendar_data=calendar_data, grade_data=grade_data,
+                            grade_workers=args.grade_workers, writer=args.writer, layout=layout,
+                            stats=args.stats, low_memory=args.low_memory, memory_budget=args.memory_budget)
+    finally:
+        events.close()
+    if not results or any(not r["ok"] for r in results):
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
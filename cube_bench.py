@@ -0,0 +1,737 @@
+import argparse
+import csv
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import openpyxl
+
+from cube_core import (GradeRow, date_key, load_grade_data, load_workbook_safe, output_path_for,
+                       plan_calendar_dates, plan_grade_rows, process_combined, read_data_block)
+from cube_layout import DEFAULT_LAYOUT, compile_layout
+from cube_log import EventLog
+from cube_profile import StageTimer
+
+# Benchmarks for the processing core. Runs headless (no GUI imports).
+#
+#   python cube_bench.py suite --sheets 500 --grade-rows 150 --out results.json
+#   python cube_bench.py suite --compare results.json
+#   python cube_bench.py grade-read --rows 10000
+#   python cube_bench.py model --dates 20000 --rows 50000
+#   python cube_bench.py writer --sheets 1000
+#   python cube_bench.py writer --office template.xlsx -g M20.xlsx -c calendar.xlsx
+#   python cube_bench.py startup --budget cube_core=80
+#   python cube_bench.py layout --sheets 20000
+#   python cube_bench.py stats --sheets 50000
+#   python cube_bench.py memory --sheets 3000
+
+GRADES = ["M15", "M20", "M25", "M30", "M35", "M40", "M45", "M50"]
+START_DATE = datetime.datetime(2025, 1, 1)
+STAGE_ORDER = ["calendar_load", "grade_load", "office_load", "index", "grade_copy", "date_fill", "apply", "save", "stats"]
+
+# Synthetic workbooks
+
+def make_calendar_workbook(path, dates):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["Casting Date", "7 Days", "28 Days"])
+    for i in range(dates):
+        day = START_DATE + datetime.timedelta(days=i)
+        ws.append([day, day + datetime.timedelta(days=7), day + datetime.timedelta(days=28)])
+    wb.save(path)
+
+def make_grade_workbook(path, rows):
+    make_grade_sheet(rows).save(path)
+
+# N cube sheets with a small template body (including a formula over the
+# strength cells), B12 cycling over the grades and C17 cycling over the
+# calendar dates
+def make_office_workbook(path, sheets, grades, dates):
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for i in range(sheets):
+        ws = wb.create_sheet(f"Cube {i + 1}")
+        ws["A1"] = "CUBE COMPRESSIVE STRENGTH TEST REPORT"
+        ws["A12"] = "Grade"
+        ws["B12"] = grades[i % len(grades)]
+        ws["A17"] = "Casting Date"
+        ws["C17"] = START_DATE + datetime.timedelta(days=i % dates)
+        ws["A18"] = "7 Days"
+        ws["E18"] = "28 Days"
+        ws["A25"] = "Weight (kg)"
+        ws["A27"] = "Strength (N/mm2)"
+        ws["I27"] = "=AVERAGE(C27:H27)"
+        for col in range(3, 9):
+            ws.cell(row=24, column=col, value=f"Cube {col - 2}")
+    wb.save(path)
+
+def make_dataset(folder, sheets, grade_files, grade_rows, dates):
+    grades = GRADES[:grade_files]
+    calendar_file = os.path.join(folder, "calendar.xlsx")
+    office_file = os.path.join(folder, "office.xlsx")
+    grade_paths = [os.path.join(folder, f"{grade}.xlsx") for grade in grades]
+
+    make_calendar_workbook(calendar_file, dates)
+    for grade_path in grade_paths:
+        make_grade_workbook(grade_path, grade_rows)
+    make_office_workbook(office_file, sheets, grades, dates)
+    return {"office": office_file, "grades": grade_paths, "calendar": calendar_file}
+
+def make_grade_sheet(rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.append(["ID"] + [f"W{i}" for i in range(1, 7)] + [None] + [f"S{i}" for i in range(1, 7)])
+    for r in range(rows):
+        ws.append([r + 1] + [8.1 + i for i in range(6)] + [None] + [25.0 + i for i in range(6)])
+    return wb
+
+# The pre-block-reader approach: probe column B one cell at a time, then
+# twelve ws.cell() calls per row.
+def read_grade_rows_cellwise(ws):
+    row = 2
+    while ws.cell(row=row, column=2).value not in (None, ""):
+        row += 1
+    last_row = row - 1
+
+    rows = []
+    for r in range(2, last_row + 1):
+        weight_values = [ws.cell(row=r, column=c).value for c in range(2, 8)]
+        strength_values = [ws.cell(row=r, column=c).value for c in range(9, 15)]
+        rows.append((r, weight_values, strength_values))
+    return rows
+
+def read_grade_rows_block(ws):
+    return [(r, values[0:6], values[7:13])
+            for r, values in enumerate(read_data_block(ws), start=2)]
+
+def best_of(func, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+def bench_grade_read(rows=10000, repeat=5, log_callback=print):
+    wb = make_grade_sheet(rows)
+    ws = wb.active
+
+    # In-memory worksheet: isolates the row scan itself
+    cellwise_time, cellwise_rows = best_of(lambda: read_grade_rows_cellwise(ws), repeat)
+    block_time, block_rows = best_of(lambda: read_grade_rows_block(ws), repeat)
+
+    # From disk: what a run actually pays (full load vs read-only stream)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "M20.xlsx")
+        wb.save(path)
+        file_cellwise_time, _ = best_of(lambda: read_grade_rows_cellwise(load_workbook_safe(path).active), repeat)
+        file_block_time, file_data = best_of(lambda: load_grade_data(path), repeat)
+
+    same = ([(r, list(w), list(s)) for r, w, s in block_rows] == cellwise_rows
+            and [(r, list(v[0:6]), list(v[7:13])) for r, v in file_data[0]["rows"]] == cellwise_rows)
+
+    log_callback(f"Grade sheet read, {rows} rows (best of {repeat}):")
+    log_callback(f"  in memory  cell-by-cell: {cellwise_time * 1000:8.1f} ms")
+    log_callback(f"  in memory  block read:   {block_time * 1000:8.1f} ms  ({cellwise_time / block_time:.2f}x)")
+    log_callback(f"  from disk  cell-by-cell: {file_cellwise_time * 1000:8.1f} ms")
+    log_callback(f"  from disk  block read:   {file_block_time * 1000:8.1f} ms  ({file_cellwise_time / file_block_time:.2f}x)")
+    log_callback(f"  results identical: {same}")
+    return {"rows": rows, "cellwise_s": cellwise_time, "block_s": block_time,
+            "file_cellwise_s": file_cellwise_time, "file_block_s": file_block_time,
+            "identical": same}
+
+# In-memory model: the old dict-of-dicts calendar with str() keys and
+# list-based grade rows vs tuple calendar entries / GradeRow records with
+# date keys
+
+def measure(build):
+    tracemalloc.start()
+    start = time.perf_counter()
+    value = build()
+    elapsed = time.perf_counter() - start
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return value, elapsed, size
+
+def bench_model(dates=20000, rows=50000, log_callback=print):
+    days = [START_DATE + datetime.timedelta(days=i) for i in range(dates)]
+    week, month = datetime.timedelta(days=7), datetime.timedelta(days=28)
+    raw_rows = [(r, tuple(8.1 + i for i in range(6)), tuple(25.0 + i for i in range(6))) for r in range(rows)]
+
+    old_calendar, old_cal_time, old_cal_size = measure(lambda: {
+        str(day).strip(): {"7_days": str(day + week).strip(), "28_days": str(day + month).strip()} for day in days})
+    new_calendar, new_cal_time, new_cal_size = measure(lambda: {
+        date_key(day): (str(day + week).strip(), str(day + month).strip()) for day in days})
+
+    old_rows, old_row_time, old_row_size = measure(lambda: [(r, list(w), list(s)) for r, w, s in raw_rows])
+    new_rows, new_row_time, new_row_size = measure(lambda: [GradeRow(r, w + (None,) + s) for r, w, s in raw_rows])
+
+    start = time.perf_counter()
+    for day in days:
+        old_calendar[str(day).strip()]["7_days"]
+    old_lookup = time.perf_counter() - start
+    start = time.perf_counter()
+    for day in days:
+        new_calendar[date_key(day)][0]
+    new_lookup = time.perf_counter() - start
+
+    mb = 1024 * 1024
+    log_callback(f"{'':<22}{'old':>12}{'new':>12}")
+    log_callback(f"{'calendar build ms':<22}{old_cal_time * 1000:>12.1f}{new_cal_time * 1000:>12.1f}")
+    log_callback(f"{'calendar memory MB':<22}{old_cal_size / mb:>12.2f}{new_cal_size / mb:>12.2f}")
+    log_callback(f"{'calendar lookup ms':<22}{old_lookup * 1000:>12.1f}{new_lookup * 1000:>12.1f}")
+    log_callback(f"{'grade rows build ms':<22}{old_row_time * 1000:>12.1f}{new_row_time * 1000:>12.1f}")
+    log_callback(f"{'grade rows memory MB':<22}{old_row_size / mb:>12.2f}{new_row_size / mb:>12.2f}")
+    return {"calendar_bytes": (old_cal_size, new_cal_size), "row_bytes": (old_row_size, new_row_size),
+            "lookup_s": (old_lookup, new_lookup)}
+
+# Full pipeline, timed per stage
+
+def run_pipeline(dataset, output_folder, stages=None, writer="openpyxl", log_callback=None):
+    return process_combined(dataset["grades"], dataset["office"], output_folder, dataset["calendar"],
+                            "both", log_callback or (lambda message: None), stages=stages, writer=writer)
+
+def bench_suite(sheets=200, grade_files=4, grade_rows=60, dates=120, repeat=3, label="", log_callback=print):
+    grade_files = max(1, min(grade_files, len(GRADES)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        log_callback(f"Generating: {sheets} sheets, {grade_files} grade file(s) x {grade_rows} rows, {dates} dates")
+        dataset = make_dataset(tmp, sheets, grade_files, grade_rows, dates)
+        output_folder = os.path.join(tmp, "out")
+        os.makedirs(output_folder)
+
+        best_total = None
+        best_stages = None
+        copied = 0
+        for _ in range(repeat):
+            timer = StageTimer()
+            start = time.perf_counter()
+            copied = run_pipeline(dataset, output_folder, timer)
+            total = time.perf_counter() - start
+            if best_total is None or total < best_total:
+                best_total, best_stages = total, timer.stages
+
+        # Separate run for memory so tracemalloc overhead does not skew timings
+        tracemalloc.start()
+        run_pipeline(dataset, output_folder)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    result = {
+        "label": label,
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "openpyxl": openpyxl.__version__,
+        "sheets": sheets, "grade_files": grade_files, "grade_rows": grade_rows, "dates": dates,
+        "repeat": repeat, "rows_copied": copied,
+        "total_s": best_total, "peak_mb": peak / (1024 * 1024),
+        "stages": best_stages,
+    }
+
+    log_callback(f"{'stage':<14}{'seconds':>10}{'calls':>7}  counts")
+    for name in STAGE_ORDER:
+        entry = best_stages.get(name)
+        if entry is None:
+            continue
+        counts = ", ".join(f"{k}={v}" for k, v in entry.items() if k not in ("seconds", "calls"))
+        log_callback(f"{name:<14}{entry['seconds']:>10.3f}{entry['calls']:>7}  {counts}")
+    log_callback(f"{'total':<14}{best_total:>10.3f}        peak {result['peak_mb']:.1f} MB (tracemalloc)")
+    return result
+
+def write_results(result, path):
+    if path.lower().endswith(".csv"):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(["label", "sheets", "grade_files", "grade_rows", "dates", "stage", "seconds", "calls", "peak_mb"])
+            size = [result["label"], result["sheets"], result["grade_files"], result["grade_rows"], result["dates"]]
+            for name, entry in result["stages"].items():
+                writer.writerow(size + [name, f"{entry['seconds']:.6f}", entry["calls"], ""])
+            writer.writerow(size + ["total", f"{result['total_s']:.6f}", 1, f"{result['peak_mb']:.2f}"])
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+def compare_results(result, baseline_path, log_callback=print):
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    log_callback(f"\nvs {baseline_path} ({baseline.get('label') or baseline.get('timestamp')}):")
+    for name in STAGE_ORDER + ["total"]:
+        if name == "total":
+            old, new = baseline["total_s"], result["total_s"]
+        elif name in baseline["stages"] and name in result["stages"]:
+            old, new = baseline["stages"][name]["seconds"], result["stages"][name]["seconds"]
+        else:
+            continue
+        ratio = old / new if new else 0.0
+        log_callback(f"  {name:<14}{old:>9.3f}s -> {new:>9.3f}s  ({ratio:.2f}x)")
+    log_callback(f"  {'peak':<14}{baseline['peak_mb']:>8.1f}MB -> {result['peak_mb']:>8.1f}MB")
+
+# openpyxl save vs cube_xlsxpatch, with the two outputs compared cell for
+# cell: value or formula, number format and the cached formula result (what
+# a reader without recalculation sees), plus the recalculate-on-load flag
+
+def compare_workbooks(path_a, path_b, limit=20):
+    wb_a = openpyxl.load_workbook(path_a)
+    wb_b = openpyxl.load_workbook(path_b)
+    cached_a = openpyxl.load_workbook(path_a, data_only=True)
+    cached_b = openpyxl.load_workbook(path_b, data_only=True)
+    differences = []
+    full_calc_a = getattr(wb_a.calculation, "fullCalcOnLoad", None)
+    full_calc_b = getattr(wb_b.calculation, "fullCalcOnLoad", None)
+    if full_calc_a != full_calc_b:
+        differences.append(("<workbook>", "fullCalcOnLoad", full_calc_a, full_calc_b))
+    if wb_a.sheetnames != wb_b.sheetnames:
+        differences.append(("<sheets>", "", wb_a.sheetnames, wb_b.sheetnames))
+    for sheet_name in wb_a.sheetnames:
+        if sheet_name not in wb_b.sheetnames:
+            continue
+        ws_a, ws_b = wb_a[sheet_name], wb_b[sheet_name]
+        cached_ws_a, cached_ws_b = cached_a[sheet_name], cached_b[sheet_name]
+        cells_a = {c.coordinate: c for row in ws_a.iter_rows() for c in row}
+        cells_b = {c.coordinate: c for row in ws_b.iter_rows() for c in row}
+        for coordinate in sorted(set(cells_a) | set(cells_b)):
+            a, b = cells_a.get(coordinate), cells_b.get(coordinate)
+            value_a = (a.value, a.number_format) if a is not None else (None, "General")
+            value_b = (b.value, b.number_format) if b is not None else (None, "General")
+            value_a += (cached_ws_a[coordinate].value,)
+            value_b += (cached_ws_b[coordinate].value,)
+            if value_a != value_b:
+                differences.append((sheet_name, coordinate, value_a, value_b))
+                if len(differences) >= limit:
+                    return differences
+    return differences
+
+def bench_writer(dataset=None, sheets=500, grade_rows=60, dates=120, repeat=3, log_callback=print):
+    with tempfile.TemporaryDirectory() as tmp:
+        if dataset is None:
+            log_callback(f"Generating: {sheets} sheets, 4 grade file(s) x {grade_rows} rows, {dates} dates")
+            dataset = make_dataset(tmp, sheets, 4, grade_rows, dates)
+
+        timings = {}
+        outputs = {}
+        for writer in ["openpyxl", "patch"]:
+            output_folder = os.path.join(tmp, writer)
+            os.makedirs(output_folder)
+            messages = []
+            best = None
+            for _ in range(repeat):
+                timer = StageTimer()
+                start = time.perf_counter()
+                run_pipeline(dataset, output_folder, timer, writer, messages.append)
+                total = time.perf_counter() - start
+                if best is None or total < best[0]:
+                    best = (total, timer.stages)
+            timings[writer] = best
+            outputs[writer] = output_path_for(dataset["office"], output_folder)
+            for message in messages:
+                if "✖" in message or "Fast writer not usable" in message:
+                    log_callback(f"  [{writer}] {message.strip()}")
+                    break
+
+        differences = compare_workbooks(outputs["openpyxl"], outputs["patch"])
+
+    log_callback(f"{'stage':<14}{'openpyxl':>10}{'patch':>10}")
+    for name in STAGE_ORDER + ["total"]:
+        old = timings["openpyxl"][0] if name == "total" else timings["openpyxl"][1].get(name, {}).get("seconds")
+        new = timings["patch"][0] if name == "total" else timings["patch"][1].get(name, {}).get("seconds")
+        if old is None and new is None:
+            continue
+        log_callback(f"{name:<14}{old or 0:>10.3f}{new or 0:>10.3f}")
+    log_callback(f"speedup: {timings['openpyxl'][0] / timings['patch'][0]:.2f}x")
+    if differences:
+        log_callback(f"outputs DIFFER ({len(differences)} shown):")
+        for sheet_name, coordinate, a, b in differences:
+            log_callback(f"  {sheet_name}!{coordinate}: openpyxl={a!r} patch={b!r}")
+    else:
+        log_callback("outputs identical cell for cell (value, number format and cached result)")
+    return {"openpyxl_s": timings["openpyxl"][0], "patch_s": timings["patch"][0], "identical": not differences}
+
+# Planning loops: the compiled layout vs the hard-coded cell targets it
+# replaced, on in-memory inputs (no workbook I/O), plus a wider template
+
+# 9 specimens per row and a 56-day break
+WIDE_PROFILE = {
+    "name": "wide",
+    "keys": {"grade": "B12", "casting_date": "C17"},
+    "grade": [{"source": "B:J", "target": "C25", "label": "Weight"},
+              {"source": "L:T", "target": "C27", "label": "Strength"}],
+    "dates": [{"source": "B", "target": "C18", "label": "7 Days"},
+              {"source": "C", "target": "F18", "label": "28 Days"},
+              {"source": "D", "target": "I18", "label": "56 Days"}],
+}
+
+# The loops as they were before layouts: fixed columns and targets
+def hardcoded_plan(sheet_index, grade_data, calendar_data):
+    plan = {}
+    for grade in grade_data:
+        sheets = sheet_index["grades"].get(grade["grade"], [])
+        for sheet_name, (r, values) in zip(sheets, grade["rows"]):
+            cells = plan.setdefault(sheet_name, {})
+            for i, v in enumerate(values[0:6]):
+                cells[(25, 3 + i)] = v
+            for i, v in enumerate(values[7:13]):
+                cells[(27, 3 + i)] = v
+    for casting_date, sheet_names in sheet_index["dates"].items():
+        entry = calendar_data.get(casting_date)
+        if entry is None:
+            continue
+        for sheet_name in sheet_names:
+            cells = plan.setdefault(sheet_name, {})
+            if entry[0]:
+                cells[(18, 3)] = entry[0]
+            if entry[1]:
+                cells[(18, 6)] = entry[1]
+    return plan
+
+def layout_plan(sheet_index, grade_data, calendar_data, layout):
+    plan = {}
+    events = EventLog(sinks=[])
+    for grade in grade_data:
+        plan_grade_rows(plan, sheet_index, grade, events, set(), layout=layout)
+    plan_calendar_dates(plan, sheet_index, calendar_data, events, layout=layout)
+    return plan
+
+def make_plan_inputs(sheets, dates, width):
+    grades = GRADES[:4]
+    days = [date_key(START_DATE + datetime.timedelta(days=i)) for i in range(dates)]
+    sheet_index = {"grades": {}, "dates": {}}
+    for i in range(sheets):
+        sheet_index["grades"].setdefault(grades[i % len(grades)], []).append(f"Cube {i + 1}")
+        sheet_index["dates"].setdefault(days[i % dates], []).append(f"Cube {i + 1}")
+    rows = sheets // len(grades) + 1
+    grade_data = [{"file": f"{grade}.xlsx", "grade": grade,
+                   "rows": [GradeRow(r, tuple(float(r + c) for c in range(width))) for r in range(2, rows + 2)]}
+                  for grade in grades]
+    calendar_data = {day: tuple(f"{day} +{age}" for age in (7, 28, 56)) for day in days}
+    return sheet_index, grade_data, calendar_data
+
+def bench_layout(sheets=20000, dates=365, repeat=5, log_callback=print):
+    sheet_index, grade_data, calendar_data = make_plan_inputs(sheets, dates, 19)
+    wide = compile_layout(WIDE_PROFILE)
+
+    hard_time, hard_plan = best_of(lambda: hardcoded_plan(sheet_index, grade_data, calendar_data), repeat)
+    std_time, std_plan = best_of(lambda: layout_plan(sheet_index, grade_data, calendar_data, DEFAULT_LAYOUT),
+                                 repeat)
+    wide_time, wide_plan = best_of(lambda: layout_plan(sheet_index, grade_data, calendar_data, wide), repeat)
+    same = std_plan == hard_plan
+
+    def cells(plan):
+        return sum(len(sheet_cells) for sheet_cells in plan.values())
+
+    log_callback(f"Planning {sheets} sheets, {dates} dates (best of {repeat}):")
+    for name, elapsed, plan in (("hard-coded", hard_time, hard_plan), ("standard layout", std_time, std_plan),
+                                ("wide layout", wide_time, wide_plan)):
+        log_callback(f"  {name:<16}{elapsed * 1000:8.1f} ms  {cells(plan):>8} cells  "
+                     f"{cells(plan) / elapsed / 1e6:6.2f} M cells/s")
+    log_callback(f"  standard layout vs hard-coded: {hard_time / std_time:.2f}x, plans identical: {same}")
+    return {"sheets": sheets, "hardcoded_s": hard_time, "standard_s": std_time, "wide_s": wide_time,
+            "identical": same}
+
+# Post-run statistics: NumPy column aggregates vs the plain-Python fallback
+
+def bench_stats(sheets=50000, repeat=3, log_callback=print):
+    import cube_stats
+
+    sheet_index, grade_data, calendar_data = make_plan_inputs(sheets, 365, 13)
+    plan, assignments = {}, {}
+    events = EventLog(sinks=[])
+    for grade in grade_data:
+        plan_grade_rows(plan, sheet_index, grade, events, set(), assignments)
+    table_time, table = best_of(lambda: cube_stats.specimen_table(plan, assignments, DEFAULT_LAYOUT), repeat)
+
+    if cube_stats.numpy_or_none() is None:
+        log_callback("NumPy is not installed; only the plain-Python path can run")
+        return {"identical": True}
+    numpy_time, numpy_stats = best_of(lambda: cube_stats.grade_stats(dict(table), DEFAULT_LAYOUT), repeat)
+    numpy_or_none = cube_stats.numpy_or_none
+    cube_stats.numpy_or_none = lambda: None
+    try:
+        python_time, python_stats = best_of(lambda: cube_stats.grade_stats(dict(table), DEFAULT_LAYOUT), repeat)
+    finally:
+        cube_stats.numpy_or_none = numpy_or_none
+
+    same = all(a == b or abs(a - b) <= 1e-9 * max(abs(a), abs(b))
+               for name in cube_stats.STAT_COLUMNS for a, b in zip(numpy_stats[name], python_stats[name]))
+    log_callback(f"Stats over {len(table['sheet'])} sheets (best of {repeat}):")
+    log_callback(f"  specimen table   {table_time * 1000:8.1f} ms")
+    log_callback(f"  plain Python     {python_time * 1000:8.1f} ms")
+    log_callback(f"  NumPy            {numpy_time * 1000:8.1f} ms  ({python_time / numpy_time:.2f}x)")
+    log_callback(f"  results identical: {same}")
+    return {"table_s": table_time, "python_s": python_time, "numpy_s": numpy_time, "identical": same}
+
+# Cold import time of each entry point in a fresh interpreter (-X importtime).
+# Modules that must stay out of a target's import graph are checked too:
+# the core imports openpyxl lazily, and nothing headless may pull in the GUI.
+
+# Peak memory of a full run on a large generated workbook, each writer in
+# a fresh process (peak RSS is a process high-water mark). The low-memory
+# run is held to a budget of the import floor (a process that has only
+# loaded the pipeline's modules) plus MEMORY_HEADROOM_MB, so the budget
+# tracks the data rather than the interpreter, and a run with a budget
+# below the floor must stop without saving anything. Outputs are compared
+# against the openpyxl run.
+
+MEMORY_HEADROOM_MB = 25
+
+MEMORY_FLOOR = """
+import cube_core, cube_xlsxpatch, openpyxl
+from cube_profile import peak_rss
+print(peak_rss() / 1048576)
+"""
+
+MEMORY_RUN = """
+import json, sys, time
+from cube_core import process_combined
+from cube_profile import peak_rss
+dataset, output_folder, options = json.loads(sys.argv[1])
+errors = []
+def log(message):
+    if "✖" in message:
+        errors.append(message.strip())
+start = time.perf_counter()
+rows = process_combined(dataset["grades"], dataset["office"], output_folder, dataset["calendar"], "both", log,
+                        **options)
+print(json.dumps({"rows": rows, "seconds": time.perf_counter() - start, "peak_mb": peak_rss() / 1048576,
+                  "errors": errors}))
+"""
+
+def _run_python(script, *args):
+    here = os.path.dirname(os.path.abspath(__file__))
+    return subprocess.run([sys.executable, "-c", script, *args], cwd=here, capture_output=True, text=True,
+                          encoding="utf-8")
+
+def memory_floor():
+    proc = _run_python(MEMORY_FLOOR)
+    return float(proc.stdout.strip().splitlines()[-1]) if proc.returncode == 0 else None
+
+def run_in_subprocess(dataset, output_folder, options):
+    proc = _run_python(MEMORY_RUN, json.dumps([dataset, output_folder, options]))
+    if proc.returncode != 0:
+        return {"rows": 0, "seconds": 0.0, "peak_mb": None, "errors": [proc.stderr.strip().splitlines()[-1]]}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+def bench_memory(sheets=3000, grade_rows=800, dates=365, budget_mb=None, log_callback=print):
+    floor = memory_floor()
+    if budget_mb is None:
+        budget_mb = round(floor + MEMORY_HEADROOM_MB)
+    runs = {"openpyxl": {}, "patch": {"writer": "patch"},
+            "low-memory": {"low_memory": True, "memory_budget": budget_mb},
+            "over-budget": {"low_memory": True, "memory_budget": round(floor / 2)}}
+    with tempfile.TemporaryDirectory() as tmp:
+        log_callback(f"Generating: {sheets} sheets, 4 grade file(s) x {grade_rows} rows, {dates} dates")
+        dataset = make_dataset(tmp, sheets, 4, grade_rows, dates)
+        log_callback(f"office workbook: {os.path.getsize(dataset['office']) / 1048576:.1f} MB")
+
+        results = {}
+        for name, options in runs.items():
+            output_folder = os.path.join(tmp, name)
+            os.makedirs(output_folder)
+            results[name] = run_in_subprocess(dataset, output_folder, options)
+            results[name]["output"] = output_path_for(dataset["office"], output_folder)
+
+        for name in ["patch", "low-memory"]:
+            results[name]["identical"] = (not results[name]["errors"] and not results["openpyxl"]["errors"]
+                                          and not compare_workbooks(results["openpyxl"]["output"],
+                                                                    results[name]["output"]))
+        over = results["over-budget"]
+        aborted = (any("Memory budget exceeded" in error for error in over["errors"])
+                   and os.listdir(os.path.dirname(over["output"])) == [])
+
+    log_callback(f"{'run':<12}{'rows':>8}{'seconds':>10}{'peak MB':>10}")
+    log_callback(f"{'imports':<12}{'':>8}{'':>10}{floor:>10.0f}")
+    for name, result in results.items():
+        peak = f"{result['peak_mb']:>10.0f}" if result["peak_mb"] is not None else f"{'?':>10}"
+        log_callback(f"{name:<12}{result['rows']:>8}{result['seconds']:>10.2f}{peak}")
+        for error in result["errors"]:
+            log_callback(f"  [{name}] {error.splitlines()[0]}")
+
+    low = results["low-memory"]
+    within = not low["errors"] and low["peak_mb"] is not None and low["peak_mb"] <= budget_mb
+    log_callback(f"low-memory peak {'within' if within else 'OVER'} the {budget_mb:g} MB budget")
+    log_callback("over-budget run stopped, nothing saved" if aborted else "over-budget run was NOT stopped cleanly")
+    log_callback("outputs identical to openpyxl" if low["identical"] and results["patch"]["identical"]
+                 else "outputs DIFFER from openpyxl")
+    return {"floor_mb": floor, "budget_mb": budget_mb,
+            "runs": {name: {key: value for key, value in result.items() if key != "output"}
+                     for name, result in results.items()},
+            "within_budget": within, "aborted": aborted, "identical": low["identical"]}
+
+STARTUP_TARGETS = ["cube_core", "cube_batch", "cube_plan", "cube_watch", "Cube"]
+STARTUP_BUDGET_MS = {"cube_core": 100, "cube_batch": 120, "cube_plan": 120, "cube_watch": 120, "Cube": 1000}
+STARTUP_FORBIDDEN = {
+    "cube_core": ["openpyxl", "customtkinter", "tkinter", "PIL", "winreg"],
+    "cube_batch": ["openpyxl", "customtkinter", "tkinter", "PIL", "winreg"],
+    "cube_plan": ["openpyxl", "customtkinter", "tkinter", "PIL", "winreg"],
+    "cube_watch": ["openpyxl", "customtkinter", "tkinter", "PIL", "winreg"],
+    "Cube": ["openpyxl", "customtkinter", "tkinter", "PIL"],
+}
+
+def import_times(module):
+    here = os.path.dirname(os.path.abspath(__file__))
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                          cwd=here, capture_output=True, text=True)
+    if proc.returncode != 0:
+        return None, proc.stderr.strip().splitlines()[-1]
+    # One line per module, children before their parent; nesting is two
+    # extra spaces per level after the bar
+    lines = []
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        lines.append((name.strip(), int(cumulative_us) / 1000, depth))
+
+    # The target's own subtree: the lines after the previous top-level import
+    end = next(i for i, (name, _, depth) in enumerate(lines) if name == module and depth == 0)
+    start = max((i for i in range(end) if lines[i][2] == 0), default=-1) + 1
+    subtree = lines[start:end + 1]
+    return {name: (ms, depth) for name, ms, depth in subtree}, None
+
+def bench_startup(targets=None, repeat=5, budgets=None, top=8, log_callback=print):
+    budgets = dict(STARTUP_BUDGET_MS, **(budgets or {}))
+    results = {}
+    ok = True
+    for target in targets or STARTUP_TARGETS:
+        best = None
+        for _ in range(repeat):
+            times, error = import_times(target)
+            if times is None:
+                break
+            if best is None or times[target][0] < best[target][0]:
+                best = times
+        if best is None:
+            log_callback(f"{target:<12} skipped ({error})")
+            continue
+
+        total = best[target][0]
+        budget = budgets.get(target)
+        forbidden = [name for name in STARTUP_FORBIDDEN.get(target, []) if name in best]
+        passed = (budget is None or total <= budget) and not forbidden
+        ok = ok and passed
+        results[target] = {"ms": total, "budget_ms": budget, "forbidden": forbidden, "ok": passed}
+
+        budget_text = f" / budget {budget:.0f} ms" if budget is not None else ""
+        log_callback(f"{target:<12}{total:>8.1f} ms{budget_text}  {'ok' if passed else 'OVER BUDGET'}")
+        if forbidden:
+            log_callback(f"  imports {', '.join(forbidden)} eagerly")
+        # Heaviest direct imports of the target
+        children = sorted(((ms, name) for name, (ms, depth) in best.items() if depth == 1), reverse=True)
+        for ms, name in children[:top]:
+            log_callback(f"    {name:<28}{ms:>8.1f} ms")
+    return {"targets": results, "ok": ok}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cube Data Processor benchmarks")
+    commands = parser.add_subparsers(dest="command")
+
+    suite = commands.add_parser("suite", help="time every stage of a full run on synthetic workbooks")
+    suite.add_argument("--sheets", type=int, default=200, help="office sheets")
+    suite.add_argument("--grade-files", type=int, default=4, help=f"grade workbooks (max {len(GRADES)})")
+    suite.add_argument("--grade-rows", type=int, default=60, help="rows per grade workbook")
+    suite.add_argument("--dates", type=int, default=120, help="calendar dates")
+    suite.add_argument("--repeat", type=int, default=3)
+    suite.add_argument("--label", default="", help="name stored with the results, e.g. a version")
+    suite.add_argument("--out", default=None, help="write results to a .json or .csv file")
+    suite.add_argument("--compare", default=None, help="earlier .json results to compare against")
+
+    grade_read = commands.add_parser("grade-read", help="cell-by-cell vs block read of a grade sheet")
+    grade_read.add_argument("--rows", type=int, default=10000, help="grade sheet rows")
+    grade_read.add_argument("--repeat", type=int, default=5)
+
+    model = commands.add_parser("model", help="memory/speed of the in-memory calendar and grade records")
+    model.add_argument("--dates", type=int, default=20000, help="calendar dates")
+    model.add_argument("--rows", type=int, default=50000, help="grade rows")
+
+    writer = commands.add_parser("writer", help="openpyxl save vs the cell-patch writer, outputs verified")
+    writer.add_argument("--sheets", type=int, default=500, help="office sheets")
+    writer.add_argument("--grade-rows", type=int, default=60, help="rows per grade workbook")
+    writer.add_argument("--dates", type=int, default=120, help="calendar dates")
+    writer.add_argument("--repeat", type=int, default=3)
+    writer.add_argument("--office", default=None, help="verify a real template instead of synthetic data")
+    writer.add_argument("-g", "--grades", nargs="*", default=[], help="grade files for --office")
+    writer.add_argument("-c", "--calendar", default="", help="calendar workbook for --office")
+
+    layout = commands.add_parser("layout", help="compiled layout plans vs the hard-coded cell targets")
+    layout.add_argument("--sheets", type=int, default=20000, help="office sheets")
+    layout.add_argument("--dates", type=int, default=365, help="calendar dates")
+    layout.add_argument("--repeat", type=int, default=5)
+
+    stats = commands.add_parser("stats", help="NumPy vs plain-Python per-grade statistics")
+    stats.add_argument("--sheets", type=int, default=50000, help="sheets with a grade row")
+    stats.add_argument("--repeat", type=int, default=3)
+
+    memory = commands.add_parser("memory", help="peak RSS of each writer on a large workbook, low-memory budget enforced")
+    memory.add_argument("--sheets", type=int, default=3000, help="office sheets")
+    memory.add_argument("--grade-rows", type=int, default=800, help="rows per grade workbook")
+    memory.add_argument("--dates", type=int, default=365, help="calendar dates")
+    memory.add_argument("--budget", type=float, default=None, metavar="MB",
+                        help=f"low-memory run budget (default: import floor + {MEMORY_HEADROOM_MB} MB)")
+
+    startup = commands.add_parser("startup", help="cold import time of each entry point, against a budget")
+    startup.add_argument("targets", nargs="*", help=f"modules (default: {', '.join(STARTUP_TARGETS)})")
+    startup.add_argument("--repeat", type=int, default=5)
+    startup.add_argument("--budget", action="append", default=[], metavar="MODULE=MS",
+                         help="override a budget, e.g. cube_core=80")
+    startup.add_argument("--out", default=None, help="write results to a .json file")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        budgets = {}
+        for item in args.budget:
+            name, _, ms = item.partition("=")
+            budgets[name] = float(ms)
+        result = bench_startup(args.targets or None, args.repeat, budgets)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+        return 0 if result["ok"] else 1
+
+    if args.command == "writer":
+        dataset = None
+        if args.office:
+            dataset = {"office": args.office, "grades": args.grades, "calendar": args.calendar}
+        result = bench_writer(dataset, args.sheets, args.grade_rows, args.dates, args.repeat)
+        return 0 if result["identical"] else 1
+
+    if args.command == "memory":
+        result = bench_memory(args.sheets, args.grade_rows, args.dates, args.budget)
+        return 0 if result["within_budget"] and result["aborted"] and result["identical"] else 1
+
+    if args.command == "stats":
+        result = bench_stats(args.sheets, args.repeat)
+        return 0 if result["identical"] else 1
+
+    if args.command == "layout":
+        result = bench_layout(args.sheets, args.dates, args.repeat)
+        return 0 if result["identical"] else 1
+
+    if args.command == "model":
+        bench_model(args.dates, args.rows)
+        return 0
+
+    if args.command == "grade-read":
+        result = bench_grade_read(args.rows, args.repeat)
+        return 0 if result["identical"] else 1
+
+    if args.command is None:
+        args = parser.parse_args(["suite"] + list(argv or []))
+
+    result = bench_suite(args.sheets, args.grade_files, args.grade_rows, args.dates, args.repeat, args.label)
+    if args.out:
+        write_results(result, args.out)
+    if args.compare:
+        compare_results(result, args.compare)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
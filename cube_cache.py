@@ -0,0 +1,118 @@
+import hashlib
+import os
+import pickle
+
+from cube_core import atomic_write
+
+# On-disk cache of parsed input workbooks (calendar dict, grade rows).
+# Entries are keyed by kind + absolute path + mtime + size (+ an optional
+# variant such as the sheet selection), stored as pickles, and evicted least-recently-used once the folder exceeds max_bytes.
+
+CACHE_VERSION = 5
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def default_cache_dir():
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".cache"))
+    return os.path.join(base, "CubeDataProcessor", "cache")
+
+class ParseCache:
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES, enabled=True):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def _entry_path(self, kind, path, variant=None):
+        st = os.stat(path)
+        key = f"{CACHE_VERSION}|{kind}|{os.path.abspath(path)}|{st.st_mtime_ns}|{st.st_size}|{variant}"
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{kind}-{digest}.pkl")
+
+    def get_or_load(self, kind, path, loader, variant=None):
+        if not self.enabled:
+            return loader()
+
+        value = self.lookup(kind, path, variant)
+        if value is None:
+            value = loader()
+            self.store(kind, path, value, variant)
+        return value
+
+    # Split form of get_or_load for callers that parse misses elsewhere
+    # (e.g. in a process pool): lookup returns None on a miss.
+    def lookup(self, kind, path, variant=None):
+        if not self.enabled:
+            return None
+        try:
+            entry_path = self._entry_path(kind, path, variant)
+            with open(entry_path, "rb") as f:
+                value = pickle.load(f)
+            # Touch so eviction sees this entry as recently used
+            os.utime(entry_path)
+            self.hits += 1
+            return value
+        except Exception:
+            self.misses += 1
+            return None
+
+    def store(self, kind, path, value, variant=None):
+        if not self.enabled:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            entry_path = self._entry_path(kind, path, variant)
+
+            def write(tmp_path):
+                with open(tmp_path, "wb") as f:
+                    pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            atomic_write(entry_path, write)
+            self._evict()
+        except Exception:
+            # The cache is an optimisation only; never fail a run over it
+            pass
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(".pkl"):
+                continue
+            entry_path = os.path.join(self.cache_dir, name)
+            try:
+                st = os.stat(entry_path)
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, entry_path))
+        return entries
+
+    def _evict(self):
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, entry_path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+                total -= size
+            except OSError:
+                pass
+
+    def clear(self):
+        if not os.path.isdir(self.cache_dir):
+            return 0
+        removed = 0
+        for _, _, entry_path in self._entries():
+            try:
+                os.remove(entry_path)
+                removed += 1
+            except OSError:
+                pass
+        return removed
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self):
+        return f"Cache: {self.hits} hit(s), {self.misses} miss(es)"
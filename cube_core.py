@@ -0,0 +1,765 @@
+import os
+from collections import namedtuple
+
+from cube_dates import normalize_date
+from cube_layout import DEFAULT_LAYOUT, grade_picker
+from cube_log import ROW, SHEET, SUMMARY, as_event_log
+from cube_manifest import (build_manifest, calendar_hashes, changed_sheets, check_reusable, input_changes,
+                           load_manifest, manifest_path_for, row_hashes, save_manifest)
+from cube_profile import NULL_STAGES, MemoryBudget, MemoryBudgetExceeded, peak_rss
+
+# Processing core shared by the GUI (Cube.py) and the headless batch engine
+# (cube_batch.py). Keep this module free of customtkinter/winsound/winreg so
+# it can be imported on Linux servers. openpyxl, the process pool and the
+# patch writer are imported where they are first used, so importing the
+# core stays cheap and the GUI window can appear before openpyxl is loaded
+# (see `cube_bench.py startup`).
+
+# Compact record for a parsed grade row (tuple-sized, no per-instance
+# dict): its source row number and the row's values from column B on.
+# Calendar entries are plain tuples of the date texts from column B on.
+# Which values go where is decided by the layout (see cube_layout).
+GradeRow = namedtuple("GradeRow", ["row", "values"])
+
+# Calendar / C17 lookup key: the canonical datetime.date (see cube_dates),
+# or the stripped text when the value is not a recognisable date
+def date_key(value):
+    return normalize_date(value) or str(value).strip()
+
+def unresolved_dates(keys):
+    return [key for key in keys if isinstance(key, str)]
+
+def describe_unresolved(keys, limit=5):
+    examples = ", ".join(repr(key) for key in keys[:limit])
+    return examples + (", ..." if len(keys) > limit else "")
+
+# Smart grade extraction
+def extract_grade(filename):
+    name = os.path.basename(filename).split('.')[0].upper()
+
+    if "MORTAR" in name and "_" in name:
+        parts = name.split("_")
+        if len(parts) >= 3:
+            ratio = f"{parts[-2]}:{parts[-1]}"
+            return ratio
+
+    name = name.replace("_", "").replace("-", "")
+    return name.strip()
+
+# Pull a data region (default B:N from row 2; max_col=None reads each row to
+# its last cell) in one iter_rows call and cut it at the first blank key
+# cell (the first column of the region).
+def read_data_block(ws, min_col=2, max_col=14, min_row=2):
+    block = []
+    for values in ws.iter_rows(min_row=min_row, max_row=ws.max_row,
+                               min_col=min_col, max_col=max_col, values_only=True):
+        if not values or values[0] in (None, ""):
+            break
+        block.append(values)
+    return block
+
+def load_workbook_safe(filepath):
+    import openpyxl
+    try:
+        wb = openpyxl.load_workbook(filepath, keep_vba=False, data_only=False, keep_links=False)
+        return wb
+    except:
+        wb = openpyxl.load_workbook(filepath)
+        return wb
+
+# Streaming loader for input-only workbooks (calendar, grade files). Rows
+# are read straight from the XML without building cell objects.
+def load_workbook_readonly(filepath):
+    import openpyxl
+    return openpyxl.load_workbook(filepath, read_only=True, data_only=False, keep_links=False)
+
+def iter_sheet_rows(ws, min_col, max_col):
+    # Some exporters write a wrong <dimension> tag; ignore it and stream
+    # until the data runs out.
+    ws.reset_dimensions()
+    return ws.iter_rows(min_row=2, min_col=min_col, max_col=max_col, values_only=True)
+
+# Every file the tools write goes through here: writer(tmp_path) writes a
+# temp file next to path, which is then renamed into place, so a crash
+# mid-write never leaves a half-written file behind. On any failure the
+# temp file is removed and the error re-raised.
+def atomic_write(path, writer):
+    folder, name = os.path.split(path)
+    tmp_path = os.path.join(folder, f".~{name}.{os.getpid()}.tmp")
+    try:
+        writer(tmp_path)
+        os.replace(tmp_path, path)
+    except:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def save_workbook_atomic(wb, outpath):
+    atomic_write(outpath, wb.save)
+
+# Input sources: "book.xlsx" reads the active sheet, "book.xlsx#Sheet" one
+# named sheet and "book.xlsx#*" every sheet in workbook order. Several
+# sources are merged in the order given; the first one to define a date or
+# grade wins.
+def split_source(spec):
+    if os.path.exists(spec) or "#" not in spec:
+        return spec, None
+    path, sheet = spec.rsplit("#", 1)
+    return path, sheet or None
+
+def as_source_list(sources):
+    if not sources:
+        return []
+    if isinstance(sources, str):
+        return [sources]
+    return list(sources)
+
+def select_sheets(wb, sheet):
+    if sheet is None:
+        return [wb.active]
+    if sheet == "*":
+        return wb.worksheets
+    return [wb[sheet]]
+
+def cached_parse(cache, kind, path, sheet, loader):
+    if cache is None:
+        return loader()
+    return cache.get_or_load(kind, path, loader, variant=sheet)
+
+def read_calendar_sheet(ws):
+    calendar_dict = {}
+
+    # Every column after the casting date, so a layout can take 7/28/56-day
+    # dates from any of them
+    for values in iter_sheet_rows(ws, 1, None):
+        if not values or not values[0]:
+            break
+
+        calendar_dict[date_key(values[0])] = tuple(str(value).strip() if value else "" for value in values[1:])
+
+    return calendar_dict
+
+# One calendar dict per selected sheet
+def read_calendar(calendar_file, sheet=None):
+    wb = load_workbook_readonly(calendar_file)
+    try:
+        return [read_calendar_sheet(ws) for ws in select_sheets(wb, sheet)]
+    finally:
+        wb.close()
+
+# Merge calendar parts in precedence order: a later part only fills dates
+# the earlier ones lack. Returns the merged dict and the dates whose later
+# entries disagreed with the one kept.
+def merge_calendars(parts):
+    merged = {}
+    conflicts = []
+    for part in parts:
+        for key, entry in part.items():
+            current = merged.get(key)
+            if current is None:
+                merged[key] = entry
+            elif current != entry:
+                conflicts.append(key)
+    return merged, conflicts
+
+# calendar_file is one source or a list of them (see split_source). cache
+# is an optional cube_cache.ParseCache; without one every file is parsed.
+def load_calendar_data(calendar_file, log_callback, cache=None):
+    try:
+        parts = []
+        for source in as_source_list(calendar_file):
+            path, sheet = split_source(source)
+            if not os.path.exists(path):
+                log_callback(f"⚠ Calendar file not found: {path}")
+                continue
+            parts.extend(cached_parse(cache, "calendar", path, sheet, lambda: read_calendar(path, sheet)))
+
+        if not parts:
+            log_callback("⚠ No calendar file selected")
+            return None
+
+        calendar_dict, conflicts = merge_calendars(parts)
+
+        log_callback(f"✓ Calendar loaded: {len(calendar_dict)} dates")
+        if len(parts) > 1:
+            log_callback(f"  merged from {len(parts)} calendar sheet(s), "
+                         f"{len(conflicts)} conflicting date(s) resolved by source order")
+        unresolved = unresolved_dates(calendar_dict)
+        if unresolved:
+            log_callback(f"⚠ Calendar dates not recognised: {len(unresolved)} ({describe_unresolved(unresolved)})")
+        return calendar_dict
+
+    except Exception as e:
+        log_callback(f"✖ Calendar load error: {e}")
+        return None
+
+# A grade sheet holds one grade (taken from the file or sheet name) unless
+# A1 is a grade column header; then column A names each row's grade and
+# the data stays in B:N.
+GRADE_COLUMN_HEADERS = {"GRADE", "MIX", "MIX GRADE", "CONCRETE GRADE"}
+
+def read_grade_sheet(ws):
+    # Stale <dimension> tags would make max_row too small
+    ws.reset_dimensions()
+    header = next(ws.iter_rows(min_row=1, max_row=1, max_col=1, values_only=True), (None,))[0]
+
+    if str(header or "").strip().upper() not in GRADE_COLUMN_HEADERS:
+        return [(None, [GradeRow(r, values)
+                        for r, values in enumerate(read_data_block(ws, max_col=None), start=2)])]
+
+    groups = {}
+    for r, values in enumerate(read_data_block(ws, min_col=1, max_col=None), start=2):
+        name = str(values[0]).strip()
+        group = groups.setdefault(normalize_grade(name), (name, []))
+        group[1].append(GradeRow(r, values[1:]))
+    return list(groups.values())
+
+# Parse one grade source into plain data so it can be reused across office
+# files (and pickled to batch workers) without reopening the file. Returns
+# (grade name or None, rows) groups of GradeRow records.
+def read_grade_rows(grade_file, sheet=None):
+    grade_wb = load_workbook_readonly(grade_file)
+    try:
+        groups = []
+        for ws in select_sheets(grade_wb, sheet):
+            for name, rows in read_grade_sheet(ws):
+                # A single-grade sheet picked by name is named after the sheet
+                if name is None and sheet is not None:
+                    name = ws.title
+                groups.append((name, rows))
+    finally:
+        grade_wb.close()
+
+    return groups
+
+# One {"file", "grade", "rows"} dict per grade found in the source
+def load_grade_data(grade_file, cache=None):
+    path, sheet = split_source(grade_file)
+    groups = cached_parse(cache, "grade", path, sheet, lambda: read_grade_rows(path, sheet))
+    return grade_dicts(grade_file, groups)
+
+def grade_dicts(grade_file, groups):
+    path, _ = split_source(grade_file)
+    return [{"file": grade_file, "grade": name if name is not None else extract_grade(path), "rows": rows}
+            for name, rows in groups]
+
+def _read_grade_source(grade_file):
+    return read_grade_rows(*split_source(grade_file))
+
+# Parse grade sources, several at once when workers allows: 1 is serial,
+# None uses one process per CPU. Grade workbooks are independent, so the
+# ones missing from the parse cache go to a process pool; results come back
+# in file order, so the row -> sheet assignment does not depend on timing.
+# If the pool cannot start or dies, the remaining files are parsed here.
+def parse_grade_sources(grade_files, cache=None, workers=1):
+    groups = [None] * len(grade_files)
+    todo = []
+    for i, grade_file in enumerate(grade_files):
+        if cache is not None:
+            path, sheet = split_source(grade_file)
+            groups[i] = cache.lookup("grade", path, sheet)
+        if groups[i] is None:
+            todo.append(i)
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(todo))
+
+    if workers > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        from concurrent.futures.process import BrokenProcessPool
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                for i, value in zip(todo, pool.map(_read_grade_source, [grade_files[i] for i in todo])):
+                    groups[i] = value
+        except (BrokenProcessPool, OSError):
+            pass
+
+    for i in todo:
+        if groups[i] is None:
+            groups[i] = _read_grade_source(grade_files[i])
+        if cache is not None:
+            path, sheet = split_source(grade_files[i])
+            cache.store("grade", path, groups[i], sheet)
+
+    return groups
+
+# Merge per-source grade lists in precedence order: the first source that
+# provides a grade wins and later copies of it are reported and dropped.
+# seen ({grade key: file}) carries the precedence across calls.
+def merge_grade_data(sources, log_callback=None, seen=None):
+    merged = []
+    seen = {} if seen is None else seen
+    for grades in sources:
+        for grade in grades:
+            key = normalize_grade(grade["grade"])
+            if key in seen:
+                if log_callback is not None:
+                    log_callback(f"⚠ Grade {grade['grade']} in {os.path.basename(grade['file'])} ignored: "
+                                 f"already loaded from {os.path.basename(seen[key])}")
+                continue
+            seen[key] = grade["file"]
+            merged.append(grade)
+    return merged
+
+def load_all_grade_data(grade_files, cache=None, log_callback=None, workers=1):
+    groups = parse_grade_sources(grade_files, cache, workers)
+    return merge_grade_data([grade_dicts(grade_file, file_groups)
+                             for grade_file, file_groups in zip(grade_files, groups)], log_callback)
+
+# Low-memory counterpart of load_all_grade_data: grade sources are parsed
+# one at a time, in order, and their grades yielded with the same
+# precedence, so at most one grade workbook is open and each source's rows
+# can be dropped once they are planned.
+def iter_grade_data(grade_files, cache=None, log_callback=None, stages=NULL_STAGES):
+    seen = {}
+    for grade_file in grade_files:
+        with stages.stage("grade_load"):
+            grades = load_grade_data(grade_file, cache)
+        yield from merge_grade_data([grades], log_callback, seen)
+        grades = None
+
+def normalize_grade(value):
+    return str(value).replace(" ", "").upper()
+
+# The grade and casting date key cells of a sheet (B12 and C17 in the
+# standard layout). A read-only sheet is streamed once over the rows and
+# columns spanning both rather than re-scanned from the top for each cell.
+def sheet_keys(ws, layout=DEFAULT_LAYOUT):
+    from openpyxl.worksheet._read_only import ReadOnlyWorksheet
+    (grade_row, grade_col), (date_row, date_col) = layout.grade_cell, layout.date_cell
+    if not isinstance(ws, ReadOnlyWorksheet):
+        return ws.cell(grade_row, grade_col).value, ws.cell(date_row, date_col).value
+    min_row, min_col = min(grade_row, date_row), min(grade_col, date_col)
+    max_row, max_col = max(grade_row, date_row), max(grade_col, date_col)
+    rows = list(ws.iter_rows(min_row=min_row, max_row=max_row, min_col=min_col, max_col=max_col,
+                             values_only=True))
+    rows += [(None,) * (max_col - min_col + 1)] * (max_row - min_row + 1 - len(rows))
+    return rows[grade_row - min_row][grade_col - min_col], rows[date_row - min_row][date_col - min_col]
+
+# One pass over the office workbook (full or read-only): normalized grade
+# key -> sheets and casting date key -> sheets, both in workbook order.
+# check, if given, is called every CHECK_EVERY sheets.
+CHECK_EVERY = 200
+
+def build_sheet_index(office_wb, layout=DEFAULT_LAYOUT, check=None):
+    grade_index = {}
+    date_index = {}
+
+    for sheet_pos, sheet_name in enumerate(office_wb.sheetnames):
+        if check is not None and sheet_pos % CHECK_EVERY == 0:
+            check()
+        grade_value, casting_date_cell = sheet_keys(office_wb[sheet_name], layout)
+
+        if grade_value:
+            grade_index.setdefault(normalize_grade(grade_value), []).append(sheet_name)
+
+        if casting_date_cell:
+            date_index.setdefault(date_key(casting_date_cell), []).append(sheet_name)
+
+    return {"grades": grade_index, "dates": date_index}
+
+def output_path_for(office_file, output_folder, suffix="_Processed.xlsx"):
+    base = os.path.basename(office_file).split(".")[0]
+    return os.path.join(output_folder, f"{base}{suffix}")
+
+class ProcessingCancelled(Exception):
+    pass
+
+def process_combined(grade_files, office_file, output_folder, calendar_file, mode, log_callback,
+                     calendar_data=None, grade_data=None, cache=None,
+                     progress_callback=None, cancel_event=None, stages=None, incremental=False,
+                     grade_workers=1, writer="openpyxl", layout=None, stats=None,
+                     low_memory=False, memory_budget=None):
+    # calendar_data / grade_data may be passed in pre-parsed (batch mode);
+    # otherwise they are loaded from calendar_file / grade_files here.
+    # progress_callback receives a 0..1 fraction; setting cancel_event (a
+    # threading.Event) stops the run before anything is saved. stages is a
+    # cube_profile recorder (StageTimer, RunProfiler) timing each phase; its
+    # summary is appended to the log. incremental=True patches only the
+    # changed sheets of an existing output (see cube_manifest). grade_workers
+    # parses grade files in parallel (see parse_grade_sources). writer is
+    # one of WRITERS. layout is a compiled cube_layout.Layout (default: the
+    # standard B12/C17 template). stats, one of cube_stats.STATS_FORMATS,
+    # also exports the written specimens and per-grade aggregates.
+    # low_memory keeps the run's footprint flat for very large workbooks:
+    # the patch writer only (no openpyxl fallback), grade sources parsed
+    # one at a time and released once planned. memory_budget (MB) is a hard
+    # RSS limit checked at every checkpoint; a run that exceeds it stops
+    # with an error and saves nothing.
+    stages = stages or NULL_STAGES
+    layout = layout or DEFAULT_LAYOUT
+
+    # log_callback may be a cube_log.EventLog or a plain function (summary level)
+    events = as_event_log(log_callback)
+
+    with stages.run():
+        total = _run_combined(grade_files, office_file, output_folder, calendar_file, mode, events,
+                              calendar_data, grade_data, cache, progress_callback, cancel_event, stages,
+                              incremental, grade_workers, writer, layout, stats, low_memory, memory_budget)
+    stages.report(events)
+    if low_memory or memory_budget:
+        peak = peak_rss()
+        if peak is not None:
+            budget = f" (budget {memory_budget:g} MB)" if memory_budget else ""
+            events.emit(SUMMARY, "memory", f"Peak RSS: {peak / 1048576:.0f} MB{budget}",
+                        peak_mb=round(peak / 1048576), budget_mb=memory_budget)
+    return total
+
+# The cells to write, per sheet: {sheet_name: {(row, column): value}}. The
+# layout's compiled (source index, target) pairs are applied as they are;
+# short rows are padded once per row, not checked per cell.
+def plan_grade_rows(plan, sheet_index, grade, events, matched_grades, assignments=None, layout=DEFAULT_LAYOUT):
+    per_sheet = events.enabled(SHEET)
+    per_row = events.enabled(ROW)
+
+    grade_name = grade["grade"]
+    rows = grade["rows"]
+
+    grade_normalized = normalize_grade(grade_name)
+    matched_grades.add(grade_normalized)
+    matching_sheets = sheet_index["grades"].get(grade_normalized, [])
+
+    events.emit(SUMMARY, "grade_file",
+                f"\nProcessing: {os.path.basename(grade['file'])}\n"
+                f"Looking for grade: {grade_name}\n"
+                f"Data rows: {len(rows)}",
+                grade=grade_name, file=grade["file"], rows=len(rows))
+
+    if per_sheet:
+        for sheet_name in matching_sheets:
+            events.emit(SHEET, "sheet_matched", f"  ✓ Matched sheet: {sheet_name} (grade={grade_normalized})",
+                        sheet=sheet_name, grade=grade_name)
+
+    events.emit(SUMMARY, "grade_matched", f"Total matching sheets: {len(matching_sheets)}",
+                grade=grade_name, sheets=len(matching_sheets))
+
+    if len(matching_sheets) == 0:
+        events.emit(SUMMARY, "warning", f"⚠ No sheets found with grade '{grade_name}'", grade=grade_name)
+        return 0
+
+    sheet_pos = 0
+    targets = layout.grade_targets
+    pick = grade_picker(layout)
+    width = layout.grade_width
+
+    for r, values in rows:
+        if sheet_pos >= len(matching_sheets):
+            events.emit(SUMMARY, "warning", f"⚠ More data rows than available sheets",
+                        grade=grade_name, row=r)
+            break
+
+        current_sheet_name = matching_sheets[sheet_pos]
+        if len(values) < width:
+            values = tuple(values) + (None,) * (width - len(values))
+        plan.setdefault(current_sheet_name, {}).update(zip(targets, pick(values)))
+
+        if assignments is not None:
+            assignments.setdefault(current_sheet_name, {}).update(grade=grade_name, file=grade["file"], row=r)
+        if per_row:
+            events.emit(ROW, "row_copied", f"  ✓ Row {r} → {current_sheet_name}",
+                        sheet=current_sheet_name, row=r, grade=grade_name)
+        sheet_pos += 1
+
+    return sheet_pos
+
+def plan_calendar_dates(plan, sheet_index, calendar_data, events, check_cancel=None, assignments=None,
+                        layout=DEFAULT_LAYOUT):
+    per_sheet = events.enabled(SHEET)
+
+    updated_count = 0
+    missing_count = 0
+    unresolved = []
+
+    for date_pos, (casting_date, sheet_names) in enumerate(sheet_index["dates"].items()):
+        if check_cancel is not None and date_pos % 50 == 0:
+            check_cancel()
+
+        entry = calendar_data.get(casting_date)
+
+        if entry is None:
+            missing_count += len(sheet_names)
+            if isinstance(casting_date, str):
+                unresolved.append(casting_date)
+            if assignments is not None:
+                for sheet_name in sheet_names:
+                    assignments.setdefault(sheet_name, {}).update(date=casting_date, date_missing=True)
+            if per_sheet:
+                for sheet_name in sheet_names:
+                    events.emit(SHEET, "date_missing", f"⚠ Date not in calendar: {casting_date} ({sheet_name})",
+                                sheet=sheet_name, date=casting_date)
+            continue
+
+        # Resolved once per casting date; blank calendar cells are not written
+        writes = [(target, entry[index]) for index, target, _ in layout.date_writes
+                  if index < len(entry) and entry[index]]
+        if assignments is not None or per_sheet:
+            dates = {label: entry[index] if index < len(entry) else "" for index, _, label in layout.date_writes}
+
+        for sheet_name in sheet_names:
+            plan.setdefault(sheet_name, {}).update(writes)
+
+            updated_count += 1
+            if assignments is not None:
+                assignments.setdefault(sheet_name, {}).update(date=casting_date, dates=dates)
+            if per_sheet:
+                filled = ", ".join(f"{label}:{value}" for label, value in dates.items())
+                events.emit(SHEET, "date_filled", f"✓ {sheet_name}: {casting_date} → {filled}",
+                            sheet=sheet_name, date=casting_date, dates=dates)
+
+    return updated_count, missing_count, unresolved
+
+def apply_write_plan(office_wb, plan, sheet_names=None):
+    for sheet_name in (plan if sheet_names is None else sheet_names):
+        ws = office_wb[sheet_name]
+        for (row, column), value in plan[sheet_name].items():
+            ws.cell(row=row, column=column, value=value)
+
+# "openpyxl" loads, edits and re-saves the whole workbook; "patch" edits
+# only the target cells in the sheet XML (see cube_xlsxpatch) and falls
+# back to openpyxl for workbooks or values it cannot handle.
+WRITERS = ["openpyxl", "patch"]
+
+# fallback=False reports the error and returns False instead of loading
+# the workbook into openpyxl (low-memory runs cannot afford the object model).
+def write_patched(source, outpath, plan, sheet_names, events, fallback=True, check=None):
+    from cube_xlsxpatch import UnsupportedPatch, patch_workbook
+    try:
+        patch_workbook(source, outpath, plan, sheet_names, check)
+    except UnsupportedPatch as e:
+        if not fallback:
+            events.emit(SUMMARY, "error", f"✖ Low-memory mode cannot write this workbook ({e}) - "
+                        f"nothing was saved", reason=str(e))
+            return False
+        events.emit(SUMMARY, "warning", f"⚠ Fast writer not usable ({e}), saving with openpyxl", reason=str(e))
+        office_wb = load_workbook_safe(source)
+        apply_write_plan(office_wb, plan, sheet_names)
+        save_workbook_atomic(office_wb, outpath)
+        office_wb.close()
+    return True
+
+# Grade and date stages: the complete write plan for an indexed office
+# workbook. Returns (plan, {grade: row hashes} of the grades used, rows
+# copied); grade rows are not kept once planned. When assignments is a
+# dict it also receives, per sheet, the grade row and calendar entry chosen
+# for it (plan mode reports these). low_memory streams the grade files with
+# iter_grade_data instead of loading them all first.
+def compute_plan(sheet_index, mode, grade_files, grade_data, calendar_data, events, stages=NULL_STAGES,
+                 cache=None, grade_workers=1, report=None, check_cancel=None, assignments=None,
+                 layout=DEFAULT_LAYOUT, low_memory=False):
+    report = report or (lambda fraction: None)
+    check_cancel = check_cancel or (lambda: None)
+    total_copy_count = 0
+    plan = {}
+    grade_rows = {}
+
+    if mode in ["grade_only", "both"] and (grade_files or grade_data):
+        events(f"\n--- GRADE PROCESSING ---")
+
+        matched_grades = set()
+
+        if grade_data is None and low_memory:
+            grade_data = iter_grade_data(grade_files, cache, events, stages)
+            grade_count = len(grade_files)
+        else:
+            if grade_data is None:
+                with stages.stage("grade_load"):
+                    grade_data = load_all_grade_data(grade_files, cache, events, grade_workers)
+            grade_count = len(grade_data)
+
+        for grade_pos, grade in enumerate(grade_data):
+            check_cancel()
+            report(0.25 + 0.45 * min(grade_pos / grade_count, 1))
+            grade_rows[grade["grade"]] = row_hashes(grade)
+
+            with stages.stage("grade_copy") as st:
+                copied = plan_grade_rows(plan, sheet_index, grade, events, matched_grades, assignments, layout)
+                st["rows"] = st.get("rows", 0) + copied
+            total_copy_count += copied
+
+        unmatched = sum(len(sheets) for key, sheets in sheet_index["grades"].items()
+                        if key not in matched_grades)
+        events.emit(SUMMARY, "grade_summary", f"\nRows copied: {total_copy_count}\n"
+                    f"Sheets with no matching grade: {unmatched}",
+                    rows=total_copy_count, unmatched_sheets=unmatched)
+
+    if mode in ["date_only", "both"] and calendar_data:
+        events(f"\n--- DATE PROCESSING ---")
+        report(0.7)
+
+        with stages.stage("date_fill") as st:
+            updated_count, missing_count, unresolved = plan_calendar_dates(plan, sheet_index, calendar_data,
+                                                                           events, check_cancel, assignments,
+                                                                           layout)
+            st["sheets"] = st.get("sheets", 0) + updated_count
+
+        if missing_count:
+            events.emit(SUMMARY, "warning", f"⚠ Sheets with a date not in calendar: {missing_count}",
+                        sheets=missing_count)
+        if unresolved:
+            events.emit(SUMMARY, "warning", f"⚠ Casting dates not recognised as dates: {len(unresolved)} "
+                        f"({describe_unresolved(unresolved)})", dates=unresolved)
+        events.emit(SUMMARY, "date_summary", f"\nSheets updated: {updated_count}",
+                    sheets=updated_count, missing_sheets=missing_count)
+
+    return plan, grade_rows, total_copy_count
+
+def _run_combined(grade_files, office_file, output_folder, calendar_file, mode, events,
+                  calendar_data, grade_data, cache, progress_callback, cancel_event, stages,
+                  incremental=False, grade_workers=1, writer="openpyxl", layout=DEFAULT_LAYOUT, stats=None,
+                  low_memory=False, memory_budget=None):
+    def report(fraction):
+        if progress_callback is not None:
+            progress_callback(fraction)
+
+    budget = MemoryBudget(memory_budget) if memory_budget else None
+
+    # Also the memory checkpoint: stage boundaries, every grade and every
+    # chunk of sheets while indexing and writing
+    def check_cancel():
+        if cancel_event is not None and cancel_event.is_set():
+            raise ProcessingCancelled()
+        if budget is not None:
+            budget.check()
+
+    if low_memory:
+        writer = "patch"
+
+    try:
+        events(f"\n{'='*60}")
+        events.emit(SUMMARY, "start", f"PROCESSING MODE: {mode.upper().replace('_', ' ')}",
+                    mode=mode, office_file=office_file)
+        events(f"{'='*60}")
+        if low_memory:
+            events("Low-memory mode: fast writer, grade files one at a time")
+        check_cancel()
+
+        if mode in ["date_only", "both"] and calendar_data is None:
+            with stages.stage("calendar_load"):
+                calendar_data = load_calendar_data(calendar_file, events, cache)
+            if not calendar_data:
+                events.emit(SUMMARY, "error", "✖ Cannot proceed without calendar file")
+                return 0
+            check_cancel()
+
+        outpath = output_path_for(office_file, output_folder)
+        manifest_path = manifest_path_for(outpath)
+
+        # Incremental runs patch the previous output when it is still the
+        # one the manifest describes; otherwise start from the template.
+        manifest = None
+        if incremental:
+            manifest = load_manifest(manifest_path)
+            reason = check_reusable(manifest, office_file, outpath)
+            if reason:
+                events.emit(SUMMARY, "incremental", f"Incremental: full run ({reason})", reason=reason)
+                manifest = None
+
+        # Load the template straight from its source; the output is written
+        # once. The patch writer only needs the key cells, so it streams read-only.
+        patch = writer == "patch"
+        source = outpath if manifest else office_file
+        report(0.05)
+        with stages.stage("office_load"):
+            office_wb = load_workbook_readonly(source) if patch else load_workbook_safe(source)
+        check_cancel()
+        report(0.2)
+
+        with stages.stage("index") as st:
+            sheet_index = build_sheet_index(office_wb, layout, check_cancel)
+            st["sheets"] = st.get("sheets", 0) + len(office_wb.sheetnames)
+        if patch:
+            office_wb.close()
+        report(0.25)
+
+        assignments = {} if stats else None
+        plan, grade_rows, total_copy_count = compute_plan(
+            sheet_index, mode, grade_files, grade_data, calendar_data, events, stages, cache,
+            grade_workers, report, check_cancel, assignments, layout, low_memory)
+        # The manifest only needs their hashes; let the inputs go before writing
+        calendar = calendar_hashes(calendar_data)
+        grade_data = calendar_data = None
+        check_cancel()
+
+        # Built from the plan, so the saved workbook is never read back
+        def write_stats():
+            if stats:
+                from cube_stats import export_stats
+                with stages.stage("stats") as st:
+                    export_stats(output_path_for(office_file, output_folder, ""), plan, assignments, layout,
+                                 events, stats)
+                    st["sheets"] = st.get("sheets", 0) + len(plan)
+
+        sheet_names = None
+        if manifest:
+            sheet_names, reason = changed_sheets(manifest, plan)
+            if sheet_names is None:
+                events.emit(SUMMARY, "incremental", f"Incremental: full run ({reason})", reason=reason)
+                source = office_file
+                if not patch:
+                    office_wb.close()
+                    with stages.stage("office_load"):
+                        office_wb = load_workbook_safe(office_file)
+            else:
+                changed_rows, changed_dates = input_changes(manifest, grade_rows, calendar)
+                skipped = len(plan) - len(sheet_names)
+                events.emit(SUMMARY, "incremental",
+                            f"\nIncremental: {len(sheet_names)} sheet(s) changed, {skipped} unchanged skipped "
+                            f"({changed_rows} grade row(s), {changed_dates} calendar date(s) changed)",
+                            changed_sheets=len(sheet_names), skipped_sheets=skipped,
+                            changed_rows=changed_rows, changed_dates=changed_dates)
+
+        check_cancel()
+        report(0.85)
+        if not patch:
+            with stages.stage("apply") as st:
+                apply_write_plan(office_wb, plan, sheet_names)
+                st["sheets"] = st.get("sheets", 0) + len(plan if sheet_names is None else sheet_names)
+
+        if sheet_names == []:
+            if not patch:
+                office_wb.close()
+            write_stats()
+            report(1.0)
+            events.emit(SUMMARY, "saved", f"\n✓ Output already up to date: {outpath}", file=outpath,
+                        rows=total_copy_count)
+            return total_copy_count
+
+        check_cancel()
+        report(0.9)
+        with stages.stage("save") as st:
+            if patch:
+                if not write_patched(source, outpath, plan, sheet_names, events, not low_memory, check_cancel):
+                    return 0
+                st["sheets"] = st.get("sheets", 0) + len(plan if sheet_names is None else sheet_names)
+            else:
+                save_workbook_atomic(office_wb, outpath)
+                office_wb.close()
+        save_manifest(manifest_path, build_manifest(office_file, outpath, mode, sheet_index,
+                                                    grade_rows, calendar, plan))
+        write_stats()
+        report(1.0)
+
+        if cache is not None:
+            events(f"\n{cache.stats()}")
+
+        events(f"\n{'='*60}")
+        events.emit(SUMMARY, "saved", f"✓✓✓ SAVED: {outpath}", file=outpath, rows=total_copy_count)
+        events(f"{'='*60}")
+
+        return total_copy_count
+
+    except ProcessingCancelled:
+        events.emit(SUMMARY, "cancelled", "\n⚠ Processing cancelled - nothing was saved")
+        return 0
+
+    except MemoryBudgetExceeded as e:
+        events.emit(SUMMARY, "error", f"✖ Memory budget exceeded: {e} - nothing was saved", error=str(e))
+        return 0
+
+    except Exception as e:
+        import traceback
+        events.emit(SUMMARY, "error", f"✖ ERROR: {e}\n{traceback.format_exc()}", error=str(e))
+        return 0
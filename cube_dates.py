@@ -0,0 +1,73 @@
+import datetime
+from functools import lru_cache
+
+# Canonical dates for calendar keys and C17 casting dates. A day written as
+# a datetime cell, an Excel serial number or text in a common format all
+# normalize to the same datetime.date, so calendar lookups are a plain dict
+# hit. Text parsing is cached per distinct string, so a calendar or office
+# workbook full of repeated dates parses each one once.
+
+EXCEL_EPOCH = datetime.date(1899, 12, 30)
+# Serials between 1 (1900-01-01) and 2958465 (9999-12-31)
+EXCEL_SERIAL_RANGE = (1, 2958465)
+
+# Day-first before month-first: lab sheets write 05/03/2026 for 5 March
+TEXT_FORMATS = [
+    "%Y-%m-%d",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d",
+    "%d/%m/%Y",
+    "%d-%m-%Y",
+    "%d.%m.%Y",
+    "%d/%m/%y",
+    "%d-%m-%y",
+    "%d %b %Y",
+    "%d-%b-%Y",
+    "%d-%b-%y",
+    "%d %B %Y",
+    "%b %d, %Y",
+    "%B %d, %Y",
+    "%m/%d/%Y",
+]
+
+def from_excel_serial(serial):
+    if EXCEL_SERIAL_RANGE[0] <= serial <= EXCEL_SERIAL_RANGE[1]:
+        return EXCEL_EPOCH + datetime.timedelta(days=int(serial))
+    return None
+
+@lru_cache(maxsize=4096)
+def parse_date_text(text):
+    text = " ".join(text.split())
+    if not text:
+        return None
+
+    # Numbers stored as text
+    try:
+        return from_excel_serial(float(text))
+    except ValueError:
+        pass
+
+    # Drop a trailing midnight time ("2026-01-05 00:00:00", "05/01/2026 0:00")
+    for suffix in (" 00:00:00", " 0:00:00", " 00:00", " 0:00"):
+        if text.endswith(suffix):
+            text = text[:-len(suffix)]
+            break
+
+    # Fixed order so ambiguous text always resolves the same way
+    for fmt in TEXT_FORMATS:
+        try:
+            return datetime.datetime.strptime(text, fmt).date()
+        except ValueError:
+            continue
+    return None
+
+def normalize_date(value):
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return from_excel_serial(value)
+    return parse_date_text(str(value))
@@ -0,0 +1,256 @@
+import json
+import re
+import sys
+from collections import namedtuple
+from operator import itemgetter
+
+# Cell layout of an office template: which cells hold the grade and casting
+# date keys, and where each grade-file column and calendar column is
+# written. A layout profile is a small JSON document, validated and
+# compiled once into flat (source index, target cell) pairs; the planning
+# loops in cube_core apply those pairs without looking at the profile.
+#
+#   {
+#     "name": "standard",
+#     "keys": {"grade": "B12", "casting_date": "C17"},
+#     "grade": [{"source": "B:G", "target": "C25", "label": "Weight"},
+#               {"source": "I:N", "target": "C27", "label": "Strength"}],
+#     "dates": [{"source": "B", "target": "C18", "label": "7 Days"},
+#               {"source": "C", "target": "F18", "label": "28 Days"}]
+#   }
+#
+# grade sources are columns of a grade-file row, written left to right from
+# the target cell, and their label names the measurement in exported
+# statistics; date sources are columns of the calendar (column A is the
+# casting date). A 56-day template adds {"source": "D", "target": ...} to
+# "dates"; more specimens widen the grade ranges.
+#
+#   python cube_layout.py check profile.json
+
+DEFAULT_PROFILE = {
+    "name": "standard",
+    "keys": {"grade": "B12", "casting_date": "C17"},
+    "grade": [
+        {"source": "B:G", "target": "C25", "label": "Weight"},
+        {"source": "I:N", "target": "C27", "label": "Strength"},
+    ],
+    "dates": [
+        {"source": "B", "target": "C18", "label": "7 Days"},
+        {"source": "C", "target": "F18", "label": "28 Days"},
+    ],
+}
+
+# Grade rows and calendar entries hold their values from column B on
+FIRST_SOURCE_COLUMN = 2
+
+# Cells are (row, column) tuples, as in write plans. grade_indexes and
+# grade_targets are parallel; grade_groups is (label, start, stop) slices of
+# them, one per "grade" entry; date_writes is (index, target, label) triples.
+Layout = namedtuple("Layout", ["name", "grade_cell", "date_cell", "grade_indexes", "grade_targets",
+                               "grade_width", "grade_groups", "date_writes"])
+
+class LayoutError(ValueError):
+    pass
+
+CELL_RE = re.compile(r"^\$?([A-Za-z]{1,3})\$?(\d+)$")
+COLUMN_RE = re.compile(r"^[A-Za-z]{1,3}$")
+MAX_COLUMN = 16384
+MAX_ROW = 1048576
+
+def column_index(letters):
+    index = 0
+    for letter in letters.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index
+
+def column_letter(index):
+    letters = ""
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord("A") + remainder) + letters
+    return letters
+
+def cell_name(cell):
+    return f"{column_letter(cell[1])}{cell[0]}"
+
+def parse_cell(text):
+    match = CELL_RE.match(str(text).strip())
+    if match is None:
+        raise LayoutError(f"not a cell reference: {text!r}")
+    row, column = int(match.group(2)), column_index(match.group(1))
+    if not (1 <= row <= MAX_ROW and 1 <= column <= MAX_COLUMN):
+        raise LayoutError(f"cell out of range: {text!r}")
+    return row, column
+
+# "B" or "B:G" -> [2, ..., 7]
+def parse_columns(text):
+    bounds = str(text).strip().split(":")
+    if len(bounds) > 2 or not all(COLUMN_RE.match(bound) for bound in bounds):
+        raise LayoutError(f"not a column or column range: {text!r}")
+    first, last = column_index(bounds[0]), column_index(bounds[-1])
+    if last < first:
+        raise LayoutError(f"column range runs backwards: {text!r}")
+    return list(range(first, last + 1))
+
+def _entries(profile, section, problems):
+    entries = profile.get(section, [])
+    if not isinstance(entries, list) or not all(isinstance(entry, dict) for entry in entries):
+        problems.append(f"{section}: expected a list of {{source, target}} objects")
+        return []
+    return entries
+
+# Validate a profile and compile it. Every problem is collected and
+# reported together in one LayoutError.
+def compile_layout(profile):
+    problems = []
+    if not isinstance(profile, dict):
+        raise LayoutError("layout profile must be a JSON object")
+
+    keys = profile.get("keys", {})
+    key_cells = {}
+    for key_name in ("grade", "casting_date"):
+        try:
+            key_cells[key_name] = parse_cell(keys[key_name])
+        except KeyError:
+            problems.append(f"keys.{key_name}: missing")
+        except LayoutError as e:
+            problems.append(f"keys.{key_name}: {e}")
+
+    # Each target cell may be written by one source only, and never a key cell
+    written = {cell: f"keys.{key_name}" for key_name, cell in key_cells.items()}
+    def claim(cell, owner):
+        if cell[1] > MAX_COLUMN:
+            problems.append(f"{owner}: runs past the last column")
+        elif cell in written:
+            problems.append(f"{owner}: {cell_name(cell)} is already used by {written[cell]}")
+        else:
+            written[cell] = owner
+
+    grade_indexes, grade_targets, grade_groups = [], [], []
+    labels = set()
+    for i, entry in enumerate(_entries(profile, "grade", problems)):
+        owner = f"grade[{i}]"
+        try:
+            columns = parse_columns(entry.get("source", ""))
+            row, column = parse_cell(entry.get("target", ""))
+        except LayoutError as e:
+            problems.append(f"{owner}: {e}")
+            continue
+        if columns[0] < FIRST_SOURCE_COLUMN:
+            problems.append(f"{owner}: grade data starts in column B")
+            continue
+        label = str(entry.get("label") or entry["source"]).strip()
+        if label in labels:
+            problems.append(f"{owner}: duplicate label {label!r}")
+        labels.add(label)
+        start = len(grade_targets)
+        for offset, source_column in enumerate(columns):
+            target = (row, column + offset)
+            claim(target, owner)
+            grade_indexes.append(source_column - FIRST_SOURCE_COLUMN)
+            grade_targets.append(target)
+        grade_groups.append((label, start, len(grade_targets)))
+
+    date_writes = []
+    labels = set()
+    for i, entry in enumerate(_entries(profile, "dates", problems)):
+        owner = f"dates[{i}]"
+        try:
+            columns = parse_columns(entry.get("source", ""))
+            target = parse_cell(entry.get("target", ""))
+        except LayoutError as e:
+            problems.append(f"{owner}: {e}")
+            continue
+        if len(columns) != 1 or columns[0] < FIRST_SOURCE_COLUMN:
+            problems.append(f"{owner}: source must be one calendar column after A")
+            continue
+        label = str(entry.get("label") or entry["source"]).strip()
+        if label in labels:
+            problems.append(f"{owner}: duplicate label {label!r}")
+        labels.add(label)
+        claim(target, owner)
+        date_writes.append((columns[0] - FIRST_SOURCE_COLUMN, target, label))
+
+    if not grade_targets and not date_writes:
+        problems.append("layout writes no cells")
+    if problems:
+        raise LayoutError("invalid layout profile:\n  " + "\n  ".join(problems))
+
+    return Layout(
+        name=str(profile.get("name") or "custom"),
+        grade_cell=key_cells["grade"],
+        date_cell=key_cells["casting_date"],
+        grade_indexes=tuple(grade_indexes),
+        grade_targets=tuple(grade_targets),
+        grade_width=max(grade_indexes, default=-1) + 1,
+        grade_groups=tuple(grade_groups),
+        date_writes=tuple(date_writes),
+    )
+
+def load_layout(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            profile = json.load(f)
+    except OSError as e:
+        raise LayoutError(f"cannot read layout profile {path}: {e}")
+    except ValueError as e:
+        raise LayoutError(f"layout profile {path} is not valid JSON: {e}")
+    return compile_layout(profile)
+
+DEFAULT_LAYOUT = compile_layout(DEFAULT_PROFILE)
+
+# Callable returning the grade values of a row in grade_targets order, as a
+# tuple even for a single column
+def grade_picker(layout):
+    if len(layout.grade_indexes) == 1:
+        index = layout.grade_indexes[0]
+        return lambda values: (values[index],)
+    if not layout.grade_indexes:
+        return lambda values: ()
+    return itemgetter(*layout.grade_indexes)
+
+# JSON-friendly summary, stored in plans
+def layout_summary(layout):
+    return {
+        "name": layout.name,
+        "grade_key": cell_name(layout.grade_cell),
+        "date_key": cell_name(layout.date_cell),
+        "dates": [label for _, _, label in layout.date_writes],
+    }
+
+def describe_layout(layout):
+    lines = [f"Layout: {layout.name}",
+             f"  grade key {cell_name(layout.grade_cell)}, casting date key {cell_name(layout.date_cell)}",
+             f"  {len(layout.grade_targets)} grade cell(s):"]
+    for label, start, stop in layout.grade_groups:
+        lines += [f"    grade column {column_letter(index + FIRST_SOURCE_COLUMN)} ({label}) -> {cell_name(target)}"
+                  for index, target in zip(layout.grade_indexes[start:stop], layout.grade_targets[start:stop])]
+    lines.append(f"  {len(layout.date_writes)} date cell(s):")
+    lines += [f"    calendar column {column_letter(index + FIRST_SOURCE_COLUMN)} ({label}) -> {cell_name(target)}"
+              for index, target, label in layout.date_writes]
+    return lines
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Cube Data Processor - layout profiles")
+    commands = parser.add_subparsers(dest="command", required=True)
+    check = commands.add_parser("check", help="validate a profile and print its compiled cell mapping")
+    check.add_argument("profile", nargs="?", default=None, help="layout JSON (default: the standard layout)")
+    commands.add_parser("default", help="print the standard layout profile as JSON")
+    args = parser.parse_args(argv)
+
+    if args.command == "default":
+        print(json.dumps(DEFAULT_PROFILE, indent=1))
+        return 0
+
+    try:
+        layout = load_layout(args.profile) if args.profile else DEFAULT_LAYOUT
+    except LayoutError as e:
+        print(f"✖ {e}")
+        return 1
+    for line in describe_layout(layout):
+        print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
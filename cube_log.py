@@ -0,0 +1,111 @@
+import json
+import os
+import time
+
+# Structured, level-filtered run log. process_combined emits events with a
+# type, a verbosity level and optional sheet/row/grade/date fields; sinks
+# turn them into GUI text, a rotating plain-text log or a JSON-lines audit.
+# Callers in hot loops check the level first, so per-row events cost nothing
+# at the default summary level.
+
+SUMMARY = 0
+SHEET = 1
+ROW = 2
+
+LEVELS = {"summary": SUMMARY, "sheet": SHEET, "row": ROW}
+
+def default_log_dir():
+    base = (os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_STATE_HOME")
+            or os.path.join(os.path.expanduser("~"), ".local", "state"))
+    return os.path.join(base, "CubeDataProcessor", "logs")
+
+class EventLog:
+    def __init__(self, level=SUMMARY, sinks=None):
+        self.level = LEVELS.get(level, level)
+        self.sinks = list(sinks or [])
+
+    def enabled(self, level):
+        return level <= self.level
+
+    def emit(self, level, event, message, **fields):
+        if level > self.level:
+            return
+        record = {"time": time.time(), "level": level, "event": event, "message": message}
+        record.update(fields)
+        self.dispatch(record)
+
+    def dispatch(self, record):
+        for sink in self.sinks:
+            sink(record)
+
+    # Every sink except the console/GUI callbacks: worker records that the
+    # log files must keep without echoing each one to the screen
+    def dispatch_to_logs(self, record):
+        for sink in self.sinks:
+            if not isinstance(sink, CallbackSink):
+                sink(record)
+
+    # Plain log_callback compatibility: log("text") is a summary message
+    def __call__(self, message):
+        self.emit(SUMMARY, "message", message)
+
+    def flush(self):
+        for sink in self.sinks:
+            if hasattr(sink, "flush"):
+                sink.flush()
+
+    def close(self):
+        for sink in self.sinks:
+            if hasattr(sink, "close"):
+                sink.close()
+
+def as_event_log(log_callback, level=SUMMARY):
+    if isinstance(log_callback, EventLog):
+        return log_callback
+    return EventLog(level, [CallbackSink(log_callback)])
+
+class CallbackSink:
+    def __init__(self, callback):
+        self.callback = callback
+
+    def __call__(self, record):
+        self.callback(record["message"])
+
+class RotatingTextSink:
+    def __init__(self, path, max_bytes=5 * 1024 * 1024, backup_count=3):
+        # logging.handlers pulls in socket & co; only pay for it when used
+        import logging
+        import logging.handlers
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.handler = logging.handlers.RotatingFileHandler(
+            path, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+        self.make_record = logging.makeLogRecord
+        self.levelno = logging.INFO
+
+    def __call__(self, record):
+        message = record["message"].strip("\n")
+        if not message:
+            return
+        self.handler.emit(self.make_record({"msg": message, "created": record["time"],
+                                            "levelno": self.levelno}))
+
+    def flush(self):
+        self.handler.flush()
+
+    def close(self):
+        self.handler.close()
+
+class JsonLinesSink:
+    def __init__(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.file = open(path, "a", encoding="utf-8")
+
+    def __call__(self, record):
+        self.file.write(json.dumps(record, default=str, ensure_ascii=False) + "\n")
+
+    def flush(self):
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
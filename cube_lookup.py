@@ -0,0 +1,162 @@
+import argparse
+import os
+import pickle
+import sys
+import time
+
+from cube_cache import ParseCache
+from cube_core import as_source_list, atomic_write, load_all_grade_data, load_calendar_data, split_source
+from cube_log import CallbackSink, EventLog, as_event_log
+from cube_manifest import file_fingerprint
+
+# Prebuilt lookup table: the merged calendar and grade inputs of a site,
+# built once from several calendar workbooks/sheets and grade exports and
+# saved as a pickle. Batch runs load it instead of re-reading and merging
+# every source; the recorded source fingerprints tell when it is stale.
+#
+#   python cube_lookup.py build -c cal_2025.xlsx -c cal_2026.xlsx#* -g grades/ -o site.lookup
+#   python cube_lookup.py show site.lookup
+#   python cube_batch.py offices/ --lookup site.lookup -o out/
+
+LOOKUP_VERSION = 2
+
+def source_fingerprints(sources):
+    fingerprints = {}
+    for source in sources:
+        path, _ = split_source(source)
+        try:
+            fingerprints[source] = file_fingerprint(path)
+        except OSError:
+            fingerprints[source] = None
+    return fingerprints
+
+# Absolute paths, so a table saved in one folder stays valid from another
+def absolute_source(source):
+    path, sheet = split_source(source)
+    path = os.path.abspath(path)
+    return path if sheet is None else f"{path}#{sheet}"
+
+def build_lookup_table(calendar_sources, grade_sources, log_callback, cache=None, grade_workers=1):
+    events = as_event_log(log_callback)
+    calendar_sources = [absolute_source(source) for source in as_source_list(calendar_sources)]
+    grade_sources = [absolute_source(source) for source in as_source_list(grade_sources)]
+
+    calendar_data = load_calendar_data(calendar_sources, events, cache) if calendar_sources else None
+    grade_data = load_all_grade_data(grade_sources, cache, events, grade_workers)
+    for grade in grade_data:
+        events(f"✓ Grade loaded: {grade['grade']} ({len(grade['rows'])} rows)")
+
+    return {
+        "version": LOOKUP_VERSION,
+        "created": time.time(),
+        "calendar_sources": calendar_sources,
+        "grade_sources": grade_sources,
+        "fingerprints": source_fingerprints(calendar_sources + grade_sources),
+        "calendar": calendar_data,
+        "grades": grade_data,
+    }
+
+def save_lookup_table(path, table):
+    folder = os.path.dirname(path)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
+
+    def write(tmp_path):
+        with open(tmp_path, "wb") as f:
+            pickle.dump(table, f, protocol=pickle.HIGHEST_PROTOCOL)
+    atomic_write(path, write)
+
+def load_lookup_table(path):
+    try:
+        with open(path, "rb") as f:
+            table = pickle.load(f)
+    except Exception:
+        return None
+    if not isinstance(table, dict) or table.get("version") != LOOKUP_VERSION:
+        return None
+    return table
+
+# Sources whose file changed or disappeared since the table was built
+def stale_sources(table):
+    current = source_fingerprints(table["fingerprints"])
+    return [source for source, fingerprint in table["fingerprints"].items()
+            if current[source] != fingerprint]
+
+# Load a saved table, rebuilding it from its recorded sources (and saving
+# it again) when any of them changed. Returns None if it cannot be read.
+def load_or_rebuild(path, log_callback, cache=None, grade_workers=1):
+    events = as_event_log(log_callback)
+    table = load_lookup_table(path)
+    if table is None:
+        events(f"✖ Cannot read lookup table: {path}")
+        return None
+
+    stale = stale_sources(table)
+    if stale:
+        events(f"⚠ Lookup table is stale ({len(stale)} source(s) changed), rebuilding")
+        table = build_lookup_table(table["calendar_sources"], table["grade_sources"], events, cache,
+                                   grade_workers)
+        save_lookup_table(path, table)
+    return table
+
+def describe_table(table):
+    calendar = table["calendar"] or {}
+    lines = [
+        f"Built: {time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(table['created']))}",
+        f"Calendar: {len(calendar)} dates from {len(table['calendar_sources'])} source(s)",
+    ]
+    lines += [f"  {source}" for source in table["calendar_sources"]]
+    lines.append(f"Grades: {len(table['grades'])} from {len(table['grade_sources'])} source(s)")
+    lines += [f"  {grade['grade']}: {len(grade['rows'])} rows ({os.path.basename(grade['file'])})"
+              for grade in table["grades"]]
+    stale = stale_sources(table)
+    if stale:
+        lines.append(f"Stale sources: {', '.join(stale)}")
+    return lines
+
+def main(argv=None):
+    # Imported here: cube_batch imports this module for --lookup
+    from cube_batch import collect_xlsx_files
+
+    parser = argparse.ArgumentParser(description="Cube Data Processor - prebuilt lookup tables")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    build = commands.add_parser("build", help="merge calendar and grade sources into a lookup table")
+    build.add_argument("-c", "--calendar", action="append", default=[],
+                       help="calendar workbook, book.xlsx#Sheet or book.xlsx#* (repeatable, first wins)")
+    build.add_argument("-g", "--grades", nargs="*", default=[],
+                       help="grade files, directories or glob patterns (first wins)")
+    build.add_argument("-o", "--output", required=True, help="lookup table file")
+    build.add_argument("--grade-workers", type=int, default=None,
+                       help="processes parsing grade files (1 = serial, default: one per CPU)")
+    build.add_argument("--no-cache", action="store_true", help="parse every input, bypassing the parse cache")
+
+    show = commands.add_parser("show", help="describe a saved lookup table")
+    show.add_argument("table")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "show":
+        table = load_lookup_table(args.table)
+        if table is None:
+            print(f"✖ Cannot read lookup table: {args.table}")
+            return 1
+        for line in describe_table(table):
+            print(line)
+        return 0
+
+    grade_files = collect_xlsx_files(args.grades)
+    if not args.calendar and not grade_files:
+        parser.error("give at least one calendar or grade source")
+
+    events = EventLog(sinks=[CallbackSink(print)])
+    table = build_lookup_table(args.calendar, grade_files, events, ParseCache(enabled=not args.no_cache),
+                               args.grade_workers)
+    if args.calendar and not table["calendar"]:
+        return 1
+    save_lookup_table(args.output, table)
+    print(f"✓ Lookup table saved: {args.output}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+
+# Run manifest stored next to <name>_Processed.xlsx. It records what the
+# last run wrote so a later run can re-apply only the sheets whose inputs
+# changed: content hashes of every grade row and calendar entry, each
+# sheet's B12/C17 key and the hash of the cells written to each sheet.
+
+MANIFEST_VERSION = 3
+
+def manifest_path_for(outpath):
+    return os.path.splitext(outpath)[0] + ".manifest.json"
+
+def content_hash(value):
+    return hashlib.sha1(repr(value).encode("utf-8")).hexdigest()[:16]
+
+def file_fingerprint(path):
+    st = os.stat(path)
+    return {"path": os.path.abspath(path), "mtime_ns": st.st_mtime_ns, "size": st.st_size}
+
+def load_manifest(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest
+
+def save_manifest(path, manifest):
+    # cube_core imports this module, so its helper is imported on use
+    from cube_core import atomic_write
+
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, indent=1)
+    atomic_write(path, write)
+
+# Input hashes are taken while the inputs are planned, so the grade rows
+# and calendar can be released before the output is written: grade_rows is
+# {grade: row_hashes(grade)} and calendar is calendar_hashes(calendar_data).
+def row_hashes(grade):
+    return [content_hash(row[1:]) for row in grade["rows"]]
+
+def calendar_hashes(calendar_data):
+    return {str(date): content_hash(entry) for date, entry in (calendar_data or {}).items()}
+
+def build_manifest(office_file, outpath, mode, sheet_index, grade_rows, calendar, plan):
+    sheet_keys = {}
+    for key_name, index in (("grade", sheet_index["grades"]), ("date", sheet_index["dates"])):
+        for value, sheet_names in index.items():
+            for sheet_name in sheet_names:
+                sheet_keys.setdefault(sheet_name, {})[key_name] = value
+
+    sheets = {}
+    for sheet_name, cells in plan.items():
+        sheets[sheet_name] = {
+            "key": content_hash(sorted(sheet_keys.get(sheet_name, {}).items())),
+            "cells": sorted(f"{row},{col}" for row, col in cells),
+            "writes": content_hash(sorted(cells.items())),
+        }
+
+    return {
+        "version": MANIFEST_VERSION,
+        "mode": mode,
+        "office": file_fingerprint(office_file),
+        "output": file_fingerprint(outpath),
+        "grade_rows": grade_rows,
+        "calendar": calendar,
+        "sheets": sheets,
+    }
+
+# Can the existing output be patched in place? Returns None if so, or the
+# reason a full rebuild is needed.
+def check_reusable(manifest, office_file, outpath):
+    if manifest is None:
+        return "no previous manifest"
+    if not os.path.exists(outpath):
+        return "previous output is missing"
+    if manifest["office"] != file_fingerprint(office_file):
+        return "office template changed"
+    if manifest["output"] != file_fingerprint(outpath):
+        return "previous output was modified"
+    return None
+
+# Sheets of plan whose writes differ from the manifest, or (None, reason)
+# when a sheet lost cells it had before and must be rebuilt from the template.
+def changed_sheets(manifest, plan):
+    previous = manifest["sheets"]
+
+    for sheet_name, entry in previous.items():
+        cells = plan.get(sheet_name, {})
+        if not set(entry["cells"]) <= {f"{row},{col}" for row, col in cells}:
+            return None, f"sheet {sheet_name} no longer receives all of its previous cells"
+
+    changed = [sheet_name for sheet_name, cells in plan.items()
+               if sheet_name not in previous
+               or previous[sheet_name]["writes"] != content_hash(sorted(cells.items()))]
+    return changed, None
+
+def input_changes(manifest, grade_rows, calendar):
+    changed_rows = 0
+    for grade, new in grade_rows.items():
+        old = manifest["grade_rows"].get(grade, [])
+        changed_rows += sum(1 for i, h in enumerate(new) if i >= len(old) or old[i] != h)
+
+    old_calendar = manifest["calendar"]
+    changed_dates = sum(1 for date, h in calendar.items() if old_calendar.get(date) != h)
+    return changed_rows, changed_dates
@@ -0,0 +1,275 @@
+import argparse
+import datetime
+import json
+import os
+import sys
+import time
+
+from cube_batch import MODES, collect_xlsx_files, describe_collisions, output_collisions
+from cube_cache import ParseCache
+from cube_layout import DEFAULT_LAYOUT, LayoutError, layout_summary, load_layout
+from cube_core import (WRITERS, apply_write_plan, atomic_write, build_sheet_index, compute_plan, load_all_grade_data,
+                       load_calendar_data, load_workbook_readonly, load_workbook_safe, output_path_for,
+                       save_workbook_atomic, write_patched)
+from cube_log import LEVELS, SUMMARY, CallbackSink, EventLog, as_event_log
+from cube_manifest import file_fingerprint
+from cube_profile import NULL_STAGES
+
+# Plan mode: work out which grade row and calendar entry every office sheet
+# will receive without loading the office workbook for writing. Only the
+# grade and casting date key cells (B12 and C17 in the standard layout) are
+# read (read-only, streamed); the result is a table for operators
+# and a JSON plan that `apply` writes later without recomputing anything.
+#
+#   python cube_plan.py make office.xlsx -g M20.xlsx M25.xlsx -c calendar.xlsx
+#   python cube_plan.py make offices/ -g grades/ -c calendar.xlsx --out plans/
+#   python cube_plan.py apply plans/office_plan.json -o out/
+
+PLAN_VERSION = 2
+
+# JSON has no dates; grade cells may hold them
+def encode_value(value):
+    if isinstance(value, datetime.datetime):
+        return {"datetime": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"date": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"time": value.isoformat()}
+    if isinstance(value, datetime.timedelta):
+        return {"timedelta": value.total_seconds()}
+    return value
+
+def decode_value(value):
+    if not isinstance(value, dict):
+        return value
+    if "datetime" in value:
+        return datetime.datetime.fromisoformat(value["datetime"])
+    if "date" in value:
+        return datetime.date.fromisoformat(value["date"])
+    if "time" in value:
+        return datetime.time.fromisoformat(value["time"])
+    return datetime.timedelta(seconds=value["timedelta"])
+
+def make_plan(grade_files, office_file, calendar_file, mode, log_callback,
+              calendar_data=None, grade_data=None, cache=None, stages=None, grade_workers=1, layout=None,
+              check_cancel=None):
+    # check_cancel is called between sheets and grades and may raise
+    # cube_core.ProcessingCancelled to stop planning
+    stages = stages or NULL_STAGES
+    layout = layout or DEFAULT_LAYOUT
+    events = as_event_log(log_callback)
+
+    warnings = []
+    def collect(record):
+        if record["event"] == "warning":
+            warnings.append(record["message"].strip())
+    events = EventLog(events.level, events.sinks + [collect])
+
+    if mode in ["date_only", "both"] and calendar_data is None:
+        with stages.stage("calendar_load"):
+            calendar_data = load_calendar_data(calendar_file, events, cache)
+        if not calendar_data:
+            events.emit(SUMMARY, "error", "✖ Cannot proceed without calendar file")
+            return None
+
+    with stages.stage("office_load"):
+        office_wb = load_workbook_readonly(office_file)
+    try:
+        with stages.stage("index"):
+            sheet_index = build_sheet_index(office_wb, layout, check_cancel)
+            sheet_names = office_wb.sheetnames
+    finally:
+        office_wb.close()
+
+    assignments = {}
+    plan, _, total_copy_count = compute_plan(sheet_index, mode, grade_files, grade_data, calendar_data,
+                                             events, stages, cache, grade_workers, check_cancel=check_cancel,
+                                             assignments=assignments, layout=layout)
+
+    keys = {}
+    for key_name, index in (("grade_key", sheet_index["grades"]), ("date_key", sheet_index["dates"])):
+        for value, names in index.items():
+            for sheet_name in names:
+                keys.setdefault(sheet_name, {})[key_name] = str(value)
+
+    sheets = []
+    for sheet_name in sheet_names:
+        entry = {"sheet": sheet_name, "grade_key": None, "date_key": None}
+        entry.update(keys.get(sheet_name, {}))
+        for name, value in assignments.get(sheet_name, {}).items():
+            entry[name] = str(value) if name == "date" else value
+        sheets.append(entry)
+
+    return {
+        "version": PLAN_VERSION,
+        "created": time.time(),
+        "mode": mode,
+        "layout": layout_summary(layout),
+        "office": file_fingerprint(office_file),
+        "rows_copied": total_copy_count,
+        "sheets": sheets,
+        "warnings": warnings,
+        "cells": {sheet_name: [[row, column, encode_value(value)] for (row, column), value in cells.items()]
+                  for sheet_name, cells in plan.items()},
+    }
+
+def plan_cells(plan_doc):
+    return {sheet_name: {(row, column): decode_value(value) for row, column, value in cells}
+            for sheet_name, cells in plan_doc["cells"].items()}
+
+def save_plan(path, plan_doc):
+    def write(tmp_path):
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(plan_doc, f, indent=1, ensure_ascii=False)
+    atomic_write(path, write)
+
+def load_plan(path):
+    try:
+        with open(path, encoding="utf-8") as f:
+            plan_doc = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if plan_doc.get("version") != PLAN_VERSION:
+        return None
+    return plan_doc
+
+def format_plan_table(plan_doc):
+    layout = plan_doc["layout"]
+    rows = [("Sheet", layout["grade_key"], "Grade row", layout["date_key"], *layout["dates"])]
+    for entry in plan_doc["sheets"]:
+        if "grade" in entry:
+            grade_row = f"{os.path.basename(entry['file'])} r{entry['row']}"
+        elif entry["grade_key"]:
+            grade_row = "-- no row --"
+        else:
+            grade_row = ""
+        if entry.get("date_missing"):
+            dates = ["-- not in calendar --"] * len(layout["dates"])
+        else:
+            dates = [entry.get("dates", {}).get(label, "") for label in layout["dates"]]
+        rows.append((entry["sheet"], entry["grade_key"] or "", grade_row, entry["date_key"] or "", *dates))
+
+    widths = [max(len(str(row[i])) for row in rows) for i in range(len(rows[0]))]
+    lines = ["  ".join(str(value).ljust(width) for value, width in zip(row, widths)).rstrip() for row in rows]
+    lines.insert(1, "  ".join("-" * width for width in widths))
+    lines.append(f"\n{plan_doc['rows_copied']} grade row(s), {len(plan_doc['cells'])} sheet(s) to write")
+    lines += plan_doc["warnings"]
+    return lines
+
+# Write a saved plan. The office template must be the file it was planned
+# against (same size and mtime) unless force is set. Returns the rows
+# copied, or None if nothing was written.
+def apply_plan(plan_doc, output_folder, log_callback, writer="openpyxl", force=False):
+    events = as_event_log(log_callback)
+    office_file = plan_doc["office"]["path"]
+
+    try:
+        current = file_fingerprint(office_file)
+    except OSError:
+        events.emit(SUMMARY, "error", f"✖ Office file not found: {office_file}")
+        return None
+    if current != plan_doc["office"] and not force:
+        events.emit(SUMMARY, "error", f"✖ {os.path.basename(office_file)} changed since the plan was made; "
+                    f"make a new plan or apply with --force")
+        return None
+
+    os.makedirs(output_folder, exist_ok=True)
+    outpath = output_path_for(office_file, output_folder)
+    plan = plan_cells(plan_doc)
+
+    if writer == "patch":
+        write_patched(office_file, outpath, plan, None, events)
+    else:
+        office_wb = load_workbook_safe(office_file)
+        apply_write_plan(office_wb, plan)
+        save_workbook_atomic(office_wb, outpath)
+        office_wb.close()
+
+    events.emit(SUMMARY, "saved", f"✓✓✓ SAVED: {outpath}", file=outpath, rows=plan_doc["rows_copied"])
+    return plan_doc["rows_copied"]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cube Data Processor - dry-run plans")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    make = commands.add_parser("make", help="compute the assignment plan without writing any workbook")
+    make.add_argument("inputs", nargs="+", help="office files, directories or glob patterns")
+    make.add_argument("-g", "--grades", nargs="*", default=[], help="grade files, directories or glob patterns")
+    make.add_argument("-c", "--calendar", action="append", default=[],
+                      help="calendar workbook, book.xlsx#Sheet or book.xlsx#* (repeatable, first wins)")
+    make.add_argument("-m", "--mode", choices=MODES, default="both")
+    make.add_argument("--layout", default=None, help="layout profile JSON (default: standard B12/C17 template)")
+    make.add_argument("--format", choices=["table", "json"], default="table", help="what to print")
+    make.add_argument("--out", default=None, help="folder for <name>_plan.json files")
+    make.add_argument("--log-level", choices=list(LEVELS), default="summary")
+    make.add_argument("--no-cache", action="store_true", help="parse every input, bypassing the parse cache")
+
+    apply = commands.add_parser("apply", help="write outputs from saved plans")
+    apply.add_argument("plans", nargs="+", help="<name>_plan.json files")
+    apply.add_argument("-o", "--output", required=True, help="output folder")
+    apply.add_argument("--writer", choices=WRITERS, default="openpyxl")
+    apply.add_argument("--force", action="store_true", help="apply even if the office file changed")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "apply":
+        events = EventLog(sinks=[CallbackSink(print)])
+        failed = 0
+        for path in args.plans:
+            plan_doc = load_plan(path)
+            if plan_doc is None:
+                print(f"✖ Cannot read plan: {path}")
+                failed += 1
+                continue
+            start = time.perf_counter()
+            if apply_plan(plan_doc, args.output, events, args.writer, args.force) is None:
+                failed += 1
+            print(f"  {os.path.basename(path)}: {time.perf_counter() - start:.2f}s")
+        return 1 if failed else 0
+
+    office_files = collect_xlsx_files(args.inputs)
+    grade_files = collect_xlsx_files(args.grades)
+    if not office_files:
+        parser.error("no office files found")
+    collisions = output_collisions(office_files, args.out, "_plan.json") if args.out else {}
+    if collisions:
+        parser.error(f"office files would share a plan file: {describe_collisions(collisions)}")
+
+    try:
+        layout = load_layout(args.layout) if args.layout else DEFAULT_LAYOUT
+    except LayoutError as e:
+        parser.error(str(e))
+
+    # Progress goes to stderr so --format json stays parseable
+    events = EventLog(LEVELS[args.log_level], [CallbackSink(lambda message: print(message, file=sys.stderr))])
+    cache = ParseCache(enabled=not args.no_cache)
+
+    calendar_data = None
+    if args.mode in ["date_only", "both"]:
+        calendar_data = load_calendar_data(args.calendar, events, cache)
+        if not calendar_data:
+            return 1
+    grade_data = load_all_grade_data(grade_files, cache, events) if args.mode in ["grade_only", "both"] else []
+
+    plans = []
+    for office_file in office_files:
+        start = time.perf_counter()
+        plan_doc = make_plan([], office_file, None, args.mode, events, calendar_data, grade_data, layout=layout)
+        if plan_doc is None:
+            return 1
+        plans.append(plan_doc)
+        if args.out:
+            os.makedirs(args.out, exist_ok=True)
+            save_plan(output_path_for(office_file, args.out, "_plan.json"), plan_doc)
+        if args.format == "table":
+            print(f"\n{os.path.basename(office_file)} (planned in {time.perf_counter() - start:.2f}s)")
+            for line in format_plan_table(plan_doc):
+                print(line)
+
+    if args.format == "json":
+        json.dump(plans[0] if len(plans) == 1 else plans, sys.stdout, indent=1, ensure_ascii=False)
+        print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,193 @@
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# Stage hooks for process_combined. The whole run is wrapped in
+# stages.run() and each phase in stages.stage(name); the yielded dict
+# accumulates per-stage counters (rows, sheets) across repeated entries.
+# NullStages is the default and records nothing.
+
+class NullStages:
+    @contextmanager
+    def run(self):
+        yield
+
+    @contextmanager
+    def stage(self, name):
+        yield {}
+
+    def report(self, log_callback):
+        pass
+
+NULL_STAGES = NullStages()
+
+# Resident set size of this process, in bytes (None where it cannot be
+# read). peak_rss is the process high-water mark, which covers everything
+# the process has run so far, not just the current run.
+def current_rss():
+    if sys.platform == "win32":
+        return _windows_memory()[0]
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def peak_rss():
+    if sys.platform == "win32":
+        return _windows_memory()[1]
+    # ru_maxrss survives fork + exec, so a child started from a big parent
+    # would report the parent's peak; VmHWM starts afresh with the program
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def _windows_memory():
+    import ctypes
+    from ctypes import wintypes
+
+    class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+        _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t), ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+    counters = PROCESS_MEMORY_COUNTERS()
+    counters.cb = ctypes.sizeof(counters)
+    process = ctypes.windll.kernel32.GetCurrentProcess()
+    if not ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+        return None, None
+    return counters.WorkingSetSize, counters.PeakWorkingSetSize
+
+class MemoryBudgetExceeded(Exception):
+    pass
+
+# Hard RSS limit checked at the checkpoints of a run (stage boundaries and
+# every chunk of sheets); check() raises MemoryBudgetExceeded once the
+# process is over it.
+class MemoryBudget:
+    def __init__(self, limit_mb):
+        self.limit = int(limit_mb * 1048576)
+
+    def check(self):
+        rss = current_rss()
+        if rss is None:
+            rss = peak_rss()
+        if rss is not None and rss > self.limit:
+            raise MemoryBudgetExceeded(f"{rss / 1048576:.0f} MB in use, over the {self.limit / 1048576:.0f} MB budget")
+
+class StageTimer(NullStages):
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name):
+        entry = self.stages.setdefault(name, {"seconds": 0.0, "calls": 0})
+        start = time.perf_counter()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - start
+            entry["calls"] += 1
+
+# Wall time, CPU time, throughput and (optionally) tracemalloc peak per
+# stage, plus an opt-in cProfile dump of the whole run.
+class RunProfiler(StageTimer):
+    def __init__(self, memory=True, cprofile_path=None):
+        super().__init__()
+        self.memory = memory
+        self.cprofile_path = cprofile_path
+        self.total = {"seconds": 0.0, "cpu_seconds": 0.0, "peak_bytes": 0}
+
+    @contextmanager
+    def run(self):
+        started_tracing = False
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracing = True
+
+        profiler = cProfile.Profile() if self.cprofile_path else None
+        if profiler is not None:
+            profiler.enable()
+
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.total["seconds"] = time.perf_counter() - start
+            self.total["cpu_seconds"] = time.thread_time() - cpu_start
+
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.cprofile_path)
+
+            if tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1]
+                self.total["peak_bytes"] = max([peak] + [s.get("peak_bytes", 0) for s in self.stages.values()])
+            if started_tracing:
+                tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name):
+        entry = self.stages.setdefault(name, {"seconds": 0.0, "cpu_seconds": 0.0, "calls": 0})
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            self.total["peak_bytes"] = max(self.total["peak_bytes"], tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+
+        start, cpu_start = time.perf_counter(), time.thread_time()
+        try:
+            yield entry
+        finally:
+            entry["seconds"] += time.perf_counter() - start
+            entry["cpu_seconds"] += time.thread_time() - cpu_start
+            entry["calls"] += 1
+            if tracing:
+                peak = tracemalloc.get_traced_memory()[1]
+                entry["peak_bytes"] = max(entry.get("peak_bytes", 0), peak)
+
+    def rates(self, entry):
+        seconds = entry["seconds"]
+        if not seconds:
+            return ""
+        return ", ".join(f"{entry[key] / seconds:,.0f} {key}/s" for key in ("rows", "sheets") if key in entry)
+
+    def summary_lines(self):
+        lines = [f"{'Stage':<14}{'Wall s':>9}{'CPU s':>9}{'Peak MB':>9}  Throughput"]
+        for name, entry in self.stages.items():
+            peak = f"{entry['peak_bytes'] / 1048576:.1f}" if "peak_bytes" in entry else "-"
+            lines.append(f"{name:<14}{entry['seconds']:>9.3f}{entry['cpu_seconds']:>9.3f}{peak:>9}  {self.rates(entry)}")
+        peak = f"{self.total['peak_bytes'] / 1048576:.1f}" if self.memory else "-"
+        lines.append(f"{'total':<14}{self.total['seconds']:>9.3f}{self.total['cpu_seconds']:>9.3f}{peak:>9}")
+        return lines
+
+    def report(self, log_callback):
+        log_callback("\n--- PROFILE ---")
+        log_callback("\n".join(self.summary_lines()))
+
+    def to_dict(self):
+        stages = {}
+        for name, entry in self.stages.items():
+            stages[name] = dict(entry)
+            seconds = entry["seconds"]
+            for key in ("rows", "sheets"):
+                if key in entry and seconds:
+                    stages[name][f"{key}_per_second"] = entry[key] / seconds
+        return {"total": dict(self.total), "stages": stages}
+
+    def write(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
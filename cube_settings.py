@@ -0,0 +1,163 @@
+import json
+import os
+import sys
+
+from cube_core import atomic_write
+from cube_manifest import file_fingerprint
+
+# Saved state shared by the GUI and the headless tools: the last used
+# paths, named input sets (grade files, calendars, output folder, mode),
+# the fingerprints of the inputs seen on the last run, the low-memory
+# options (memory_budget_mb, in MB, is set by editing the file) and the
+# number of processes that parse grade files (grade_workers: 1 is serial,
+# null one per CPU). The whole document is read once when opened and
+# written once, atomically, on save. Backends: a JSON file (default, any
+# platform) and the Windows registry, which holds the same document in a
+# single value.
+
+SETTINGS_VERSION = 1
+
+DEFAULTS = {
+    "output_path": "",
+    "calendar_path": "",
+    "grade_files": [],
+    "input_sets": {},
+    "fingerprints": {},
+    "low_memory": False,
+    "memory_budget_mb": None,
+    "grade_workers": 1,
+}
+
+def default_settings_path():
+    base = (os.environ.get("APPDATA") or os.environ.get("XDG_CONFIG_HOME")
+            or os.path.join(os.path.expanduser("~"), ".config"))
+    return os.path.join(base, "CubeDataProcessor", "settings.json")
+
+class FileBackend:
+    def __init__(self, path=None):
+        self.path = path or default_settings_path()
+
+    def read(self):
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, data):
+        folder = os.path.dirname(self.path)
+        if folder:
+            os.makedirs(folder, exist_ok=True)
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(data, f, indent=1, ensure_ascii=False)
+        atomic_write(self.path, write)
+
+class RegistryBackend:
+    SOFTWARE_KEY = r"SOFTWARE\CubeDataProcessor"
+    VALUE_NAME = "settings"
+    # One value per setting, written by earlier versions
+    LEGACY_VALUES = ["grade_files", "output_path", "calendar_path"]
+
+    def read(self):
+        import winreg
+        try:
+            with winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.SOFTWARE_KEY) as key:
+                try:
+                    value, _ = winreg.QueryValueEx(key, self.VALUE_NAME)
+                    return json.loads(value)
+                except (OSError, ValueError):
+                    return self._read_legacy(winreg, key)
+        except OSError:
+            return None
+
+    def _read_legacy(self, winreg, key):
+        data = {}
+        for name in self.LEGACY_VALUES:
+            try:
+                data[name], _ = winreg.QueryValueEx(key, name)
+            except OSError:
+                pass
+        if not data:
+            return None
+        # grade_files was stored "|"-joined
+        if "grade_files" in data:
+            data["grade_files"] = [path for path in str(data["grade_files"]).split("|") if path]
+        return data
+
+    def write(self, data):
+        import winreg
+        with winreg.CreateKey(winreg.HKEY_CURRENT_USER, self.SOFTWARE_KEY) as key:
+            winreg.SetValueEx(key, self.VALUE_NAME, 0, winreg.REG_SZ, json.dumps(data, ensure_ascii=False))
+
+BACKENDS = {"file": FileBackend, "registry": RegistryBackend}
+
+class Settings:
+    def __init__(self, backend=None):
+        self.backend = backend or FileBackend()
+        self.data = {}
+
+    def load(self):
+        data = self.backend.read()
+        if not isinstance(data, dict) or data.get("version", SETTINGS_VERSION) != SETTINGS_VERSION:
+            data = {}
+        self.data = {name: data.get(name, default) for name, default in DEFAULTS.items()}
+        self.data.update({name: value for name, value in data.items() if name not in DEFAULTS})
+        self.data.pop("version", None)
+        return self
+
+    def get(self, name, default=None):
+        return self.data.get(name, default)
+
+    def update(self, **values):
+        self.data.update(values)
+
+    # One write for everything; False if the store cannot be written
+    def save(self):
+        try:
+            self.backend.write({"version": SETTINGS_VERSION, **self.data})
+            return True
+        except OSError:
+            return False
+
+    # Named input sets: {"grades": [...], "calendar": [...], "output": ..., "mode": ..., "layout": ...}
+    def input_set(self, name):
+        return self.data["input_sets"].get(name)
+
+    def save_input_set(self, name, inputs):
+        self.data["input_sets"][name] = inputs
+
+    # Fingerprints of input files, kept so the next start can tell which
+    # of them changed or disappeared since the last run
+    def remember_inputs(self, paths):
+        fingerprints = self.data["fingerprints"]
+        for path in paths:
+            try:
+                fingerprints[os.path.abspath(path)] = file_fingerprint(path)
+            except OSError:
+                fingerprints.pop(os.path.abspath(path), None)
+
+    def changed_inputs(self, paths):
+        changed = []
+        for path in paths:
+            previous = self.data["fingerprints"].get(os.path.abspath(path))
+            try:
+                current = file_fingerprint(path)
+            except OSError:
+                current = None
+            if previous is not None and previous != current:
+                changed.append(path)
+        return changed
+
+# The JSON file, unless the registry backend is asked for. On Windows a
+# missing file is seeded from the registry, so state saved by earlier
+# versions carries over; the next save writes the file.
+def open_settings(backend="file", path=None):
+    if backend == "registry":
+        return Settings(RegistryBackend()).load()
+    settings = Settings(FileBackend(path)).load()
+    if sys.platform == "win32" and not os.path.exists(settings.backend.path):
+        legacy = Settings(RegistryBackend()).load()
+        settings.data = legacy.data
+    return settings
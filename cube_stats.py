@@ -0,0 +1,192 @@
+import csv
+import math
+import os
+
+from cube_core import atomic_write
+from cube_log import SUMMARY
+
+# Post-run QA export, built from the write plan rather than by re-reading
+# the saved workbook: one row per sheet that received a grade row (sheet,
+# grade, source row, casting and layout dates, every specimen value) as a
+# columnar table, and per grade and measurement (Weight, Strength, ... as
+# labelled in the layout) the count, mean, min and sample std of the
+# specimens. A specimen more than LOW_SIGMA standard deviations below its
+# grade's mean is flagged low. The aggregates are computed over whole
+# columns with NumPy when it is installed, in plain Python otherwise (both
+# are imported on first use, so the batch and GUI entry points stay light).
+#
+# Files: <name>_specimens.csv and <name>_stats.csv next to the output, or
+# .parquet when pyarrow is installed and "parquet" is asked for.
+
+STATS_FORMATS = ["csv", "parquet"]
+LOW_SIGMA = 2.0
+
+STAT_COLUMNS = ["grade", "measure", "sheets", "count", "mean", "min", "std", "low_threshold", "low"]
+
+def as_number(value):
+    if isinstance(value, bool) or value is None:
+        return math.nan
+    if isinstance(value, (int, float)):
+        return float(value)
+    try:
+        return float(str(value).strip())
+    except ValueError:
+        return math.nan
+
+def specimen_columns(layout):
+    return [f"{label} {i + 1}" for label, start, stop in layout.grade_groups for i in range(stop - start)]
+
+# {column: list} with one entry per sheet that received a grade row, in
+# plan order. Specimen values are floats (nan when blank or not a number).
+def specimen_table(plan, assignments, layout):
+    date_labels = [label for _, _, label in layout.date_writes]
+    table = {name: [] for name in ["sheet", "grade", "grade_file", "grade_row", "casting_date"] + date_labels}
+    values = []
+
+    for sheet_name, cells in plan.items():
+        assigned = assignments.get(sheet_name, {})
+        if "grade" not in assigned:
+            continue
+        table["sheet"].append(sheet_name)
+        table["grade"].append(str(assigned["grade"]))
+        table["grade_file"].append(os.path.basename(assigned["file"]))
+        table["grade_row"].append(assigned["row"])
+        table["casting_date"].append(str(assigned.get("date", "")))
+        dates = assigned.get("dates", {})
+        for label in date_labels:
+            table[label].append(dates.get(label, ""))
+        values.append([as_number(cells.get(target)) for target in layout.grade_targets])
+
+    for i, name in enumerate(specimen_columns(layout)):
+        table[name] = [row[i] for row in values]
+    return table
+
+def numpy_or_none():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+def _grade_stats_numpy(np, grades, matrix):
+    names, inverse = np.unique(np.array(grades, dtype=object), return_inverse=True)
+    groups = len(names)
+    valid = ~np.isnan(matrix)
+
+    sheets = np.bincount(inverse, minlength=groups)
+    count = np.bincount(inverse, weights=valid.sum(axis=1), minlength=groups)
+    total = np.bincount(inverse, weights=np.where(valid, matrix, 0.0).sum(axis=1), minlength=groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = total / count
+        # Second pass over the deviations; sums of squares lose precision
+        deviation = np.where(valid, matrix - mean[inverse][:, None], 0.0)
+        squares = np.bincount(inverse, weights=(deviation * deviation).sum(axis=1), minlength=groups)
+        std = np.where(count > 1, np.sqrt(squares / (count - 1)), np.nan)
+
+    minimum = np.full(groups, np.inf)
+    np.minimum.at(minimum, inverse, np.where(valid, matrix, np.inf).min(axis=1))
+    minimum[np.isinf(minimum)] = np.nan
+
+    threshold = mean - LOW_SIGMA * std
+    with np.errstate(invalid="ignore"):
+        low_mask = valid & (matrix < threshold[inverse][:, None])
+    low_per_row = low_mask.sum(axis=1)
+    low = np.bincount(inverse, weights=low_per_row, minlength=groups)
+
+    stats = [[str(name), int(s), int(c), float(m), float(lo), float(sd), float(t), int(n)]
+             for name, s, c, m, lo, sd, t, n in zip(names, sheets, count, mean, minimum, std, threshold, low)]
+    return stats, low_per_row.tolist()
+
+def _grade_stats_python(grades, matrix):
+    import statistics
+    by_grade = {}
+    for i, grade in enumerate(grades):
+        by_grade.setdefault(grade, []).append(i)
+
+    stats = []
+    low_per_row = [0] * len(grades)
+    for name in sorted(by_grade):
+        rows = by_grade[name]
+        values = [value for i in rows for value in matrix[i] if not math.isnan(value)]
+        mean = statistics.fmean(values) if values else math.nan
+        std = statistics.stdev(values) if len(values) > 1 else math.nan
+        threshold = mean - LOW_SIGMA * std
+        for i in rows:
+            low_per_row[i] = sum(1 for value in matrix[i] if value < threshold)
+        stats.append([name, len(rows), len(values), mean, min(values) if values else math.nan, std, threshold,
+                      sum(low_per_row[i] for i in rows)])
+    return stats, low_per_row
+
+# Per grade and measurement aggregates, as a {column: list} table. Adds a
+# "<measure> low" column to the specimen table with each sheet's low count.
+def grade_stats(table, layout):
+    stats = {name: [] for name in STAT_COLUMNS}
+    if not table["sheet"]:
+        return stats
+
+    np = numpy_or_none()
+    columns = specimen_columns(layout)
+    offset = 0
+    for label, start, stop in layout.grade_groups:
+        names = columns[offset:offset + stop - start]
+        offset += stop - start
+        if np is not None:
+            matrix = np.column_stack([np.asarray(table[name], dtype=float) for name in names])
+            rows, low_per_row = _grade_stats_numpy(np, table["grade"], matrix)
+        else:
+            matrix = [list(values) for values in zip(*(table[name] for name in names))]
+            rows, low_per_row = _grade_stats_python(table["grade"], matrix)
+
+        table[f"{label} low"] = low_per_row
+        for row in rows:
+            for name, value in zip(STAT_COLUMNS, row[:1] + [label] + row[1:]):
+                stats[name].append(value)
+    return stats
+
+def write_csv(path, table):
+    columns = list(table)
+
+    def write(tmp_path):
+        with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for row in zip(*(table[name] for name in columns)):
+                writer.writerow("" if isinstance(value, float) and math.isnan(value) else value for value in row)
+    atomic_write(path, write)
+
+def write_parquet(path, table):
+    import pyarrow
+    import pyarrow.parquet
+    atomic_write(path, lambda tmp_path: pyarrow.parquet.write_table(pyarrow.table(table), tmp_path))
+
+# Write both tables for one output. base is the output path without its
+# suffix (folder/office). Returns the paths written.
+def export_stats(base, plan, assignments, layout, events, fmt="csv"):
+    table = specimen_table(plan, assignments, layout)
+    if not table["sheet"]:
+        events.emit(SUMMARY, "stats", "\nStats: no grade rows written, nothing to export")
+        return []
+    stats = grade_stats(table, layout)
+
+    writer = write_csv
+    if fmt == "parquet":
+        try:
+            import pyarrow.parquet
+            writer = write_parquet
+        except ImportError:
+            events.emit(SUMMARY, "warning", "⚠ pyarrow is not installed, writing stats as CSV")
+            fmt = "csv"
+
+    paths = [f"{base}_specimens.{fmt}", f"{base}_stats.{fmt}"]
+    writer(paths[0], table)
+    writer(paths[1], stats)
+
+    events(f"\n--- STATS ({len(table['sheet'])} sheets) ---")
+    for row in zip(*(stats[name] for name in STAT_COLUMNS)):
+        grade, measure, _, count, mean, minimum, std, _, low = row
+        events.emit(SUMMARY, "grade_stats", f"{grade} {measure}: n={count} mean={mean:.2f} min={minimum:.2f} "
+                    f"std={std:.2f}" + (f"  ⚠ {low} low" if low else ""),
+                    grade=grade, measure=measure, count=count, low=low)
+    events.emit(SUMMARY, "stats", f"✓ Stats: {', '.join(os.path.basename(path) for path in paths)}",
+                files=paths)
+    return paths
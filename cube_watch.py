@@ -0,0 +1,470 @@
+import argparse
+import ctypes
+import ctypes.util
+import datetime
+import json
+import os
+import select
+import signal
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cube_batch import MODES, collect_xlsx_files, output_key, process_file
+from cube_layout import LayoutError, load_layout
+from cube_cache import ParseCache
+from cube_core import (as_source_list, atomic_write, load_calendar_data, load_grade_data, merge_grade_data,
+                       split_source)
+from cube_log import LEVELS, CallbackSink, EventLog, JsonLinesSink, RotatingTextSink
+from cube_manifest import file_fingerprint
+
+# Watch-folder daemon: processes office templates and grade exports as they
+# land in shared folders. New office files are queued on their own; a new or
+# changed grade file re-queues every known office file (incrementally, so
+# only the affected sheets are rewritten), and so does a grade file that is
+# deleted or moved away. The calendar stays parsed in memory and is
+# reloaded once a change to its file has settled; a calendar that fails to
+# load keeps the previous one in use and re-queues nothing. Events for anything that is not an
+# input (outputs, manifests, the status file, temp files) are ignored, so
+# the output folder may live inside a watched folder.
+
+def is_input_file(path):
+    name = os.path.basename(path)
+    return (name.lower().endswith(".xlsx") and not name.startswith("~$")
+            and not name.endswith("_Processed.xlsx"))
+
+# Linux inotify through libc, no extra dependency
+class InotifyWatcher:
+    IN_MODIFY = 0x00000002
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self, folders):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        self.folders = {}
+        mask = (self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_FROM | self.IN_MOVED_TO | self.IN_CREATE
+                | self.IN_DELETE)
+        for folder in folders:
+            wd = libc.inotify_add_watch(self.fd, os.fsencode(folder), mask)
+            if wd < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {folder}")
+            self.folders[wd] = folder
+
+    def wait(self, timeout):
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+
+        changed = set()
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+
+        offset = 0
+        while offset < len(data):
+            wd, _, _, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            if name and wd in self.folders:
+                changed.add(os.path.join(self.folders[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+# Fallback for other platforms and network shares that do not deliver
+# inotify events: compare (mtime, size) snapshots of the folders. Paths
+# that disappeared are reported too.
+class PollingWatcher:
+    def __init__(self, folders):
+        self.folders = list(folders)
+        self.snapshot = self.scan()
+
+    def scan(self):
+        snapshot = {}
+        for folder in self.folders:
+            try:
+                entries = list(os.scandir(folder))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.path] = (st.st_mtime_ns, st.st_size)
+        return snapshot
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        snapshot = self.scan()
+        changed = {path for path, sig in snapshot.items() if self.snapshot.get(path) != sig}
+        changed.update(path for path in self.snapshot if path not in snapshot)
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+def make_watcher(folders, polling=False):
+    if not polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folders)
+        except (OSError, AttributeError):
+            pass
+    return PollingWatcher(folders)
+
+class WatchDaemon:
+    def __init__(self, office_dirs, grade_dirs, calendar_file, output_folder, mode="both",
+                 workers=2, settle=2.0, poll_interval=1.0, status_file=None, polling=False,
+                 process_existing=False, events=None, cache=None, log_level=LEVELS["summary"], layout=None):
+        self.office_dirs = [os.path.abspath(d) for d in office_dirs]
+        self.grade_dirs = [os.path.abspath(d) for d in grade_dirs]
+        self.calendar_file = calendar_file
+        self.output_folder = output_folder
+        self.mode = mode
+        self.workers = max(1, workers)
+        self.settle = settle
+        self.poll_interval = poll_interval
+        self.status_file = status_file or os.path.join(output_folder, "cube_watch_status.json")
+        self.polling = polling
+        self.events = events or EventLog(LEVELS["summary"], [CallbackSink(print)])
+        self.cache = cache
+        self.log_level = log_level
+        self.layout = layout
+
+        self.calendar_data = None
+        self.calendar_fingerprint = None    # of the last load attempt, successful or not
+        self.calendar_paths = sorted({os.path.abspath(split_source(source)[0])
+                                      for source in as_source_list(calendar_file)})
+        self.grade_data = []
+        self.grade_files = []
+
+        self.pending = {}       # path -> (signature, time the signature was first seen)
+        self.outputs = {}       # output_key -> the office file that writes it
+        self.known_offices = [office_file for office_file in collect_xlsx_files(self.office_dirs)
+                              if self.claim_output(office_file)]
+        self.queue = list(self.known_offices) if process_existing else []
+        self.running = {}       # future -> (office file, start time)
+        self.completed = []
+        self.failed = []
+        self.stopping = False
+
+    # Inputs
+
+    # True only when new calendar data was loaded. The fingerprint is kept
+    # even when the load fails, so a calendar that cannot be parsed (say,
+    # one still being copied in) is retried once it changes again, not on
+    # every poll; the previous calendar stays in use meanwhile.
+    def reload_calendar(self, force=False):
+        if self.mode not in ["date_only", "both"]:
+            return True
+        try:
+            fingerprint = self.calendar_fingerprints()
+        except OSError:
+            fingerprint = None
+        if not force and fingerprint == self.calendar_fingerprint:
+            return False
+        self.calendar_fingerprint = fingerprint
+
+        calendar_data = load_calendar_data(self.calendar_file, self.events, self.cache)
+        if not calendar_data:
+            return False
+        self.calendar_data = calendar_data
+        return True
+
+    def reload_grades(self):
+        if self.mode not in ["grade_only", "both"]:
+            return
+        grade_files = collect_xlsx_files(self.grade_dirs)
+        self.grade_files = grade_files
+        sources = []
+        for grade_file in grade_files:
+            try:
+                sources.append(load_grade_data(grade_file, self.cache))
+            except Exception as e:
+                self.events.emit(LEVELS["summary"], "warning", f"⚠ Grade file skipped: {grade_file} ({e})",
+                                 file=grade_file)
+        self.grade_data = merge_grade_data(sources, self.events)
+        self.events(f"✓ Grades loaded: {len(self.grade_data)} grade(s) from {len(sources)} file(s)")
+
+    # Debounce: a file is ready once its size and mtime have not changed
+    # for `settle` seconds and it can be opened for reading.
+    def ready_files(self, now):
+        ready = []
+        for path, (signature, since) in list(self.pending.items()):
+            try:
+                st = os.stat(path)
+            except OSError:
+                del self.pending[path]
+                continue
+            current = (st.st_mtime_ns, st.st_size)
+            if current != signature:
+                self.pending[path] = (current, now)
+                continue
+            if now - since < self.settle:
+                continue
+            try:
+                with open(path, "rb"):
+                    pass
+            except OSError:
+                continue
+            del self.pending[path]
+            ready.append(path)
+        return ready
+
+    # Sort watcher events. Input files that exist start settling; a grade
+    # file that is gone changes the grades at once, and an office template
+    # that is gone is no longer re-queued. Returns (dirty, grades_changed).
+    def note_changes(self, changed, now):
+        dirty = grades_changed = False
+        for path in changed:
+            if not is_input_file(path):
+                continue
+            dirty = True
+            if os.path.exists(path):
+                self.pending[path] = ((None, None), now)
+                continue
+            self.pending.pop(path, None)
+            if path in self.grade_files:
+                self.events(f"Grade file removed: {os.path.basename(path)}")
+                grades_changed = True
+            elif path in self.known_offices:
+                self.known_offices.remove(path)
+                del self.outputs[output_key(path, self.output_folder)]
+                if path in self.queue:
+                    self.queue.remove(path)
+        return dirty, grades_changed
+
+    # The calendar need not be in a watched folder: its files are compared
+    # with the last load attempt on every poll, and a change settles in
+    # `pending` like any other input before it is reloaded.
+    def note_calendar_changes(self, now):
+        if self.mode not in ["date_only", "both"]:
+            return
+        if self.current_calendar_fingerprint() == self.calendar_fingerprint:
+            return
+        for path in self.calendar_paths:
+            if path not in self.pending:
+                self.pending[path] = ((None, None), now)
+
+    # Office files with the same name in different office folders would
+    # write the same output: the first one seen keeps it, later ones are
+    # refused (until the first is removed).
+    def claim_output(self, office_file):
+        owner = self.outputs.setdefault(output_key(office_file, self.output_folder), office_file)
+        if owner == office_file:
+            return True
+        self.events.emit(LEVELS["summary"], "error",
+                         f"✖ {office_file} skipped: {os.path.basename(owner)} in another folder "
+                         f"already writes to the same output ({owner})", file=office_file, owner=owner)
+        return False
+
+    def in_folders(self, path, folders):
+        return os.path.dirname(os.path.abspath(path)) in folders
+
+    def enqueue(self, office_file):
+        if office_file not in self.queue:
+            self.queue.append(office_file)
+
+    # Status
+
+    def write_status(self):
+        status = {
+            "updated": datetime.datetime.now().isoformat(timespec="seconds"),
+            "queued": list(self.queue),
+            "running": [office_file for office_file, _ in self.running.values()],
+            "pending": sorted(self.pending),
+            "completed": self.completed[-100:],
+            "failed": self.failed[-100:],
+        }
+
+        def write(tmp_path):
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(status, f, indent=1)
+        try:
+            atomic_write(self.status_file, write)
+        except OSError as e:
+            self.events.emit(LEVELS["summary"], "warning", f"⚠ Could not write status: {e}")
+
+    def finish(self, future):
+        office_file, _ = self.running.pop(future)
+        finished = datetime.datetime.now().isoformat(timespec="seconds")
+        try:
+            result = future.result()
+        except Exception as e:
+            result = {"file": office_file, "ok": False, "rows": 0, "seconds": 0.0,
+                      "log": [{"time": time.time(), "level": LEVELS["summary"], "event": "error",
+                               "message": f"✖ ERROR: {e}"}]}
+
+        entry = {"file": office_file, "rows": result["rows"], "seconds": round(result["seconds"], 3),
+                 "finished": finished}
+        if result["ok"]:
+            for record in result["log"]:
+                self.events.dispatch_to_logs(record)
+            self.completed.append(entry)
+            self.events.emit(LEVELS["summary"], "file_done",
+                             f"✓ {os.path.basename(office_file)}: {result['rows']} rows in {result['seconds']:.2f}s",
+                             **entry)
+        else:
+            errors = [r["message"] for r in result["log"] if r["event"] == "error"]
+            entry["error"] = errors[-1] if errors else "failed"
+            self.failed.append(entry)
+            for record in result["log"]:
+                self.events.dispatch(record)
+
+    # Main loop
+
+    def run(self):
+        os.makedirs(self.output_folder, exist_ok=True)
+        if not self.reload_calendar(force=True):
+            self.events.emit(LEVELS["summary"], "error", "✖ Cannot proceed without calendar file")
+            return 1
+        self.reload_grades()
+
+        watcher = make_watcher(self.office_dirs + self.grade_dirs, self.polling)
+        self.events(f"Watching {len(self.office_dirs + self.grade_dirs)} folder(s) "
+                    f"with {type(watcher).__name__} - Ctrl+C to stop")
+        self.write_status()
+
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            try:
+                while not self.stopping:
+                    changed = watcher.wait(self.poll_interval)
+                    now = time.monotonic()
+                    dirty, grades_changed = self.note_changes(changed, now)
+                    self.note_calendar_changes(now)
+                    calendar_ready = False
+                    for path in self.ready_files(now):
+                        dirty = True
+                        if path in self.calendar_paths:
+                            calendar_ready = True
+                        elif self.in_folders(path, self.grade_dirs):
+                            grades_changed = True
+                        elif self.in_folders(path, self.office_dirs):
+                            if path not in self.known_offices:
+                                if not self.claim_output(path):
+                                    continue
+                                self.known_offices.append(path)
+                            self.enqueue(path)
+
+                    if calendar_ready and self.reload_calendar():
+                        for office_file in self.known_offices:
+                            self.enqueue(office_file)
+
+                    if grades_changed:
+                        self.reload_grades()
+                        for office_file in self.known_offices:
+                            self.enqueue(office_file)
+
+                    # Bounded: never more jobs in flight than workers
+                    while self.queue and len(self.running) < self.workers:
+                        office_file = self.queue.pop(0)
+                        if office_file in [f for f, _ in self.running.values()]:
+                            self.queue.append(office_file)
+                            break
+                        future = pool.submit(process_file, office_file, self.output_folder, self.mode,
+                                             self.calendar_data, self.grade_data, self.log_level,
+                                             incremental=True, layout=self.layout)
+                        self.running[future] = (office_file, time.time())
+                        dirty = True
+
+                    for future in [f for f in self.running if f.done()]:
+                        self.finish(future)
+                        dirty = True
+
+                    if dirty:
+                        self.write_status()
+            finally:
+                watcher.close()
+                for future in list(self.running):
+                    if future.cancel():
+                        self.queue.insert(0, self.running.pop(future)[0])
+                    else:
+                        self.finish(future)
+                self.write_status()
+        return 0
+
+    def current_calendar_fingerprint(self):
+        if self.mode not in ["date_only", "both"]:
+            return self.calendar_fingerprint
+        try:
+            return self.calendar_fingerprints()
+        except OSError:
+            return self.calendar_fingerprint
+
+    def calendar_fingerprints(self):
+        return [file_fingerprint(split_source(source)[0]) for source in as_source_list(self.calendar_file)]
+
+    def stop(self, *args):
+        self.stopping = True
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Cube Data Processor - watch-folder daemon")
+    parser.add_argument("--office-dir", action="append", default=[], required=True,
+                        help="folder receiving office templates (repeatable)")
+    parser.add_argument("--grade-dir", action="append", default=[], help="folder receiving grade exports (repeatable)")
+    parser.add_argument("-c", "--calendar", action="append", default=[],
+                        help="calendar workbook, book.xlsx#Sheet or book.xlsx#* (repeatable, first wins)")
+    parser.add_argument("-o", "--output", required=True, help="output folder")
+    parser.add_argument("-m", "--mode", choices=MODES, default="both")
+    parser.add_argument("-j", "--workers", type=int, default=2, help="worker processes")
+    parser.add_argument("--settle", type=float, default=2.0, help="seconds a file must stay unchanged before it is processed")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="seconds between folder checks")
+    parser.add_argument("--poll", action="store_true", help="use polling instead of inotify")
+    parser.add_argument("--process-existing", action="store_true", help="also process office files already present")
+    parser.add_argument("--status-file", default=None, help="JSON status file (default: in the output folder)")
+    parser.add_argument("--log-level", choices=list(LEVELS), default="summary")
+    parser.add_argument("--log-file", default=None, help="rotating plain-text log file")
+    parser.add_argument("--audit-file", default=None, help="JSON-lines audit file")
+    parser.add_argument("--layout", default=None, help="layout profile JSON (default: standard template)")
+    parser.add_argument("--no-cache", action="store_true", help="bypass the parse cache")
+    args = parser.parse_args(argv)
+
+    if args.mode in ["grade_only", "both"] and not args.grade_dir:
+        parser.error("--grade-dir is required for grade processing")
+    if args.mode in ["date_only", "both"] and not args.calendar:
+        parser.error("a calendar file is required for date processing")
+    try:
+        layout = load_layout(args.layout) if args.layout else None
+    except LayoutError as e:
+        parser.error(str(e))
+    overlap = {os.path.abspath(d) for d in args.office_dir} & {os.path.abspath(d) for d in args.grade_dir}
+    if overlap:
+        parser.error("office and grade folders must be different")
+
+    sinks = [CallbackSink(print)]
+    if args.log_file:
+        sinks.append(RotatingTextSink(args.log_file))
+    if args.audit_file:
+        sinks.append(JsonLinesSink(args.audit_file))
+    events = EventLog(LEVELS["summary"], sinks)
+
+    daemon = WatchDaemon(args.office_dir, args.grade_dir, args.calendar, args.output, args.mode,
+                         workers=args.workers, settle=args.settle, poll_interval=args.poll_interval,
+                         status_file=args.status_file, polling=args.poll,
+                         process_existing=args.process_existing, events=events,
+                         cache=ParseCache(enabled=not args.no_cache), log_level=LEVELS[args.log_level],
+                         layout=layout)
+    signal.signal(signal.SIGINT, daemon.stop)
+    signal.signal(signal.SIGTERM, daemon.stop)
+
+    try:
+        return daemon.run()
+    finally:
+        events.close()
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,258 @@
+import math
+import posixpath
+import re
+import shutil
+import xml.etree.ElementTree as ET
+import zipfile
+from xml.sax.saxutils import escape
+
+from openpyxl.cell.cell import ERROR_CODES, ILLEGAL_CHARACTERS_RE
+from openpyxl.utils.cell import column_index_from_string, coordinate_from_string, get_column_letter
+
+from cube_core import atomic_write
+
+# Fast-path writer: applies a write plan ({sheet: {(row, col): value}}) by
+# editing the sheet XML parts inside the xlsx zip. Only the sheets in the
+# plan are touched, and only their target cells; every other part (styles,
+# drawings, untouched sheets) is streamed through unchanged, without
+# building the openpyxl object model. Anything outside the simple cases it
+# knows (formulas, dates, prefixed XML, macro workbooks) raises
+# UnsupportedPatch so the caller can fall back to openpyxl.
+#
+# Like an openpyxl save, the output asks Excel to recalculate on load
+# (calcPr fullCalcOnLoad) and keeps no cached formula results: formulas that
+# read the target cells would otherwise show the template's old values.
+
+REL_NS = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+PKG_REL_NS = "http://schemas.openxmlformats.org/package/2006/relationships"
+MAIN_NS = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+OFFICE_DOCUMENT = REL_NS + "/officeDocument"
+WORKBOOK_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"
+
+SHEET_DATA_RE = re.compile(r"<sheetData\s*/>|<sheetData>(.*?)</sheetData>", re.S)
+ROW_RE = re.compile(r"<row\b[^>]*?/>|<row\b[^>]*>.*?</row>", re.S)
+CELL_RE = re.compile(r"<c\b[^>]*?/>|<c\b[^>]*>.*?</c>", re.S)
+ATTR_RE = re.compile(r'([\w:]+)="([^"]*)"')
+DIMENSION_RE = re.compile(r'<dimension ref="([^"]*)"\s*/>')
+CACHED_VALUE_RE = re.compile(r"<v>[^<]*</v>|<v\s*/>")
+CALC_PR_RE = re.compile(r"<calcPr\b([^>]*?)(/?)>")
+FULL_CALC_RE = re.compile(r'\sfullCalcOnLoad="[^"]*"')
+# calcPr goes after sheets/definedNames and before any of these
+AFTER_CALC_PR_RE = re.compile(r"<(?:oleSize|customWorkbookViews|pivotCaches|smartTagPr|smartTagTypes|"
+                              r"webPublishing|fileRecoveryPr|webPublishObjects|extLst)\b|</workbook>")
+
+class UnsupportedPatch(Exception):
+    pass
+
+def _attrs(tag_xml):
+    head = tag_xml[:tag_xml.index(">")]
+    return dict(ATTR_RE.findall(head))
+
+def _resolve(base_dir, target):
+    if target.startswith("/"):
+        return target.lstrip("/")
+    return posixpath.normpath(posixpath.join(base_dir, target))
+
+def _rels_path(part):
+    folder, name = posixpath.split(part)
+    return posixpath.join(folder, "_rels", f"{name}.rels")
+
+def workbook_part(zf):
+    content_types = zf.read("[Content_Types].xml").decode("utf-8")
+    if WORKBOOK_TYPE not in content_types:
+        raise UnsupportedPatch("not a plain .xlsx workbook (macro-enabled or template)")
+
+    rels = ET.fromstring(zf.read("_rels/.rels"))
+    return next(_resolve("", rel.get("Target")) for rel in rels.iter(f"{{{PKG_REL_NS}}}Relationship")
+                if rel.get("Type") == OFFICE_DOCUMENT)
+
+# Sheet name -> zip part of its XML, following the package relationships
+def sheet_parts(zf, workbook_part_name=None):
+    workbook_part_name = workbook_part_name or workbook_part(zf)
+    workbook_dir = posixpath.dirname(workbook_part_name)
+
+    workbook_rels = ET.fromstring(zf.read(_rels_path(workbook_part_name)))
+    targets = {rel.get("Id"): _resolve(workbook_dir, rel.get("Target"))
+               for rel in workbook_rels.iter(f"{{{PKG_REL_NS}}}Relationship")}
+
+    workbook = ET.fromstring(zf.read(workbook_part_name))
+    return {sheet.get("name"): targets[sheet.get(f"{{{REL_NS}}}id")]
+            for sheet in workbook.iter(f"{{{MAIN_NS}}}sheet")}
+
+def cell_xml(ref, value, style):
+    s = f' s="{style}"' if style is not None else ""
+    if value is None:
+        return f'<c r="{ref}"{s}/>'
+    if isinstance(value, bool):
+        return f'<c r="{ref}"{s} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, int):
+        return f'<c r="{ref}"{s}><v>{value}</v></c>'
+    if isinstance(value, float):
+        if not math.isfinite(value):
+            raise UnsupportedPatch(f"{ref}: non-finite number")
+        return f'<c r="{ref}"{s}><v>{value!r}</v></c>'
+    if isinstance(value, str):
+        if value.startswith("=") and len(value) > 1:
+            raise UnsupportedPatch(f"{ref}: formula")
+        # Same limits openpyxl applies when a value is assigned
+        value = value[:32767]
+        if ILLEGAL_CHARACTERS_RE.search(value):
+            raise UnsupportedPatch(f"{ref}: illegal characters")
+        if value in ERROR_CODES:
+            return f'<c r="{ref}"{s} t="e"><v>{escape(value)}</v></c>'
+        space = ' xml:space="preserve"' if value != value.strip() else ""
+        return f'<c r="{ref}"{s} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+    raise UnsupportedPatch(f"{ref}: cannot write {type(value).__name__} values")
+
+def _patch_row(row_xml, row, cells):
+    attrs = _attrs(row_xml)
+    if row_xml.endswith("/>"):
+        existing = []
+    else:
+        body = row_xml[row_xml.index(">") + 1:-len("</row>")]
+        if CELL_RE.sub("", body).strip():
+            raise UnsupportedPatch(f"row {row}: unexpected content")
+        existing = CELL_RE.findall(body)
+
+    by_column = {}
+    for c in existing:
+        ref = _attrs(c).get("r")
+        if ref is None:
+            raise UnsupportedPatch(f"row {row}: cell without a reference")
+        by_column[column_index_from_string(coordinate_from_string(ref)[0])] = c
+
+    for column, value in cells.items():
+        ref = f"{get_column_letter(column)}{row}"
+        old = by_column.get(column)
+        style = None
+        if old is not None:
+            if "<f" in old:
+                raise UnsupportedPatch(f"{ref}: overwrites a formula")
+            style = _attrs(old).get("s")
+        by_column[column] = cell_xml(ref, value, style)
+
+    # spans is only a hint and may no longer cover the new cells
+    attrs.pop("spans", None)
+    head = " ".join(f'{name}="{value}"' for name, value in attrs.items())
+    return f"<row {head}>{''.join(by_column[c] for c in sorted(by_column))}</row>"
+
+def _widen_dimension(xml, refs):
+    match = DIMENSION_RE.search(xml)
+    if match is None or not refs:
+        return xml
+    bounds = match.group(1).split(":")
+    points = [coordinate_from_string(b) for b in bounds] + refs
+    cols = [column_index_from_string(col) for col, _ in points]
+    rows = [row for _, row in points]
+    ref = f"{get_column_letter(min(cols))}{min(rows)}:{get_column_letter(max(cols))}{max(rows)}"
+    return xml[:match.start()] + f'<dimension ref="{ref}"/>' + xml[match.end():]
+
+# Have Excel recalculate every formula when the workbook is opened
+def force_full_calc(xml):
+    match = CALC_PR_RE.search(xml)
+    if match is not None:
+        attrs = FULL_CALC_RE.sub("", match.group(1))
+        return xml[:match.start()] + f'<calcPr{attrs} fullCalcOnLoad="1"{match.group(2)}>' + xml[match.end():]
+    sheets_end = xml.find("</sheets>")
+    anchor = AFTER_CALC_PR_RE.search(xml, sheets_end) if sheets_end >= 0 else None
+    if anchor is None:
+        raise UnsupportedPatch("no place for calcPr in the workbook part (prefixed or unusual XML)")
+    return xml[:anchor.start()] + '<calcPr fullCalcOnLoad="1"/>' + xml[anchor.start():]
+
+def _drop_cached_value(match):
+    cell = match.group(0)
+    return CACHED_VALUE_RE.sub("", cell) if "<f" in cell else cell
+
+# Remove the cached results of formula cells from sheetData XML text
+def drop_cached_values(body):
+    if "<f" not in body:
+        return body
+    return CELL_RE.sub(_drop_cached_value, body)
+
+def clear_formula_cache(xml):
+    match = SHEET_DATA_RE.search(xml)
+    if match is None or not match.group(1) or "<f" not in match.group(1):
+        return xml
+    return xml[:match.start(1)] + drop_cached_values(match.group(1)) + xml[match.end(1):]
+
+# Apply {(row, col): value} to one sheet's XML text
+def patch_sheet_xml(xml, cells):
+    match = SHEET_DATA_RE.search(xml)
+    if match is None:
+        raise UnsupportedPatch("no sheetData (prefixed or unusual XML)")
+    body = match.group(1) or ""
+
+    by_row = {}
+    for (row, column), value in cells.items():
+        by_row.setdefault(row, {})[column] = value
+
+    rows = {}
+    order = []
+    for row_xml in ROW_RE.findall(body):
+        r = _attrs(row_xml).get("r")
+        if r is None:
+            raise UnsupportedPatch("row without a number")
+        rows[int(r)] = row_xml
+        order.append(int(r))
+    if ROW_RE.sub("", body).strip():
+        raise UnsupportedPatch("unexpected content in sheetData")
+
+    for row, row_cells in by_row.items():
+        if row not in rows:
+            order.append(row)
+            rows[row] = f'<row r="{row}"/>'
+        rows[row] = _patch_row(rows[row], row, row_cells)
+
+    new_body = drop_cached_values("".join(rows[r] for r in sorted(order)))
+    xml = xml[:match.start()] + f"<sheetData>{new_body}</sheetData>" + xml[match.end():]
+    return _widen_dimension(xml, [(get_column_letter(c), r) for r, c in cells])
+
+# Write source + plan to outpath through a temp file renamed into place.
+# source may be outpath itself (incremental runs patch the last output).
+# Sheets are patched one at a time as the zip is copied, so only one sheet's
+# XML is in memory; check, if given, is called after each patched sheet
+# (cancellation, memory budget) and may raise to abandon the write. Sheets
+# outside the plan lose their cached formula results too, since their
+# formulas may read patched cells.
+def patch_workbook(source, outpath, plan, sheet_names=None, check=None):
+    names = list(plan if sheet_names is None else sheet_names)
+    atomic_write(outpath, lambda tmp_path: _write_patched_zip(source, tmp_path, plan, names, check))
+
+def _write_patched_zip(source, target, plan, names, check):
+    with zipfile.ZipFile(source) as zin:
+        main_part = workbook_part(zin)
+        parts = sheet_parts(zin, main_part)
+        sheet_files = set(parts.values())
+        to_patch = {}
+        for sheet_name in names:
+            part = parts.get(sheet_name)
+            if part is None:
+                raise UnsupportedPatch(f"sheet {sheet_name} not found")
+            to_patch[part] = sheet_name
+        missing = set(to_patch) - set(zin.namelist())
+        if missing:
+            raise UnsupportedPatch(f"sheet part {min(missing)} missing")
+
+        with zipfile.ZipFile(target, "w") as zout:
+            for info in zin.infolist():
+                out_info = zipfile.ZipInfo(info.filename, info.date_time)
+                out_info.compress_type = info.compress_type
+                out_info.external_attr = info.external_attr
+                if info.filename in to_patch:
+                    xml = zin.read(info).decode("utf-8")
+                    zout.writestr(out_info, patch_sheet_xml(xml, plan[to_patch[info.filename]]).encode("utf-8"))
+                    if check is not None:
+                        check()
+                    continue
+                if info.filename == main_part:
+                    xml = zin.read(info).decode("utf-8")
+                    zout.writestr(out_info, force_full_calc(xml).encode("utf-8"))
+                    continue
+                if info.filename in sheet_files:
+                    data = zin.read(info)
+                    if b"<f" in data:
+                        data = clear_formula_cache(data.decode("utf-8")).encode("utf-8")
+                    zout.writestr(out_info, data)
+                    continue
+                with zin.open(info) as src, zout.open(out_info, "w", force_zip64=info.file_size > 2 ** 31) as dst:
+                    shutil.copyfileobj(src, dst, 1024 * 1024)
@@ -0,0 +1,62 @@
+import pytest
+
+from cube_cache import ParseCache
+from cube_core import atomic_write
+from cube_manifest import save_manifest
+from cube_plan import save_plan
+from cube_settings import FileBackend
+from cube_stats import write_csv
+
+# A write that fails part-way keeps the previous file and leaves no temp
+# file behind.
+
+class Unserializable:
+    pass
+
+def test_atomic_write_replaces(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+    atomic_write(str(path), lambda tmp_path: open(tmp_path, "w").write("new"))
+    assert path.read_text() == "new"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+def test_atomic_write_failure_keeps_old_file(tmp_path):
+    path = tmp_path / "out.txt"
+    path.write_text("old")
+
+    def writer(tmp_path):
+        with open(tmp_path, "w") as f:
+            f.write("half")
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        atomic_write(str(path), writer)
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out.txt"]
+
+def failing_column():
+    yield 1
+    raise ValueError("column ended early")
+
+# Each writer fails after it has started writing: json cannot encode the
+# object, the CSV column raises after its first row
+@pytest.mark.parametrize("save, value", [
+    (save_manifest, {"bad": Unserializable()}),
+    (save_plan, {"bad": Unserializable()}),
+    (lambda path, value: FileBackend(path).write(value), {"bad": Unserializable()}),
+    (write_csv, {"a": failing_column()}),
+])
+def test_failed_writers_leave_nothing_behind(tmp_path, save, value):
+    path = tmp_path / "out"
+    path.write_text("old")
+    with pytest.raises((TypeError, ValueError)):
+        save(str(path), value)
+    assert path.read_text() == "old"
+    assert [p.name for p in tmp_path.iterdir()] == ["out"]
+
+def test_cache_store_failure_leaves_nothing_behind(tmp_path):
+    source = tmp_path / "book.xlsx"
+    source.write_bytes(b"x")
+    cache = ParseCache(str(tmp_path / "cache"))
+    cache.store("grade", str(source), lambda: None)
+    assert list((tmp_path / "cache").iterdir()) == []
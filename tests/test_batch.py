@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+from cube_batch import output_collisions, output_key, run_batch
+from cube_bench import make_dataset
+from cube_log import LEVELS, CallbackSink, EventLog, JsonLinesSink
+
+SHEETS = 20
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    return make_dataset(str(tmp_path_factory.mktemp("batch")), SHEETS, 2, 30, 60)
+
+def audit_events(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["event"] for line in f]
+
+@pytest.mark.parametrize("verbose", [False, True])
+def test_worker_records_reach_the_log_files(dataset, tmp_path, verbose):
+    console = []
+    audit_path = tmp_path / "audit.jsonl"
+    events = EventLog(LEVELS["row"], [CallbackSink(console.append), JsonLinesSink(str(audit_path))])
+    results = run_batch([dataset["office"]], dataset["grades"], dataset["calendar"], str(tmp_path / "out"),
+                        "both", workers=1, log_callback=events, verbose=verbose, log_level=LEVELS["row"])
+    events.close()
+    assert [result["ok"] for result in results] == [True]
+
+    audit = audit_events(audit_path)
+    for event in ["sheet_matched", "row_copied", "date_filled"]:
+        assert audit.count(event) == SHEETS
+    # The console gets the per-file detail only with verbose
+    detail = [message for message in console if "Matched sheet" in message or "✓ Row " in message]
+    assert bool(detail) == verbose
+
+def test_colliding_outputs_are_refused(dataset, tmp_path):
+    other = tmp_path / "other"
+    other.mkdir()
+    copy = other / "office.xlsx"
+    copy.write_bytes(open(dataset["office"], "rb").read())
+    messages = []
+    output_folder = tmp_path / "out"
+    results = run_batch([dataset["office"], str(copy)], dataset["grades"], dataset["calendar"], str(output_folder),
+                        "both", workers=2, log_callback=messages.append)
+    assert results == []
+    assert any("share an output" in message for message in messages)
+    assert not output_folder.exists()
+
+def test_output_collisions():
+    assert output_collisions(["a/office.xlsx", "b/office.xlsx", "a/other.xlsx"], "out") == {
+        output_key("a/office.xlsx", "out"): ["a/office.xlsx", "b/office.xlsx"]}
+    assert output_collisions(["book.xlsx#One", "book.xlsx#Two"], "out")
+    assert output_collisions(["a/office.xlsx", "a/other.xlsx"], "out") == {}
@@ -0,0 +1,84 @@
+import openpyxl
+import pytest
+
+import cube_profile
+import cube_xlsxpatch
+from cube_bench import make_dataset, memory_floor, run_in_subprocess
+from cube_core import process_combined
+
+# Low-memory mode on a generated large workbook, each run in a fresh
+# process so its peak RSS is its own. The budget is the import floor plus
+# BUDGET_HEADROOM_MB: at this size the low-memory run fits in it and the
+# openpyxl writer does not.
+
+SHEETS = 1500
+BUDGET_HEADROOM_MB = 20
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    return make_dataset(str(tmp_path_factory.mktemp("large")), SHEETS, 4, 400, 365)
+
+@pytest.fixture(scope="module")
+def budget_mb():
+    floor = memory_floor()
+    assert floor is not None
+    return round(floor + BUDGET_HEADROOM_MB)
+
+def output_for(folder):
+    return folder / "office_Processed.xlsx"
+
+def assert_nothing_saved(folder):
+    assert list(folder.iterdir()) == []
+
+def test_low_memory_run_stays_within_budget(dataset, budget_mb, tmp_path):
+    result = run_in_subprocess(dataset, str(tmp_path), {"low_memory": True, "memory_budget": budget_mb})
+    assert result["errors"] == []
+    assert result["rows"] == SHEETS
+    assert result["peak_mb"] <= budget_mb
+
+    wb = openpyxl.load_workbook(output_for(tmp_path), read_only=True)
+    assert wb.calculation.fullCalcOnLoad
+    wb.close()
+    assert (tmp_path / "office_Processed.manifest.json").exists()
+
+def test_budget_stops_the_openpyxl_writer(dataset, budget_mb, tmp_path):
+    result = run_in_subprocess(dataset, str(tmp_path), {"memory_budget": budget_mb})
+    assert result["rows"] == 0
+    assert any("Memory budget exceeded" in error for error in result["errors"])
+    assert_nothing_saved(tmp_path)
+
+def test_budget_below_floor_saves_nothing(dataset, budget_mb, tmp_path):
+    result = run_in_subprocess(dataset, str(tmp_path), {"low_memory": True,
+                                                        "memory_budget": budget_mb - BUDGET_HEADROOM_MB * 2})
+    assert result["rows"] == 0
+    assert any("Memory budget exceeded" in error for error in result["errors"])
+    assert_nothing_saved(tmp_path)
+
+# Exceeding the budget part way through writing the output: the temp file
+# is discarded and an earlier output and its manifest are left as they were
+def test_budget_exceeded_while_writing(dataset, tmp_path, monkeypatch):
+    messages = []
+    rows = process_combined(dataset["grades"], dataset["office"], str(tmp_path), dataset["calendar"], "both",
+                            messages.append, low_memory=True)
+    assert rows == SHEETS
+    output = output_for(tmp_path)
+    manifest = tmp_path / "office_Processed.manifest.json"
+    before = {path.name: path.read_bytes() for path in (output, manifest)}
+
+    patched = []
+    patch_sheet_xml = cube_xlsxpatch.patch_sheet_xml
+    def counting_patch(xml, cells):
+        patched.append(cells)
+        return patch_sheet_xml(xml, cells)
+    monkeypatch.setattr(cube_xlsxpatch, "patch_sheet_xml", counting_patch)
+    # Over any budget once 100 sheets have been written
+    monkeypatch.setattr(cube_profile, "current_rss", lambda: 2 ** 40 if len(patched) >= 100 else 0)
+
+    messages.clear()
+    rows = process_combined(dataset["grades"], dataset["office"], str(tmp_path), dataset["calendar"], "both",
+                            messages.append, low_memory=True, memory_budget=10_000)
+    assert rows == 0
+    assert len(patched) == 100
+    assert any(message.startswith("✖ Memory budget exceeded") for message in messages)
+    assert {path.name: path.read_bytes() for path in (output, manifest)} == before
+    assert sorted(path.name for path in tmp_path.iterdir()) == sorted(before)
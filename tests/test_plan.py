@@ -0,0 +1,36 @@
+import pytest
+
+from cube_bench import make_dataset
+from cube_core import ProcessingCancelled
+from cube_log import EventLog
+from cube_plan import make_plan
+
+SHEETS = 300
+
+@pytest.fixture(scope="module")
+def dataset(tmp_path_factory):
+    return make_dataset(str(tmp_path_factory.mktemp("plan")), SHEETS, 2, 50, 60)
+
+def plan(dataset, check_cancel=None):
+    return make_plan(dataset["grades"], dataset["office"], dataset["calendar"], "both", EventLog(),
+                     check_cancel=check_cancel)
+
+def test_plan_checks_for_cancel(dataset):
+    calls = []
+    plan_doc = plan(dataset, lambda: calls.append(1))
+    assert plan_doc["cells"] == plan(dataset)["cells"]
+    assert len(plan_doc["cells"]) == SHEETS
+    assert len(calls) > 1
+
+@pytest.mark.parametrize("after", [0, 3])
+def test_cancelled_plan_stops(dataset, after):
+    calls = []
+
+    def check_cancel():
+        calls.append(1)
+        if len(calls) > after:
+            raise ProcessingCancelled()
+
+    with pytest.raises(ProcessingCancelled):
+        plan(dataset, check_cancel)
+    assert len(calls) == after + 1
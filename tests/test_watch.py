@@ -0,0 +1,178 @@
+import os
+import threading
+import time
+from concurrent.futures import Future
+
+import pytest
+
+from cube_bench import make_calendar_workbook, make_grade_workbook, make_office_workbook
+from cube_log import CallbackSink, EventLog
+from cube_watch import InotifyWatcher, PollingWatcher, WatchDaemon
+
+# The watch daemon's event handling: its own output must not wake it up,
+# grade files that disappear must change the grades, and a calendar that
+# cannot be loaded must not re-queue anything.
+
+@pytest.fixture
+def folders(tmp_path):
+    office = tmp_path / "office"
+    grades = tmp_path / "grades"
+    office.mkdir()
+    grades.mkdir()
+    make_calendar_workbook(tmp_path / "calendar.xlsx", 30)
+    make_grade_workbook(grades / "M20.xlsx", 10)
+    make_grade_workbook(grades / "M25.xlsx", 10)
+    return {"office": str(office), "grades": str(grades), "calendar": str(tmp_path / "calendar.xlsx")}
+
+def make_daemon(folders, output_folder, **options):
+    options.setdefault("events", EventLog())
+    return WatchDaemon([folders["office"]], [folders["grades"]], folders["calendar"], output_folder,
+                       settle=0.1, poll_interval=0.05, **options)
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+@pytest.mark.parametrize("polling", [False, True])
+def test_idle_daemon_ignores_its_own_status_file(folders, polling):
+    daemon = make_daemon(folders, folders["office"], polling=polling)
+    writes = []
+    write_status = daemon.write_status
+    daemon.write_status = lambda: (writes.append(time.monotonic()), write_status())
+
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    try:
+        time.sleep(1.5)
+    finally:
+        daemon.stop()
+        thread.join(10)
+    assert not thread.is_alive()
+    # One status write on start and one on stop, none while idle
+    assert len(writes) == 2
+
+@pytest.mark.parametrize("watcher_class", [InotifyWatcher, PollingWatcher])
+def test_watchers_report_removed_files(folders, watcher_class):
+    grade_file = os.path.join(folders["grades"], "M20.xlsx")
+    watcher = watcher_class([folders["grades"]])
+    try:
+        os.remove(grade_file)
+        assert grade_file in watcher.wait(0.1)
+    finally:
+        watcher.close()
+
+def test_removed_grade_file_changes_grades(folders):
+    daemon = make_daemon(folders, os.path.join(folders["office"], "out"))
+    daemon.reload_grades()
+    assert {grade["grade"] for grade in daemon.grade_data} == {"M20", "M25"}
+
+    grade_file = os.path.join(folders["grades"], "M20.xlsx")
+    os.remove(grade_file)
+    assert daemon.note_changes({grade_file}, time.monotonic()) == (True, True)
+    assert daemon.pending == {}
+
+    daemon.reload_grades()
+    assert {grade["grade"] for grade in daemon.grade_data} == {"M25"}
+
+def test_removed_office_file_is_forgotten(folders, tmp_path):
+    office_file = os.path.join(folders["office"], "office.xlsx")
+    make_grade_workbook(office_file, 1)
+    daemon = make_daemon(folders, str(tmp_path / "out"), process_existing=True)
+    assert daemon.queue == [office_file]
+
+    os.remove(office_file)
+    assert daemon.note_changes({office_file}, time.monotonic()) == (True, False)
+    assert daemon.known_offices == []
+    assert daemon.queue == []
+
+def test_output_files_are_not_inputs(folders, tmp_path):
+    daemon = make_daemon(folders, folders["office"])
+    changed = {os.path.join(folders["office"], name) for name in
+               ["cube_watch_status.json", "cube_watch_status.json.1.tmp", "office_Processed.xlsx",
+                "~$office.xlsx", ".~office_Processed.xlsx.1.tmp"]}
+    assert daemon.note_changes(changed, time.monotonic()) == (False, False)
+    assert daemon.pending == {}
+
+def test_broken_calendar_requeues_nothing(folders, tmp_path):
+    for name in ["a.xlsx", "b.xlsx"]:
+        make_office_workbook(os.path.join(folders["office"], name), 2, ["M20"], 30)
+    messages = []
+    daemon = make_daemon(folders, str(tmp_path / "out"), events=EventLog(sinks=[CallbackSink(messages.append)]))
+    enqueued = []
+    enqueue = daemon.enqueue
+    daemon.enqueue = lambda office_file: (enqueued.append(os.path.basename(office_file)), enqueue(office_file))
+
+    with open(folders["calendar"], "rb") as f:
+        calendar = f.read()
+    thread = threading.Thread(target=daemon.run)
+    thread.start()
+    try:
+        assert wait_for(lambda: daemon.calendar_data is not None)
+        # Half-copied calendar: one failed load, the old calendar kept
+        with open(folders["calendar"], "wb") as f:
+            f.write(calendar[:len(calendar) // 2])
+        assert wait_for(lambda: any("Calendar load error" in m for m in messages))
+        time.sleep(1)
+        assert sum("Calendar load error" in m for m in messages) == 1
+        assert enqueued == []
+        assert daemon.calendar_data is not None
+
+        # Once it loads, every office is re-queued once
+        with open(folders["calendar"], "wb") as f:
+            f.write(calendar)
+        assert wait_for(lambda: len(enqueued) == 2)
+        time.sleep(0.5)
+        assert sorted(enqueued) == ["a.xlsx", "b.xlsx"]
+    finally:
+        daemon.stop()
+        thread.join(10)
+
+def test_calendar_change_settles_first(folders, tmp_path):
+    daemon = make_daemon(folders, str(tmp_path / "out"))
+    assert daemon.reload_calendar(force=True)
+    make_calendar_workbook(folders["calendar"], 40)
+
+    now = time.monotonic()
+    daemon.note_calendar_changes(now)
+    assert daemon.ready_files(now) == []
+    assert daemon.ready_files(now + 0.05) == []
+    assert daemon.ready_files(now + 1) == [os.path.abspath(folders["calendar"])]
+    assert daemon.reload_calendar()
+    assert len(daemon.calendar_data) == 40
+
+    daemon.note_calendar_changes(now + 1)
+    assert daemon.pending == {}
+
+def test_finished_file_records_reach_the_log_files(folders, tmp_path):
+    console, logged = [], []
+    events = EventLog(sinks=[CallbackSink(console.append), logged.append])
+    daemon = make_daemon(folders, str(tmp_path / "out"), events=events)
+    future = Future()
+    future.set_result({"file": "a.xlsx", "ok": True, "rows": 1, "seconds": 0.1,
+                       "log": [{"time": 0, "level": 2, "event": "row_copied", "message": "  ✓ Row 2 → Cube 1"}]})
+    daemon.running[future] = ("a.xlsx", 0)
+    daemon.finish(future)
+    assert [record["event"] for record in logged] == ["row_copied", "file_done"]
+    assert len(console) == 1 and "a.xlsx" in console[0]
+
+def test_same_named_offices_do_not_share_an_output(folders, tmp_path):
+    second = tmp_path / "office2"
+    second.mkdir()
+    first_file = os.path.join(folders["office"], "office.xlsx")
+    second_file = str(second / "office.xlsx")
+    for path in [first_file, second_file]:
+        make_office_workbook(path, 2, ["M20"], 30)
+    messages = []
+    daemon = WatchDaemon([folders["office"], str(second)], [folders["grades"]], folders["calendar"],
+                         str(tmp_path / "out"), events=EventLog(sinks=[CallbackSink(messages.append)]),
+                         process_existing=True)
+    assert daemon.known_offices == [first_file]
+    assert daemon.queue == [first_file]
+    assert any(second_file in message and "skipped" in message for message in messages)
+
+    # Once the first one is gone the other may take its output
+    os.remove(first_file)
+    daemon.note_changes({first_file}, time.monotonic())
+    assert daemon.claim_output(second_file)
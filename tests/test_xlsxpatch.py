@@ -0,0 +1,197 @@
+import re
+import zipfile
+
+import openpyxl
+import pytest
+from openpyxl.styles import Font
+from openpyxl.utils import get_column_letter, range_boundaries
+
+from cube_bench import compare_workbooks, make_dataset
+from cube_core import apply_write_plan, load_workbook_safe, output_path_for, process_combined, save_workbook_atomic
+from cube_xlsxpatch import UnsupportedPatch, patch_workbook
+
+# The patch writer against the openpyxl path on templates shaped like real
+# ones: formulas with cached results and calcPr without fullCalcOnLoad (as
+# Excel saves them),
+# styled target cells, text values and sheets without rows 25/27.
+
+def excel_like(path):
+    with zipfile.ZipFile(path) as zf:
+        parts = {name: zf.read(name) for name in zf.namelist()}
+    for name in parts:
+        if name.startswith("xl/worksheets/"):
+            parts[name] = re.sub(rb"(<f>[^<]*</f>)", rb"\1<v>0</v>", parts[name])
+    parts["xl/workbook.xml"] = re.sub(rb"<calcPr[^>]*/>", b'<calcPr calcId="191029"/>', parts["xl/workbook.xml"])
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in parts.items():
+            zf.writestr(name, data)
+
+@pytest.fixture
+def template(tmp_path):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.title = "Cube 1"
+    ws["B12"] = "M20"
+    ws["A25"] = "Weight (kg)"
+    ws["A27"] = "Strength (N/mm2)"
+    for column in range(3, 9):
+        for row in (25, 27):
+            cell = ws.cell(row=row, column=column)
+            cell.number_format = "0.00"
+            cell.font = Font(bold=True)
+    ws["C18"].number_format = "@"
+    ws["I27"] = "=AVERAGE(C27:H27)"
+
+    bare = wb.create_sheet("Cube 2")
+    bare["B12"] = "M25"
+
+    summary = wb.create_sheet("Summary")
+    summary["A1"] = "='Cube 1'!I27"
+    summary["A2"] = "=SUM('Cube 2'!C25:H25)"
+
+    path = tmp_path / "template.xlsx"
+    wb.save(path)
+    excel_like(path)
+    return path
+
+PLAN = {
+    "Cube 1": {**{(25, c): 8.1 + c / 10 for c in range(3, 9)},
+               **{(27, c): 30 + c for c in range(3, 9)},
+               (18, 3): " 7 Days ", (18, 6): "<A&B>"},
+    "Cube 2": {**{(25, c): 8 for c in range(3, 9)}, (27, 3): "n/a"},
+}
+
+def write_both(template, tmp_path, plan=PLAN):
+    openpyxl_out = tmp_path / "openpyxl.xlsx"
+    office_wb = load_workbook_safe(template)
+    apply_write_plan(office_wb, plan)
+    save_workbook_atomic(office_wb, openpyxl_out)
+    office_wb.close()
+
+    patch_out = tmp_path / "patch.xlsx"
+    patch_workbook(template, patch_out, plan)
+    return openpyxl_out, patch_out
+
+# What Excel shows after the recalculation both outputs ask for, for the
+# formulas used here: SUM/AVERAGE/MIN/MAX of one range or a plain reference
+def recalculate(path):
+    wb = openpyxl.load_workbook(path)
+    results = {}
+
+    def value(sheet_name, coordinate):
+        key = (sheet_name, coordinate)
+        if key not in results:
+            raw = wb[sheet_name][coordinate].value
+            results[key] = evaluate(sheet_name, raw) if isinstance(raw, str) and raw.startswith("=") else raw
+        return results[key]
+
+    def refs(sheet_name, text):
+        if "!" in text:
+            sheet, text = text.rsplit("!", 1)
+            sheet_name = sheet.strip("'")
+        min_col, min_row, max_col, max_row = range_boundaries(text)
+        return [value(sheet_name, f"{get_column_letter(c)}{r}")
+                for r in range(min_row, max_row + 1) for c in range(min_col, max_col + 1)]
+
+    def evaluate(sheet_name, formula):
+        match = re.fullmatch(r"=(SUM|AVERAGE|MIN|MAX)\((.+)\)", formula)
+        if match is None:
+            return refs(sheet_name, formula[1:])[0]
+        numbers = [v for v in refs(sheet_name, match.group(2)) if isinstance(v, (int, float))]
+        if not numbers and match.group(1) != "SUM":
+            return "#DIV/0!" if match.group(1) == "AVERAGE" else 0
+        return {"SUM": sum, "AVERAGE": lambda n: sum(n) / len(n), "MIN": min, "MAX": max}[match.group(1)](numbers)
+
+    return {(ws.title, cell.coordinate): value(ws.title, cell.coordinate)
+            for ws in wb.worksheets for row in ws.iter_rows() for cell in row}
+
+def test_outputs_identical_cell_for_cell(template, tmp_path):
+    openpyxl_out, patch_out = write_both(template, tmp_path)
+    assert compare_workbooks(openpyxl_out, patch_out) == []
+
+def test_values_agree_after_recalculation(template, tmp_path):
+    openpyxl_out, patch_out = write_both(template, tmp_path)
+    values = recalculate(patch_out)
+    assert values == recalculate(openpyxl_out)
+    assert values[("Cube 1", "I27")] == pytest.approx(sum(30 + c for c in range(3, 9)) / 6)
+    assert values[("Summary", "A1")] == values[("Cube 1", "I27")]
+    assert values[("Summary", "A2")] == 48
+
+def test_no_stale_formula_results(template, tmp_path):
+    assert openpyxl.load_workbook(template, data_only=True)["Cube 1"]["I27"].value == 0
+
+    _, patch_out = write_both(template, tmp_path)
+    cached = openpyxl.load_workbook(patch_out, data_only=True)
+    assert cached.calculation.fullCalcOnLoad
+    assert cached["Cube 1"]["I27"].value is None
+    assert cached["Summary"]["A1"].value is None
+
+def rewrite_calc_pr(path, calc_pr):
+    with zipfile.ZipFile(path) as zf:
+        parts = {name: zf.read(name) for name in zf.namelist()}
+    parts["xl/workbook.xml"] = re.sub(rb"<calcPr[^>]*/>", calc_pr, parts["xl/workbook.xml"])
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in parts.items():
+            zf.writestr(name, data)
+
+def calc_pr(path):
+    with zipfile.ZipFile(path) as zf:
+        return re.findall(r"<calcPr[^>]*>", zf.read("xl/workbook.xml").decode("utf-8"))
+
+def test_calc_settings_kept(template, tmp_path):
+    rewrite_calc_pr(template, b'<calcPr calcId="191029" fullCalcOnLoad="0"/>')
+    _, patch_out = write_both(template, tmp_path)
+    assert calc_pr(patch_out) == ['<calcPr calcId="191029" fullCalcOnLoad="1"/>']
+
+def test_missing_calc_pr_added(template, tmp_path):
+    rewrite_calc_pr(template, b"")
+    patch_out = tmp_path / "patch.xlsx"
+    patch_workbook(template, patch_out, PLAN)
+    assert calc_pr(patch_out) == ['<calcPr fullCalcOnLoad="1"/>']
+    assert openpyxl.load_workbook(patch_out).calculation.fullCalcOnLoad
+
+def test_target_styles_kept(template, tmp_path):
+    _, patch_out = write_both(template, tmp_path)
+    ws = openpyxl.load_workbook(patch_out)["Cube 1"]
+    for column in range(3, 9):
+        assert ws.cell(row=25, column=column).number_format == "0.00"
+        assert ws.cell(row=27, column=column).font.b
+    assert ws["C18"].number_format == "@"
+
+def test_text_written_as_inline_strings(template, tmp_path):
+    _, patch_out = write_both(template, tmp_path)
+    ws = openpyxl.load_workbook(patch_out)["Cube 1"]
+    assert ws["C18"].value == " 7 Days "
+    assert ws["F18"].value == "<A&B>"
+    with zipfile.ZipFile(patch_out) as zf:
+        sheet_xml = zf.read("xl/worksheets/sheet1.xml").decode("utf-8")
+    assert '<c r="C18" s="' in sheet_xml and 't="inlineStr"><is><t xml:space="preserve"> 7 Days </t>' in sheet_xml
+    assert "&lt;A&amp;B&gt;" in sheet_xml
+
+def test_missing_rows_created_in_order(template, tmp_path):
+    _, patch_out = write_both(template, tmp_path)
+    ws = openpyxl.load_workbook(patch_out)["Cube 2"]
+    assert [ws.cell(row=25, column=c).value for c in range(3, 9)] == [8] * 6
+    assert ws["C27"].value == "n/a"
+    with zipfile.ZipFile(patch_out) as zf:
+        sheet_xml = zf.read("xl/worksheets/sheet2.xml").decode("utf-8")
+    assert [int(r) for r in re.findall(r'<row r="(\d+)"', sheet_xml)] == [12, 25, 27]
+
+def test_formula_target_refused(template, tmp_path):
+    with pytest.raises(UnsupportedPatch):
+        patch_workbook(template, tmp_path / "out.xlsx", {"Cube 1": {(27, 9): 1.0}})
+    assert not (tmp_path / "out.xlsx").exists()
+    assert list(tmp_path.glob(".~*")) == []
+
+def test_pipeline_writers_agree(tmp_path):
+    dataset = make_dataset(str(tmp_path), 24, 2, 10, 12)
+    outputs = []
+    for writer in ["openpyxl", "patch"]:
+        folder = tmp_path / writer
+        folder.mkdir()
+        rows = process_combined(dataset["grades"], dataset["office"], str(folder), dataset["calendar"], "both",
+                                lambda message: None, writer=writer)
+        assert rows > 0
+        outputs.append(output_path_for(dataset["office"], str(folder)))
+    assert compare_workbooks(*outputs) == []
+    assert recalculate(outputs[0]) == recalculate(outputs[1])